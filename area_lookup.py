@@ -0,0 +1,92 @@
+import bisect
+
+from bs4 import Tag
+
+# ============================================================
+# One-pass index of a location page's areas, shared by the parser scripts.
+# build_area_index walks the page once; find_area_table then looks up any
+# number of areas in it, by <a name> anchor or by paragraph text, without
+# rescanning the page.
+# ============================================================
+
+def build_area_index(soup):
+    """
+    Walks the document once and records every <p> tag together with the next
+    table with class "dextable" that follows it.
+    Each <p> is indexed by the name of its first <a name="..."> anchor and by its
+    stripped, lowercased text, so that parse_area_section can look up any number
+    of areas without rescanning the page.
+    Returns a dict to be passed to find_area_table.
+    """
+    paragraphs = []  # [p_tag, anchor_name, text, table] in document order
+    by_tag = {}      # id(p_tag) -> entry, to resolve anchors to their <p>
+    pending = []     # paragraphs still waiting for their next dextable
+    for tag in soup.descendants:
+        if not isinstance(tag, Tag):
+            continue
+        if tag.name == "p":
+            entry = [tag, None, tag.get_text(strip=True).lower(), None]
+            paragraphs.append(entry)
+            by_tag[id(tag)] = entry
+            pending.append(entry)
+        elif tag.name == "a" and tag.get("name") is not None:
+            # The first named anchor inside a <p> (or any enclosing <p>) names it.
+            for parent in tag.parents:
+                entry = by_tag.get(id(parent))
+                if entry is not None and entry[1] is None:
+                    entry[1] = tag.get("name", "").lower()
+        elif tag.name == "table" and "dextable" in tag.get("class", []):
+            for entry in pending:
+                entry[3] = tag
+            pending = []
+
+    anchors = {}
+    texts = {}
+    for position, (_, anchor_name, text, _) in enumerate(paragraphs):
+        if anchor_name is not None:
+            anchors.setdefault(anchor_name, position)
+        texts.setdefault(text, position)
+
+    # All paragraph texts joined with a separator that never appears in an area
+    # name, so "area name contained in paragraph" becomes a single str.find().
+    offsets = []
+    offset = 0
+    for _, _, text, _ in paragraphs:
+        offsets.append(offset)
+        offset += len(text) + 1
+    return {
+        "paragraphs": paragraphs,
+        "anchors": anchors,
+        "texts": texts,
+        "joined": "\0".join(entry[2] for entry in paragraphs),
+        "offsets": offsets,
+    }
+
+def find_area_table(area_index, area_name):
+    """
+    Looks up an area in an index built by build_area_index.
+    Prefers the first <p> whose anchor name equals area_name, otherwise the first
+    <p> whose text contains (or is contained by) area_name.
+    Returns (p_tag, table): p_tag is None if no <p> matched and table is None if
+    no dextable follows the matched <p>.
+    """
+    paragraphs = area_index["paragraphs"]
+    position = area_index["anchors"].get(area_name)
+    if position is None:
+        candidates = []
+        # Paragraph text contained in the area name (including empty paragraphs).
+        texts = area_index["texts"]
+        for start in range(len(area_name) + 1):
+            for stop in range(start, len(area_name) + 1):
+                hit = texts.get(area_name[start:stop])
+                if hit is not None:
+                    candidates.append(hit)
+        # Area name contained in the paragraph text.
+        found_at = area_index["joined"].find(area_name)
+        if found_at != -1:
+            candidates.append(bisect.bisect_right(area_index["offsets"], found_at) - 1)
+        if not candidates:
+            return None, None
+        position = min(candidates)
+    entry = paragraphs[position]
+    return entry[0], entry[3]
@@ -0,0 +1,357 @@
+import argparse
+import glob
+import json
+import math
+import os
+import pathlib
+import re
+import sys
+from html import escape
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+import build_cache
+
+# ============================================================
+# Content-addressed store for the sprites and type icons saved next to the
+# HTML pages (the "*_files" directories), plus sprite atlases built from it.
+#
+#   assets/objects/ab/abcdef....png   every distinct image once, named by its SHA-256
+#   assets/index.json                 saved file -> digest, asset -> digest, atlases
+#   assets/icon.<hash>.png            all 32x32 Pokemon icons in one image
+#   assets/type.<hash>.png            the 17 type icons in one image
+#   assets/atlas.<hash>.css           one class per icon/type with its offset
+#
+# Assets are named after the serebii URL they were saved from ("icon/396",
+# "type/fire"; "art/133" for the larger swarm pictures, which are stored but
+# not put in an atlas), so "fire(1).gif" and "fire.gif" are the same asset.
+#
+# With an atlas enabled, the parsers' fix_images output has every <img> that
+# has an atlas entry replaced by
+#     <span class="atlas-icon icon-396" data-src="<original URL>"></span>
+# and each page links the atlas stylesheet. Enable it by setting
+# CONQUEST_ATLAS=<index.json> in the environment (inherited by worker
+# processes), calling enable(), or with the location parser's --atlas flag.
+# Each page links the stylesheet by a path relative to the page's own
+# directory (the merges rebase these links, see page_render), which works from
+# disk and through static_server.py; pass --base-url for pages that load the
+# assets from anywhere else.
+#
+#     python asset_store.py build            (Pillow is needed for the atlases)
+#     python asset_store.py build --link     (also hard-link duplicate saved files)
+#     python asset_store.py stats
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(SCRIPT_DIR, "assets")
+INDEX_NAME = "index.json"
+INDEX_VERSION = 2  # 2: base_url is only set when given (otherwise relative to each page).
+ENV_VAR = "CONQUEST_ATLAS"
+# Saved-page image directories: next to the pages in this directory and next
+# to the location pages (where source_fetcher.py saves them).
+SAVED_FILES_GLOBS = ["*_files", os.path.join("shtml's of location", "*_files")]
+IMAGE_EXTENSIONS = (".png", ".gif")
+ATLAS_GROUPS = ["icon", "type"]  # Asset kinds packed into atlases.
+ICON_SIZE = (32, 32)
+
+# Asset kind and name from an image URL (after fix_images has resolved it).
+SRC_PATTERNS = [
+    ("icon", re.compile(r"/conquest/pokemon/icon/(\d+)\.png$", re.IGNORECASE)),
+    ("art", re.compile(r"/conquest/pokemon/(\d+)\.png$", re.IGNORECASE)),
+    ("type", re.compile(r"/type/([a-z]+)\.gif$", re.IGNORECASE)),
+]
+# "fire(1).gif" -> "fire": the browser's suffix for a second copy of a file.
+COPY_SUFFIX_RE = re.compile(r"\(\d+\)$")
+
+def object_path(asset_dir, digest, ext):
+    return os.path.join(asset_dir, "objects", digest[:2], digest + ext)
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def _image_size(path):
+    """
+    Returns (width, height) read from a PNG or GIF header, or None.
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+    if header[:4] == b"GIF8":
+        return int.from_bytes(header[6:8], "little"), int.from_bytes(header[8:10], "little")
+    return None
+
+def asset_name(file_name, size):
+    """
+    Returns the asset ("icon/396", "art/133", "type/fire") a saved image file
+    holds, judged by its name and size, or None for anything else.
+    """
+    stem, ext = os.path.splitext(file_name.lower())
+    stem = COPY_SUFFIX_RE.sub("", stem)
+    if ext == ".gif" and stem.isalpha():
+        return f"type/{stem}"
+    if ext == ".png" and stem.isdigit():
+        return f"{'icon' if size == ICON_SIZE else 'art'}/{stem}"
+    return None
+
+def collect(saved_dirs, asset_dir=ASSET_DIR, link=False):
+    """
+    Stores every image in saved_dirs once under asset_dir/objects. With link,
+    each saved file is replaced by a hard link to its stored copy, so duplicates
+    take no extra space. Returns (files, assets): saved path (relative to
+    SCRIPT_DIR) -> digest, and asset name -> {"digest", "ext", "width", "height"}.
+    """
+    files = {}
+    assets = {}
+    for saved_dir in saved_dirs:
+        for file_name in sorted(os.listdir(saved_dir)):
+            path = os.path.join(saved_dir, file_name)
+            ext = os.path.splitext(file_name)[1].lower()
+            if ext not in IMAGE_EXTENSIONS or not os.path.isfile(path):
+                continue
+            digest = build_cache.file_digest(path)
+            stored = object_path(asset_dir, digest, ext)
+            if not os.path.exists(stored):
+                with open(path, "rb") as f:
+                    _write_atomic(stored, f.read())
+            if link and not os.path.samefile(path, stored):
+                temp_path = path + ".tmp"
+                os.link(stored, temp_path)
+                os.replace(temp_path, path)
+            files[os.path.relpath(path, SCRIPT_DIR)] = digest
+            size = _image_size(stored)
+            name = asset_name(file_name, size)
+            if name and size:
+                assets.setdefault(name, {"digest": digest, "ext": ext, "width": size[0], "height": size[1]})
+    return files, assets
+
+def pack(sizes):
+    """
+    Shelf-packs rectangles, tallest first, into a roughly square sheet.
+    sizes is {name: (width, height)}; returns ({name: (x, y)}, (width, height)).
+    """
+    if not sizes:
+        return {}, (0, 0)
+    sheet_width = max(max(w for w, _ in sizes.values()),
+                      math.ceil(math.sqrt(sum(w * h for w, h in sizes.values()))))
+    positions = {}
+    x = y = shelf_height = used_width = 0
+    for name in sorted(sizes, key=lambda n: (-sizes[n][1], -sizes[n][0], n)):
+        width, height = sizes[name]
+        if x + width > sheet_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[name] = (x, y)
+        x += width
+        used_width = max(used_width, x)
+        shelf_height = max(shelf_height, height)
+    return positions, (used_width, y + shelf_height)
+
+def build_atlases(assets, asset_dir=ASSET_DIR):
+    """
+    Writes one atlas image per ATLAS_GROUPS kind and the stylesheet for them.
+    Returns (atlases, css file name): atlases is {kind: {"image", "sprites":
+    {name: [x, y, width, height]}}}.
+    """
+    atlases = {}
+    rules = []
+    for kind in ATLAS_GROUPS:
+        members = {name.split("/", 1)[1]: asset for name, asset in assets.items() if name.startswith(kind + "/")}
+        if not members:
+            continue
+        positions, sheet_size = pack({name: (a["width"], a["height"]) for name, a in members.items()})
+        sheet = Image.new("RGBA", sheet_size, (0, 0, 0, 0))
+        for name, asset in members.items():
+            with Image.open(object_path(asset_dir, asset["digest"], asset["ext"])) as image:
+                sheet.paste(image.convert("RGBA"), positions[name])
+        temp_path = os.path.join(asset_dir, f"{kind}.png.tmp")
+        sheet.save(temp_path, format="PNG", optimize=True)
+        image_name = f"{kind}.{build_cache.file_digest(temp_path)[:12]}.png"
+        os.replace(temp_path, os.path.join(asset_dir, image_name))
+
+        sprites = {}
+        rules.append(f".atlas-{kind} {{ display: inline-block; vertical-align: middle; "
+                     f"background: url({image_name}) no-repeat; }}")
+        for name in sorted(members):
+            x, y = positions[name]
+            width, height = members[name]["width"], members[name]["height"]
+            sprites[name] = [x, y, width, height]
+            rules.append(f".{kind}-{name} {{ width: {width}px; height: {height}px; "
+                         f"background-position: {-x}px {-y}px; }}")
+        atlases[kind] = {"image": image_name, "sprites": sprites}
+
+    css = ("\n".join(rules) + "\n").encode("utf-8")
+    css_name = f"atlas.{build_cache.bytes_digest(css)[:12]}.css"
+    _write_atomic(os.path.join(asset_dir, css_name), css)
+
+    # Drop the atlases and stylesheets of earlier builds.
+    current = {css_name} | {atlas["image"] for atlas in atlases.values()}
+    for pattern in [f"{kind}.*.png" for kind in ATLAS_GROUPS] + ["atlas.*.css"]:
+        for path in glob.glob(os.path.join(asset_dir, pattern)):
+            if os.path.basename(path) not in current:
+                os.remove(path)
+    return atlases, css_name
+
+def relative_url(asset_dir, page_path):
+    """
+    The asset directory as a URL relative to the page at page_path, so it
+    works both from disk and through static_server.py. Falls back to the
+    directory's file:// URL if there is no relative path (another drive).
+    """
+    page_dir = os.path.dirname(os.path.abspath(page_path))
+    try:
+        relative = os.path.relpath(os.path.abspath(asset_dir), page_dir)
+    except ValueError:
+        return pathlib.Path(os.path.abspath(asset_dir)).as_uri() + "/"
+    return pathlib.PurePath(relative).as_posix() + "/"
+
+def build(saved_dirs=None, asset_dir=ASSET_DIR, link=False, base_url=None):
+    """
+    Collects the saved images into the store, builds the atlases (if Pillow is
+    installed) and writes the index. base_url is where pages find the assets
+    (default: relative to each page, see relative_url). Returns the index.
+    """
+    if saved_dirs is None:
+        saved_dirs = sorted(d for pattern in SAVED_FILES_GLOBS for d in glob.glob(os.path.join(SCRIPT_DIR, pattern))
+                            if os.path.isdir(d))
+    files, assets = collect(saved_dirs, asset_dir, link)
+    atlases, css_name = build_atlases(assets, asset_dir) if Image else ({}, None)
+    index = {
+        "version": INDEX_VERSION,
+        "base_url": base_url,
+        "files": files,
+        "assets": assets,
+        "atlases": atlases,
+        "stylesheet": css_name,
+    }
+    _write_atomic(os.path.join(asset_dir, INDEX_NAME),
+                  json.dumps(index, indent=1, sort_keys=True).encode("utf-8"))
+    return index
+
+def stats(index, asset_dir=ASSET_DIR):
+    """
+    Returns (saved files, their total bytes, distinct images, their total bytes).
+    """
+    digests = {}
+    saved_bytes = 0
+    for path, digest in index["files"].items():
+        full_path = os.path.join(SCRIPT_DIR, path)
+        size = os.path.getsize(full_path) if os.path.exists(full_path) else 0
+        saved_bytes += size
+        digests[digest] = size
+    return len(index["files"]), saved_bytes, len(digests), sum(digests.values())
+
+class Atlas:
+    """
+    Atlas lookups for one index: which span replaces an image URL.
+    """
+
+    def __init__(self, index, asset_dir=ASSET_DIR):
+        # Version 1 indexes always stored the directory's file:// URL.
+        self.base_url = index.get("base_url") if index.get("version", 1) >= 2 else None
+        self.asset_dir = asset_dir
+        self.stylesheet = index.get("stylesheet")
+        self.sprites = {}
+        for kind, atlas in index.get("atlases", {}).items():
+            for name, (_, _, width, height) in atlas["sprites"].items():
+                self.sprites[(kind, name)] = {"classes": f"atlas-{kind} {kind}-{name}", "width": width, "height": height}
+
+    def lookup(self, src):
+        """
+        Returns {"classes", "width", "height"} for an image URL, or None if it
+        is not in an atlas.
+        """
+        for kind, pattern in SRC_PATTERNS:
+            match = pattern.search(src)
+            if match:
+                return self.sprites.get((kind, match.group(1).lower()))
+        return None
+
+    def stylesheet_url(self, page_path):
+        """
+        The stylesheet's URL as linked from the page written to page_path.
+        """
+        if not self.stylesheet:
+            return None
+        return (self.base_url or relative_url(self.asset_dir, page_path)) + self.stylesheet
+
+_loaded = {}  # index path -> (mtime, Atlas)
+
+def enable(index_path=os.path.join(ASSET_DIR, INDEX_NAME)):
+    """
+    Turns the atlas on for this process and any worker processes it starts.
+    """
+    if not os.path.isfile(index_path):
+        raise FileNotFoundError(f"Asset index not found: {index_path} (run 'python asset_store.py build')")
+    os.environ[ENV_VAR] = os.path.abspath(index_path)
+
+def active_atlas():
+    """
+    Returns the Atlas named by CONQUEST_ATLAS, or None if the atlas is off.
+    """
+    index_path = os.environ.get(ENV_VAR)
+    if not index_path:
+        return None
+    mtime = os.path.getmtime(index_path)
+    cached = _loaded.get(index_path)
+    if cached is None or cached[0] != mtime:
+        with open(index_path, "r", encoding="utf-8") as f:
+            cached = (mtime, Atlas(json.load(f), os.path.dirname(index_path)))
+        _loaded[index_path] = cached
+    return cached[1]
+
+def fingerprint():
+    """
+    The active atlas index and its digest (None if the atlas is off), for build
+    fingerprints: pages link the stylesheet relative to the index's directory.
+    """
+    index_path = os.environ.get(ENV_VAR)
+    return [index_path, build_cache.file_digest(index_path)] if index_path else None
+
+def stylesheet_link(page_path):
+    """
+    Returns the <link> to the atlas stylesheet for the <head> of the page
+    written to page_path (on its own line), or "" if the atlas is off.
+    """
+    atlas = active_atlas()
+    url = atlas.stylesheet_url(page_path) if atlas else None
+    return f'\n  <link rel="stylesheet" href="{escape(url)}">' if url else ""
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Deduplicate the saved images and build sprite atlases.")
+    arg_parser.add_argument("--assets", default=ASSET_DIR, help="asset directory (default: %(default)s)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="store the images from the *_files directories and build the atlases")
+    build_parser.add_argument("dirs", nargs="*", help="directories to collect (default: every *_files directory)")
+    build_parser.add_argument("--link", action="store_true",
+                              help="replace each saved image with a hard link to its stored copy")
+    build_parser.add_argument("--base-url", help="URL the pages load the assets from "
+                                                 "(default: the asset directory relative to each page)")
+    commands.add_parser("stats", help="show how much the store saves")
+    args = arg_parser.parse_args(argv)
+
+    index_path = os.path.join(args.assets, INDEX_NAME)
+    if args.command == "build":
+        index = build(args.dirs or None, args.assets, args.link, args.base_url)
+        if Image is None:
+            print("[WARNING] Pillow is not installed, so no atlases were built (pip install Pillow)")
+        for kind, atlas in index["atlases"].items():
+            print(f"[INFO] {kind} atlas: {len(atlas['sprites'])} image(s) in {atlas['image']}")
+    elif not os.path.isfile(index_path):
+        print(f"[ERROR] Asset index not found: {index_path}")
+        return 1
+    else:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    files, saved_bytes, distinct, distinct_bytes = stats(index, args.assets)
+    print(f"[INFO] {files} saved image(s), {saved_bytes / 1024:.0f} KB -> {distinct} distinct, "
+          f"{distinct_bytes / 1024:.0f} KB; {len(index['assets'])} named asset(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
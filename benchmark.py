@@ -0,0 +1,300 @@
+import argparse
+import contextlib
+import copy
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import encoding_detect
+import html_backends
+import pokemon_store
+from script_loader import LOCATION_MERGER, LOCATION_PARSER, SCRIPT_DIR, SWARM_PARSER, load_script
+
+# ============================================================
+# Per-stage benchmark over the serebii pages bundled with the repo:
+# every location page in "shtml's of location" plus swarms.shtml.
+#
+# Each page is run through the same functions the scripts use, and every stage
+# is timed on its own:
+#   read, encoding, parse, areas (area discovery / table lookup),
+#   extract (extract_table_data, which includes its fix_images calls),
+#   fix_images (the same cells again, on their own), build_table (HTML rendering),
+#   write, and merge (the location merger over all written pages).
+#
+# --scale tiles every page's table rows N times (e.g. --scale 1 10 100) to see
+# how each stage grows with page size. Results are written as JSON; with
+# --baseline the run fails (exit code 1) if any stage got slower than the
+# baseline by more than --threshold.
+#     python benchmark.py --scale 1 10 --output bench.json
+#     python benchmark.py --baseline bench.json
+# ============================================================
+RESULTS_VERSION = 1
+LOCATION_INPUT_DIR = os.path.join(SCRIPT_DIR, "shtml's of location")
+SWARM_INPUT_FILE = os.path.join(SCRIPT_DIR, "swarms.shtml")
+DEFAULT_OUTPUT = os.path.join(SCRIPT_DIR, "benchmark_results.json")
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25  # 25% slower than the baseline counts as a regression.
+MIN_REGRESSION_SECONDS = 0.005  # Ignore differences smaller than this; they are noise.
+
+# Tables whose data rows are repeated by tile_page().
+TILED_TABLE_CLASSES = ["dextable", "tab"]
+
+def tile_page(raw_data, factor):
+    """
+    Returns a copy of the page (bytes) in which every data row of each
+    dextable / swarm table is repeated factor times, so that the page keeps its
+    structure (title, area anchors, tables) but is roughly factor times larger.
+    """
+    if factor <= 1:
+        return raw_data
+    encoding, _ = encoding_detect.detect_encoding(raw_data)
+    soup = html_backends.make_soup(raw_data.decode(encoding, errors="replace"), backend=html_backends.DEFAULT_BACKEND)
+    for table in soup.find_all("table", class_=TILED_TABLE_CLASSES):
+        data_rows = table.find_all("tr", recursive=False)[1:]
+        for _ in range(factor - 1):
+            for tr in data_rows:
+                table.append(copy.copy(tr))
+    return str(soup).encode(encoding, errors="xmlcharrefreplace")
+
+class StageTimer:
+    """
+    Adds up wall-clock time per stage name across any number of pages.
+    """
+
+    def __init__(self):
+        self.totals = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] = self.totals.get(name, 0.0) + time.perf_counter() - start
+
+def _read_and_decode(timer, input_file):
+    with timer.stage("read"):
+        with open(input_file, "rb") as f:
+            raw_data = f.read()
+    with timer.stage("encoding"):
+        # Drop chardet results remembered from earlier runs so every run detects afresh.
+        encoding_detect._memory_cache.clear()
+        encoding, _ = encoding_detect.detect_encoding(raw_data)
+    with timer.stage("parse"):
+        soup = html_backends.make_soup(raw_data.decode(encoding, errors="replace"))
+    return soup
+
+def run_locations(timer, input_files, work_dir):
+    """
+    One pass over the location pages; writes each page's tables into work_dir
+    and finally merges them.
+    """
+    parser = load_script(LOCATION_PARSER)
+    merger = load_script(LOCATION_MERGER)
+    page_dir = os.path.join(work_dir, "pages")
+    os.makedirs(page_dir, exist_ok=True)
+    for input_file in input_files:
+        soup = _read_and_decode(timer, input_file)
+
+        with timer.stage("areas"):
+            area_names = parser.get_area_names_from_anchors(soup) or parser.get_area_names_from_anctab(soup)
+            area_index = parser.build_area_index(soup)
+            tables = [(area, parser.find_area_table(area_index, area)[1]) for area in area_names]
+
+        with timer.stage("extract"):
+            areas = [(area, parser.extract_table_data(table)[1]) for area, table in tables if table]
+
+        with timer.stage("fix_images"):
+            for _, table in tables:
+                if not table:
+                    continue
+                for tr in table.find_all("tr", recursive=False)[1:]:
+                    cells = [child for child in tr.children if getattr(child, "name", None) == "td"]
+                    if len(cells) >= 10:
+                        parser.fix_images(cells[1])
+                        parser.fix_images(cells[3])
+
+        with timer.stage("build_table"):
+            sections = [
+                parser.render_area_section(area, pokemon_store.AREA_OK, parser.TABLE_HEADERS, rows)
+                for area, rows in areas
+            ]
+            page_html = "<html><body>" + "".join(sections) + "</body></html>"
+
+        with timer.stage("write"):
+            output_file = os.path.join(page_dir, os.path.basename(input_file) + ".html")
+            with open(output_file, "w", encoding="utf-8") as out:
+                out.write(page_html)
+
+    with timer.stage("merge"):
+        merger.merge_html_files(page_dir, os.path.join(work_dir, "merged.html"))
+
+def run_swarm(timer, input_file, work_dir):
+    """
+    One pass over the swarm page.
+    """
+    swarm = load_script(SWARM_PARSER)
+    soup = _read_and_decode(timer, input_file)
+
+    with timer.stage("areas"):
+        table = soup.find("table", class_="tab")
+    if not table:
+        return
+
+    with timer.stage("extract"):
+        headers, rows = swarm.extract_swarm_table_data(table)
+
+    with timer.stage("fix_images"):
+        for tr in table.find_all("tr", recursive=False)[1:]:
+            cells = [child for child in tr.children if getattr(child, "name", None) == "td"]
+            if len(cells) >= 12:
+                swarm.fix_images(cells[1], base_path=swarm.HTML_BASE_PATH, max_width=50)
+                swarm.fix_images(cells[3], base_path=swarm.HTML_BASE_PATH)
+                swarm.fix_images(cells[11], base_path=swarm.HTML_BASE_PATH, strip_links=True)
+
+    with timer.stage("build_table"):
+        table_html = swarm.build_table_html(headers, rows)
+
+    with timer.stage("write"):
+        with open(os.path.join(work_dir, "swarm_pokemon.html"), "w", encoding="utf-8") as out:
+            out.write(table_html)
+
+def _summarize(samples):
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": samples,
+    }
+
+def run_benchmark(scales=(1,), repeat=DEFAULT_REPEAT, input_dir=LOCATION_INPUT_DIR, swarm_file=SWARM_INPUT_FILE):
+    """
+    Benchmarks the location pages and the swarm page at each scale factor.
+    Returns the results dict that is written to the output file; its
+    "stages" maps "<suite>/x<scale>/<stage>" to median/min/max/runs seconds.
+    """
+    location_files = sorted(glob.glob(os.path.join(input_dir, "*.shtml")))
+    stages = {}
+    sizes = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for scale in scales:
+            # Tile the fixtures once per scale, outside the timed runs.
+            fixture_dir = os.path.join(temp_dir, f"fixtures_x{scale}")
+            os.makedirs(fixture_dir)
+            fixtures = {"location": [], "swarm": []}
+            suites = [("location", f) for f in location_files]
+            if os.path.isfile(swarm_file):
+                suites.append(("swarm", swarm_file))
+            for suite, input_file in suites:
+                tiled_file = os.path.join(fixture_dir, os.path.basename(input_file))
+                with open(input_file, "rb") as f:
+                    tiled = tile_page(f.read(), scale)
+                with open(tiled_file, "wb") as f:
+                    f.write(tiled)
+                fixtures[suite].append(tiled_file)
+                sizes[f"{suite}/x{scale}"] = sizes.get(f"{suite}/x{scale}", 0) + len(tiled)
+
+            for suite, files in fixtures.items():
+                if not files:
+                    continue
+                samples = {}
+                for run in range(repeat):
+                    work_dir = os.path.join(temp_dir, f"{suite}_x{scale}_{run}")
+                    os.makedirs(work_dir)
+                    timer = StageTimer()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        if suite == "location":
+                            run_locations(timer, files, work_dir)
+                        else:
+                            run_swarm(timer, files[0], work_dir)
+                    timer.totals["total"] = sum(timer.totals.values())
+                    for name, seconds in timer.totals.items():
+                        samples.setdefault(name, []).append(seconds)
+                for name, runs in samples.items():
+                    stages[f"{suite}/x{scale}/{name}"] = _summarize(runs)
+                print(f"[INFO] {suite} x{scale}: {len(files)} page(s), "
+                      f"{sizes[f'{suite}/x{scale}'] / 1e6:.1f} MB, "
+                      f"{stages[f'{suite}/x{scale}/total']['median']:.3f}s per run")
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parser": html_backends.current_backend(),
+        "repeat": repeat,
+        "scales": list(scales),
+        "input_bytes": sizes,
+        "stages": stages,
+    }
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD, min_seconds=MIN_REGRESSION_SECONDS):
+    """
+    Compares median stage times with a baseline results dict.
+    Returns a list of (stage, baseline seconds, current seconds) for every stage
+    present in both that got slower by more than threshold (a fraction) and by
+    at least min_seconds.
+    """
+    regressions = []
+    for name, current in sorted(results["stages"].items()):
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            continue
+        before, after = previous["median"], current["median"]
+        if after - before >= min_seconds and after > before * (1 + threshold):
+            regressions.append((name, before, after))
+    return regressions
+
+def print_table(results, baseline=None):
+    for name, current in sorted(results["stages"].items()):
+        line = f"{name:<32} {current['median'] * 1000:10.1f} ms"
+        previous = (baseline or {}).get("stages", {}).get(name)
+        if previous and previous["median"] > 0:
+            change = current["median"] / previous["median"] - 1
+            line += f"   {change:+7.1%} vs baseline"
+        print(line)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Time each parser stage over the bundled serebii pages.")
+    arg_parser.add_argument("--scale", type=int, nargs="+", default=[1],
+                            help="tile every page's table rows by these factors (default: 1)")
+    arg_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                            help=f"runs per scale; the median is reported (default: {DEFAULT_REPEAT})")
+    arg_parser.add_argument("--parser", choices=sorted(html_backends.BACKENDS), default=html_backends.current_backend(),
+                            help="HTML parser backend for whole pages (default: %(default)s)")
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON results file (default: %(default)s)")
+    arg_parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="allowed slowdown vs the baseline as a fraction (default: %(default)s)")
+    args = arg_parser.parse_args(argv)
+    html_backends.set_backend(args.parser)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_benchmark(args.scale, max(1, args.repeat))
+    print_table(results, baseline)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"[INFO] Results written to {args.output}")
+
+    if baseline is None:
+        return 0
+    regressions = find_regressions(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(f"[FAIL] {name}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+    if regressions:
+        return 1
+    print(f"[OK] No stage more than {args.threshold:.0%} slower than {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
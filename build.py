@@ -0,0 +1,373 @@
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import asset_store
+import build_cache
+import html_backends
+import output_optimizer
+import row_diff
+import static_server
+from script_loader import FINAL_MERGER, LOCATION_MERGER, LOCATION_PARSER, SCRIPT_DIR, SWARM_PARSER, load_script
+
+# ============================================================
+# One entry point for the whole pipeline:
+#
+#   locations  "shtml's of location"/  -> conquest_locations/*.html   (§ multi_conquest_parse.py)
+#   swarm      swarms.shtml            -> swarm_pokemon.html          (§ swarm parse.py)
+#   merge      conquest_locations/     -> merged.html                 (§ merger.py)
+#   final      merged.html + swarm_pokemon.html -> all_pokemon.html   (last merge.py)
+#   xref       the store's location + swarm rows -> conquest_xref.json (cross_reference.py)
+#
+# Every stage declares its input and output files. A stage runs only if the
+# SHA-256 of one of its inputs, of its script (or a repo module the script
+# imports), or of its config (parser backend, atlas, optimized output) changed since it last
+# succeeded, or if one of its outputs is missing or was modified; otherwise
+# it is skipped. Outputs are compared by content, so a stage that re-ran but
+# wrote the same bytes does not trigger the stages after it. The final stage
+# also reports which areas' rows changed since the previous build (row_diff.py).
+#
+# Stages whose dependencies are done run at the same time in separate
+# processes (locations and swarm in parallel); at the end the run reports each
+# stage's time and the critical path, the chain of stages that set the wall time.
+#     python build.py                 # build everything that is out of date
+#     python build.py merge --force   # rebuild merge and what it depends on
+#     python build.py --optimize      # shared CSS/JS, minified (see output_optimizer.py)
+# Paths are all under --root (default: this directory), so the EDITABLE paths
+# at the top of each script do not matter here.
+# ============================================================
+CROSS_REFERENCE = "cross_reference.py"
+STATE_NAME = ".build_state.json"
+STATE_VERSION = 1
+
+# script is one of the script_loader names; inputs/outputs map the paths of
+# the build (see build_paths) to the files read / written. state_files are
+# written too, but not compared by content (only required to exist).
+Stage = collections.namedtuple("Stage", "name deps script inputs outputs state_files")
+
+def build_paths(root):
+    root = os.path.abspath(root)
+    return {
+        "root": root,
+        "location_pages": os.path.join(root, "shtml's of location"),
+        "swarm_page": os.path.join(root, "swarms.shtml"),
+        "locations": os.path.join(root, "conquest_locations"),
+        "swarm": os.path.join(root, "swarm_pokemon.html"),
+        "merged": os.path.join(root, "merged.html"),
+        "final": os.path.join(root, "all_pokemon.html"),
+        "store": os.path.join(root, "conquest_pokemon.sqlite"),
+        "xref": os.path.join(root, "conquest_xref.json"),
+    }
+
+def _page_outputs(page, directory=None):
+    """
+    A page (or every page in directory) with the shared files written next to
+    it in optimized mode.
+    """
+    pages = [page] if directory is None else _list_files(directory, ".html")
+    if not output_optimizer.enabled():
+        return pages
+    return pages + output_optimizer.shared_assets(directory or os.path.dirname(page))
+
+def _list_files(directory, extensions):
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, file_name)
+        for file_name in sorted(os.listdir(directory))
+        if file_name.lower().endswith(extensions)
+    ]
+
+STAGES = [
+    Stage("locations", [], LOCATION_PARSER,
+          lambda paths: _list_files(paths["location_pages"], (".shtml", ".html")),
+          lambda paths: _page_outputs(None, paths["locations"]),
+          lambda paths: [paths["store"]]),
+    Stage("swarm", [], SWARM_PARSER,
+          lambda paths: [paths["swarm_page"]],
+          lambda paths: _page_outputs(paths["swarm"]),
+          lambda paths: [paths["store"]]),
+    Stage("merge", ["locations"], LOCATION_MERGER,
+          lambda paths: _list_files(paths["locations"], ".html"),
+          lambda paths: _page_outputs(paths["merged"]),
+          lambda paths: []),
+    Stage("final", ["merge", "swarm"], FINAL_MERGER,
+          lambda paths: [paths["merged"], paths["swarm"]],
+          lambda paths: _page_outputs(paths["final"]),
+          lambda paths: []),
+    # The rows come from the store; the pages rendered from it stand in for it as inputs.
+    Stage("xref", ["locations", "swarm"], CROSS_REFERENCE,
+          lambda paths: _list_files(paths["locations"], ".html") + [paths["swarm"]],
+          lambda paths: [paths["xref"]],
+          lambda paths: [paths["store"]]),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+def run_locations(paths, jobs, force):
+    parser = load_script(LOCATION_PARSER)
+    parser.INPUT_DIR = paths["location_pages"]
+    parser.OUTPUT_DIR = paths["locations"]
+    parser.STORE_FILE = paths["store"]
+    return parser.main(["--jobs", str(jobs)] + (["--force"] if force else [])) == 0
+
+def run_swarm(paths, jobs, force):
+    parser = load_script(SWARM_PARSER)
+    parser.HTML_INPUT_FILE = paths["swarm_page"]
+    parser.OUTPUT_FILE = paths["swarm"]
+    parser.STORE_FILE = paths["store"]
+    parser.FORCE_REBUILD = force
+    return parser.main() is not None
+
+def run_merge(paths, jobs, force):
+    load_script(LOCATION_MERGER).merge_html_files(paths["locations"], paths["merged"])
+    return True
+
+def run_final(paths, jobs, force):
+    previous = row_diff.load_index(paths["final"]) if os.path.isfile(paths["final"]) else None
+    load_script(FINAL_MERGER).merge_html_files([paths["merged"], paths["swarm"]], paths["final"])
+    # Compressed copies for static_server.py, as the last merge script does.
+    static_server.precompress_file(paths["final"])
+    if previous is not None:
+        report = row_diff.diff_indexes(previous, row_diff.load_index(paths["final"]))
+        counts = report["counts"]
+        print(f"[INFO] Rows since the last build: {counts['added']} added, {counts['removed']} removed, "
+              f"{counts['changed']} changed"
+              + (f"; areas: {', '.join(report['changed_areas'])}" if report["changed_areas"] else ""))
+    return True
+
+def run_xref(paths, jobs, force):
+    xref = load_script(CROSS_REFERENCE).write_xref(paths["store"], paths["xref"])
+    print(f"[INFO] {len(xref['pokemon'])} Pokémon in {len(xref['areas'])} areas -> {paths['xref']}")
+    return True
+
+RUNNERS = {"locations": run_locations, "swarm": run_swarm, "merge": run_merge, "final": run_final,
+           "xref": run_xref}
+
+def run_stage_job(name, paths, jobs, force):
+    """
+    Runs one stage in a worker and collects everything it printed. Returns a
+    dict with the captured log, whether the stage succeeded, the error
+    traceback (or None) and the wall seconds it took.
+    """
+    log = io.StringIO()
+    start = time.perf_counter()
+    ok = False
+    error = None
+    with contextlib.redirect_stdout(log):
+        try:
+            ok = RUNNERS[name](paths, jobs, force)
+        except Exception:
+            error = traceback.format_exc()
+    return {"log": log.getvalue(), "ok": ok and error is None, "error": error,
+            "seconds": time.perf_counter() - start}
+
+def code_files(script):
+    """
+    Returns the script's path plus those of every repo module it imports,
+    directly or through other repo modules.
+    """
+    return build_cache.module_files(load_script(script))
+
+def _digests(files, root):
+    return {os.path.relpath(path, root): build_cache.file_digest(path) for path in files}
+
+def stage_key(stage, paths):
+    """
+    Everything a stage's result depends on: its input files, its code and the
+    settings inherited from the environment. Missing inputs digest as None.
+    """
+    return {
+        "inputs": _digests(stage.inputs(paths), paths["root"]),
+        "code": _digests(code_files(stage.script), SCRIPT_DIR),
+        "config": {"parser": html_backends.current_backend(), "atlas": asset_store.fingerprint(),
+                   "optimize": output_optimizer.fingerprint()},
+    }
+
+def is_up_to_date(entry, key, paths, stage):
+    """
+    True if the stage last succeeded with the same key and its outputs are
+    still exactly what it wrote.
+    """
+    if not entry or entry.get("key") != key or not entry.get("outputs"):
+        return False
+    root = paths["root"]
+    if any(build_cache.file_digest(os.path.join(root, rel)) != digest for rel, digest in entry["outputs"].items()):
+        return False
+    return all(os.path.exists(path) for path in stage.state_files(paths))
+
+def load_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return {}
+    return state.get("stages", {})
+
+def save_stage(state_path, name, entry):
+    """
+    Records (or, with entry None, forgets) one stage's last successful run.
+    """
+    def update(state):
+        if state.get("version") != STATE_VERSION:
+            state = {"version": STATE_VERSION, "stages": {}}
+        stages = state.setdefault("stages", {})
+        if entry is None:
+            stages.pop(name, None)
+        else:
+            stages[name] = entry
+        return state
+
+    build_cache.update_json(state_path, update)
+
+def with_dependencies(targets):
+    """
+    Returns the stage names needed to build targets, in pipeline order.
+    """
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(STAGES_BY_NAME[name].deps)
+    return [stage.name for stage in STAGES if stage.name in needed]
+
+def critical_path(results):
+    """
+    Returns the chain of stages, each a dependency of the next, whose summed
+    run times are the largest: the part of the build that set its wall time.
+    """
+    finish = {}
+    previous = {}
+    for name in results:
+        deps = [dep for dep in STAGES_BY_NAME[name].deps if dep in finish]
+        slowest = max(deps, key=finish.get, default=None)
+        previous[name] = slowest
+        finish[name] = results[name]["seconds"] + (finish[slowest] if slowest else 0.0)
+    name = max(finish, key=finish.get, default=None)
+    path = []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return path[::-1]
+
+def build(paths, targets=None, jobs=None, force=False):
+    """
+    Runs the out-of-date stages of targets (default: every stage) and their
+    dependencies. Returns {stage: result} in pipeline order; each result has a
+    status ("built", "up to date", "failed" or "skipped") and the seconds it took.
+    """
+    names = with_dependencies(targets or [stage.name for stage in STAGES])
+    jobs = jobs or load_script(LOCATION_PARSER).JOBS
+    state_path = os.path.join(paths["root"], STATE_NAME)
+    state = load_state(state_path)
+    results = {}
+    pending = list(names)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=len(names)) as executor:
+        while pending or running:
+            # Start (or settle) every stage whose dependencies are all finished.
+            for name in list(pending):
+                stage = STAGES_BY_NAME[name]
+                if any(dep in pending or dep in running.values() for dep in stage.deps):
+                    continue
+                pending.remove(name)
+                failed_deps = [dep for dep in stage.deps if results[dep]["status"] in ("failed", "skipped")]
+                if failed_deps:
+                    print(f"[ERROR] {name}: not run because {', '.join(failed_deps)} did not build")
+                    results[name] = {"status": "skipped", "seconds": 0.0}
+                    continue
+                key = stage_key(stage, paths)
+                missing = [rel for rel, digest in key["inputs"].items() if digest is None]
+                if missing or not key["inputs"]:
+                    print(f"[ERROR] {name}: missing input(s): {', '.join(missing) or 'no input files found'}")
+                    results[name] = {"status": "failed", "seconds": 0.0}
+                    continue
+                if not force and is_up_to_date(state.get(name), key, paths, stage):
+                    print(f"[INFO] {name}: up to date")
+                    results[name] = {"status": "up to date", "seconds": 0.0}
+                    continue
+                print(f"[INFO] {name}: building")
+                future = executor.submit(run_stage_job, name, paths, jobs, force)
+                running[future] = name
+                results[name] = {"status": "running", "key": key}
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                stage = STAGES_BY_NAME[name]
+                result = future.result()
+                print(f"--- {name} ({result['seconds']:.2f}s)")
+                print(result["log"], end="")
+                key = results[name]["key"]
+                if result["ok"]:
+                    outputs = _digests(stage.outputs(paths), paths["root"])
+                    entry = {"key": key, "outputs": outputs, "seconds": round(result["seconds"], 3)}
+                    save_stage(state_path, name, entry)
+                    state[name] = entry
+                    results[name] = {"status": "built", "seconds": result["seconds"]}
+                else:
+                    if result["error"]:
+                        print(result["error"], end="")
+                    print(f"[ERROR] {name} failed")
+                    save_stage(state_path, name, None)
+                    state.pop(name, None)
+                    results[name] = {"status": "failed", "seconds": result["seconds"]}
+
+    return {name: results[name] for name in names}
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Build the Conquest pages: parse, merge and final merge.")
+    arg_parser.add_argument("targets", nargs="*", metavar="STAGE",
+                            help=f"stages to build, with their dependencies (default: all of "
+                                 f"{', '.join(stage.name for stage in STAGES)})")
+    arg_parser.add_argument("--root", default=SCRIPT_DIR,
+                            help="directory holding the input pages and receiving the outputs (default: %(default)s)")
+    arg_parser.add_argument("-j", "--jobs", type=int,
+                            help="worker processes for the location parser (default: its JOBS)")
+    arg_parser.add_argument("-f", "--force", action="store_true",
+                            help="run every selected stage (and rebuild every page) even if up to date")
+    arg_parser.add_argument("--optimize", action="store_true",
+                            help="write size-optimized pages and merges with shared CSS/JS (see output_optimizer.py)")
+    args = arg_parser.parse_args(argv)
+    unknown = [name for name in args.targets if name not in STAGES_BY_NAME]
+    if unknown:
+        arg_parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    if args.optimize:
+        output_optimizer.enable()
+
+    wall_start = time.perf_counter()
+    results = build(build_paths(args.root), args.targets, args.jobs and max(1, args.jobs), args.force)
+    wall_time = time.perf_counter() - wall_start
+
+    print("Stages:")
+    for name, result in results.items():
+        print(f"  {name:<10} {result['status']:<11} {result['seconds']:.2f}s")
+    path = critical_path({name: result for name, result in results.items() if result["status"] == "built"})
+    if path:
+        print("Critical path: "
+              + " -> ".join(f"{name} ({results[name]['seconds']:.2f}s)" for name in path)
+              + f" = {sum(results[name]['seconds'] for name in path):.2f}s of {wall_time:.2f}s wall")
+    unfinished = [f"{name} {result['status']}" for name, result in results.items()
+                  if result["status"] in ("failed", "skipped")]
+    if unfinished:
+        print(f"[ERROR] Build incomplete ({wall_time:.2f}s): {', '.join(unfinished)}")
+        return 1
+    if not path:
+        print(f"Nothing to build ({wall_time:.2f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
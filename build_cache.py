@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import types
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ============================================================
+# Content-hash build manifest shared by the parser scripts.
+# Each output directory keeps one manifest recording, per input file:
+#   - the SHA-256 of the input bytes,
+#   - the parser version and a fingerprint of the parser's code + config,
+#   - the output file it produced and that output's SHA-256.
+# An input is skipped only when all of these still match, so editing a page,
+# the script or its settings (or touching the output) forces a rebuild.
+# ============================================================
+MANIFEST_NAME = ".build_manifest.json"
+MANIFEST_VERSION = 1
+
+def bytes_digest(data):
+    """
+    Returns the hex SHA-256 of a bytes object.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def file_digest(path):
+    """
+    Returns the hex SHA-256 of a file's contents, or None if it cannot be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def module_files(module):
+    """
+    Returns the paths of module's file and of every module it imports from
+    the same directory (or imports functions or classes from), directly or
+    through other such modules.
+    """
+    directory = os.path.dirname(os.path.abspath(module.__file__))
+    seen = {}
+    pending = [module]
+    while pending:
+        module = pending.pop()
+        path = os.path.abspath(getattr(module, "__file__", None) or "")
+        if path in seen or os.path.dirname(path) != directory:
+            continue
+        seen[path] = module
+        for value in vars(module).values():
+            if isinstance(value, types.ModuleType):
+                pending.append(value)
+            elif isinstance(value, (types.FunctionType, type)) and value.__module__ in sys.modules:
+                pending.append(sys.modules[value.__module__])
+    return sorted(seen)
+
+def fingerprint(script_path, parser_version, config, module=None):
+    """
+    Combines the parser version, the parser script's own source and its
+    configuration values into one hash; with module (the script's module),
+    also the source of every repo module it imports (see module_files), which
+    render parts of its output. Any change to these invalidates every cached
+    output produced by that script.
+    """
+    code = {os.path.basename(path): file_digest(path) for path in module_files(module)} if module else None
+    payload = json.dumps(
+        {
+            "parser_version": parser_version,
+            "script": file_digest(script_path),
+            "code": code,
+            "config": config,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def manifest_path_for(output_dir):
+    """
+    Returns the manifest path for the given output directory.
+    """
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+def load_manifest(manifest_path):
+    """
+    Reads the manifest. A missing, unreadable or outdated manifest is treated
+    as empty, which simply means everything gets rebuilt.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "entries": {}}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "entries": {}}
+    manifest.setdefault("entries", {})
+    return manifest
+
+def _key(manifest_path, path):
+    # Paths are stored relative to the manifest so the tree can be moved.
+    return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(manifest_path)))
+
+def lookup(manifest_path, input_file, input_digest, build_fingerprint):
+    """
+    Returns the path of the output previously built from input_file if the
+    input bytes, the parser fingerprint and the output on disk are all unchanged.
+    Returns None when the input has to be (re)built.
+    """
+    entry = load_manifest(manifest_path)["entries"].get(_key(manifest_path, input_file))
+    if not entry:
+        return None
+    if entry.get("input_sha256") != input_digest or entry.get("fingerprint") != build_fingerprint:
+        return None
+    output_file = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), entry.get("output", ""))
+    # The output must still be exactly what we wrote; a half-written or
+    # hand-edited output means the input is rebuilt.
+    if file_digest(output_file) != entry.get("output_sha256"):
+        return None
+    return output_file
+
+def record(manifest_path, input_file, input_digest, parser_version, build_fingerprint,
+           output_file, output_digest):
+    """
+    Records a successful build of input_file. The manifest is updated under a
+    lock and replaced atomically, so concurrent workers do not lose each
+    other's entries and an interrupted run never leaves a corrupt manifest.
+    """
+    def add_entry(manifest):
+        if manifest.get("version") != MANIFEST_VERSION:
+            manifest = {"version": MANIFEST_VERSION, "entries": {}}
+        manifest.setdefault("entries", {})[_key(manifest_path, input_file)] = {
+            "input_sha256": input_digest,
+            "parser_version": parser_version,
+            "fingerprint": build_fingerprint,
+            "output": _key(manifest_path, output_file),
+            "output_sha256": output_digest,
+            "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        return manifest
+
+    update_json(manifest_path, add_entry)
+
+def update_json(path, update):
+    """
+    Read-modify-write of a JSON file under an exclusive lock: update() gets the
+    current contents (an empty dict if missing or unreadable) and returns the
+    new contents, which replace the file atomically.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        write_atomic(path, json.dumps(update(data), indent=2, sort_keys=True))
+
+def _new_file_mode(path):
+    """
+    The permission bits of the file at path, or the umask default for a new file.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def write_atomic(path, text):
+    """
+    Writes text (UTF-8) or bytes to path via a temporary file in the same
+    directory and os.replace, so readers only ever see the old or the complete
+    new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        # mkstemp creates the file as 0600; give it the mode a plain open() would.
+        os.chmod(temp_path, _new_file_mode(path))
+        with (os.fdopen(fd, "wb") if isinstance(text, bytes) else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
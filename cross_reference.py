@@ -0,0 +1,208 @@
+import argparse
+import html
+import json
+import os
+import sys
+import time
+
+import build_cache
+import pokemon_store
+
+# ============================================================
+# Pokémon -> where to find it, as one small JSON file.
+#
+# Joins the rows of every location page (extract_table_data) with the swarm
+# rows (extract_swarm_table_data) from the SQLite store in one pass: the swarm
+# rows are hashed by dex number, then each location row probes that table as
+# it is grouped into its Pokémon's entry and its area's member list. Swarm
+# nations are joined to locations the same way, by lowercased name.
+#
+#   {"version": 1,
+#    "areas":   [[location, area, [dex, ...]], ...],         # area id = position
+#    "swarms":  {location: [dex, ...]},                       # swarm Pokémon per nation
+#    "pokemon": {"396": {"name", "types",
+#                        "areas": [[area id, level requirement, trainers], ...],
+#                        "swarm": {"nations", "abilities", "trainers"} or null}}}
+#
+# Loading it is a single json.load; no HTML is parsed to answer
+#     python cross_reference.py show 396        (or: show starly)
+# build.py writes it as its "xref" stage; by hand:
+#     python cross_reference.py build
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(SCRIPT_DIR, pokemon_store.STORE_NAME)
+DEFAULT_OUTPUT = os.path.join(SCRIPT_DIR, "conquest_xref.json")
+XREF_VERSION = 1
+
+# Nation names in the swarm table that are spelled differently from the location.
+NATION_ALIASES = {"terrara": "terrera"}
+
+def _text(cell_html):
+    return html.unescape(pokemon_store.TAG_RE.sub("", cell_html)).strip()
+
+def build_xref(rows):
+    """
+    Builds the cross-reference from store rows (mappings with source,
+    location, area, dex_no, name, types, area_level_text, abilities, nation and
+    trainers), in page order.
+    """
+    # Build side: the swarm rows, hashed by dex number.
+    swarm_rows = {}
+    for row in rows:
+        if row["source"] == "swarm" and row["dex_no"] is not None:
+            swarm_rows.setdefault(row["dex_no"], []).append(row)
+
+    areas = []
+    area_ids = {}
+    pokemon = {}
+
+    def entry_for(row):
+        entry = pokemon.get(row["dex_no"])
+        if entry is None:
+            entry = pokemon[row["dex_no"]] = {
+                "name": row["name"], "types": row["types"].split(), "areas": [], "swarm": None,
+            }
+            # Probe: the first row of a Pokémon picks up its swarm data.
+            for swarm_row in swarm_rows.get(row["dex_no"], []):
+                swarm = entry["swarm"] or {"nations": [], "abilities": [], "trainers": ""}
+                swarm["nations"] += [n for n in swarm_row["nation"].split(", ") if n and n not in swarm["nations"]]
+                swarm["abilities"] += [a for a in swarm_row["abilities"].split(", ")
+                                       if a and a not in swarm["abilities"]]
+                swarm["trainers"] = swarm["trainers"] or _text(swarm_row["trainers"])
+                entry["swarm"] = swarm
+        return entry
+
+    swarms = {}
+    for row in rows:
+        if row["dex_no"] is None:
+            continue
+        entry = entry_for(row)
+        if row["source"] == "swarm":
+            for nation in entry["swarm"]["nations"]:
+                location = NATION_ALIASES.get(nation.lower(), nation.lower())
+                if row["dex_no"] not in swarms.setdefault(location, []):
+                    swarms[location].append(row["dex_no"])
+            continue
+        key = (row["location"], row["area"])
+        area_id = area_ids.get(key)
+        if area_id is None:
+            area_id = area_ids[key] = len(areas)
+            areas.append([row["location"], row["area"], []])
+        if row["dex_no"] not in areas[area_id][2]:
+            areas[area_id][2].append(row["dex_no"])
+        entry["areas"].append([area_id, row["area_level_text"], _text(row["trainers"])])
+
+    return {
+        "version": XREF_VERSION,
+        "areas": areas,
+        "swarms": swarms,
+        "pokemon": {str(dex): pokemon[dex] for dex in sorted(pokemon)},
+    }
+
+def load_rows(db_path):
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Store not found: {db_path}")
+    conn = pokemon_store.connect(db_path)
+    try:
+        return conn.execute(
+            """SELECT pages.source, pokemon.location, pokemon.area, pokemon.dex_no, pokemon.name,
+                      pokemon.types, pokemon.area_level_text, pokemon.abilities, pokemon.nation,
+                      pokemon.trainers
+               FROM pokemon
+               JOIN areas ON areas.area_id = pokemon.area_id
+               JOIN pages ON pages.page_id = areas.page_id
+               ORDER BY pokemon.pokemon_id"""
+        ).fetchall()
+    finally:
+        conn.close()
+
+def write_xref(db_path=DEFAULT_STORE, output_file=DEFAULT_OUTPUT):
+    """
+    Builds the cross-reference from the store and writes it to output_file.
+    Returns the cross-reference.
+    """
+    xref = build_xref(load_rows(db_path))
+    build_cache.write_atomic(output_file, json.dumps(xref, separators=(",", ":"), ensure_ascii=False))
+    return xref
+
+def load_xref(path=DEFAULT_OUTPUT):
+    with open(path, "r", encoding="utf-8") as f:
+        xref = json.load(f)
+    if xref.get("version") != XREF_VERSION:
+        raise ValueError(f"{path} was written by another version; rebuild it")
+    return xref
+
+def find(xref, query):
+    """
+    Returns (dex, entry) for a dex number or a name (case-insensitive), or None.
+    """
+    query = query.strip().lstrip("#")
+    if query.isdigit():
+        entry = xref["pokemon"].get(str(int(query)))
+        return (int(query), entry) if entry else None
+    for dex, entry in xref["pokemon"].items():
+        if entry["name"].lower() == query.lower():
+            return int(dex), entry
+    return None
+
+def describe(xref, dex, entry):
+    """
+    Yields report lines: every area (with what else lives there) and swarm nation.
+    """
+    names = lambda dexes: ", ".join(f"#{d:03d} {xref['pokemon'][str(d)]['name']}" for d in dexes if d != dex)
+    yield f"#{dex:03d} {entry['name']} ({'/'.join(entry['types'])})"
+    for area_id, level, trainers in entry["areas"]:
+        location, area, members = xref["areas"][area_id]
+        yield f"  {location} / {area}: {level or '-'}" + (f"; trainers: {trainers}" if trainers else "")
+        yield f"    also here: {names(members) or '-'}"
+    swarm = entry["swarm"]
+    if swarm:
+        yield (f"  swarm in {', '.join(swarm['nations'])}; abilities: {', '.join(swarm['abilities']) or '-'}"
+               + (f"; trainers: {swarm['trainers']}" if swarm["trainers"] else ""))
+        for nation in swarm["nations"]:
+            location = NATION_ALIASES.get(nation.lower(), nation.lower())
+            yield f"    also swarming in {nation}: {names(xref['swarms'].get(location, [])) or '-'}"
+    if not entry["areas"] and not swarm:
+        yield "  not found in any area"
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Build or query the Pokémon -> locations cross-reference.")
+    arg_parser.add_argument("--xref", default=DEFAULT_OUTPUT, help="cross-reference file (default: %(default)s)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="write the cross-reference from the SQLite store")
+    build_parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite store (default: %(default)s)")
+    show_parser = commands.add_parser("show", help="where to find a Pokémon, by dex number or name")
+    show_parser.add_argument("pokemon", nargs="+")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "build":
+        try:
+            xref = write_xref(args.store, args.xref)
+        except FileNotFoundError as e:
+            print(f"[ERROR] {e}")
+            return 1
+        print(f"[INFO] {len(xref['pokemon'])} Pokémon in {len(xref['areas'])} areas -> {args.xref} "
+              f"({os.path.getsize(args.xref) / 1024:.1f} KB)")
+        return 0
+
+    start = time.perf_counter()
+    try:
+        xref = load_xref(args.xref)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+    load_time = time.perf_counter() - start
+    status = 0
+    for query in args.pokemon:
+        found = find(xref, query)
+        if found is None:
+            print(f"[ERROR] No Pokémon '{query}' in {args.xref}")
+            status = 1
+            continue
+        for line in describe(xref, *found):
+            print(line)
+    print(f"[INFO] Loaded {args.xref} in {load_time * 1000:.1f} ms")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import codecs
+import hashlib
+import json
+import re
+
+try:
+    from chardet import UniversalDetector
+except ImportError:
+    UniversalDetector = None
+
+import build_cache
+
+# ============================================================
+# Fast encoding detection for the saved serebii pages.
+# In order, the first step that gives an answer wins:
+#   1. bom       a UTF-8/16/32 byte order mark
+#   2. meta      <meta charset> or a Content-Type declaration in the first SNIFF_BYTES
+#   3. cache     what chardet said earlier about identical bytes
+#   4. chardet   chardet's UniversalDetector, fed in chunks until it is confident,
+#                for at most DETECT_LIMIT bytes
+#   5. default   utf-8 (chardet not installed or no guess)
+# detect_encoding() returns the step that decided so callers can log it.
+# ============================================================
+CACHE_NAME = ".encoding_cache.json"
+SNIFF_BYTES = 4096
+DETECT_LIMIT = 256 * 1024
+CHUNK_SIZE = 4096
+DEFAULT_ENCODING = "utf-8"
+
+# Longest first: the UTF-32-LE BOM starts with the UTF-16-LE one.
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Matches both <meta charset="x"> and <meta http-equiv="Content-Type" content="text/html; charset=x">.
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+?charset\s*=\s*["']?\s*([A-Za-z0-9._:-]+)""", re.IGNORECASE)
+
+# chardet results for this process, by content digest.
+_memory_cache = {}
+
+def _bom_encoding(raw_data):
+    for bom, encoding in BOMS:
+        if raw_data.startswith(bom):
+            return encoding
+    return None
+
+def _declared_encoding(raw_data):
+    """
+    Returns the first valid charset declared in the first SNIFF_BYTES, or None.
+    A declared UTF-16/32 is read as UTF-8 (without a BOM the bytes cannot be UTF-16).
+    """
+    for match in META_CHARSET_RE.finditer(raw_data[:SNIFF_BYTES]):
+        name = match.group(1).decode("ascii", errors="ignore")
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            continue
+        if encoding.startswith(("utf-16", "utf-32")):
+            return DEFAULT_ENCODING
+        return encoding
+    return None
+
+def _chardet_encoding(raw_data):
+    """
+    Feeds chardet's incremental detector chunk by chunk, stopping as soon as it
+    is confident or DETECT_LIMIT bytes have been seen.
+    """
+    if UniversalDetector is None:
+        return None
+    detector = UniversalDetector()
+    for start in range(0, min(len(raw_data), DETECT_LIMIT), CHUNK_SIZE):
+        detector.feed(raw_data[start:start + CHUNK_SIZE])
+        if detector.done:
+            break
+    detector.close()
+    return (detector.result or {}).get("encoding")
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def detect_encoding(raw_data, digest=None, cache_file=None):
+    """
+    Works out the text encoding of raw_data (bytes).
+    digest is the content's SHA-256 (computed if not given); chardet results are
+    cached per digest in this process and, if cache_file is given, on disk.
+    Returns (encoding, method) where method is "cache", "bom", "meta",
+    "chardet" or "default".
+    """
+    encoding = _bom_encoding(raw_data)
+    if encoding:
+        return encoding, "bom"
+    encoding = _declared_encoding(raw_data)
+    if encoding:
+        return encoding, "meta"
+
+    digest = digest or hashlib.sha256(raw_data).hexdigest()
+    encoding = _memory_cache.get(digest)
+    if encoding is None and cache_file:
+        encoding = _load_cache(cache_file).get(digest)
+    if encoding:
+        _memory_cache[digest] = encoding
+        return encoding, "cache"
+
+    encoding = _chardet_encoding(raw_data)
+    if not encoding:
+        return DEFAULT_ENCODING, "default"
+    _memory_cache[digest] = encoding
+    if cache_file:
+        def add_entry(cache):
+            cache[digest] = encoding
+            return cache
+        build_cache.update_json(cache_file, add_entry)
+    return encoding, "chardet"
+
+def describe(method):
+    """
+    Human-readable name of a detect_encoding() method, for log lines.
+    """
+    return {
+        "cache": "cached chardet result for identical content",
+        "bom": "byte order mark",
+        "meta": "declared charset",
+        "chardet": "chardet",
+        "default": "default; chardet unavailable or undecided",
+    }.get(method, method)
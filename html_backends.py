@@ -0,0 +1,169 @@
+import argparse
+import filecmp
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+# ============================================================
+# Pluggable HTML parser backend.
+# Every script builds its document soups through make_soup(), so the tree
+# builder can be switched in one place:
+#   - set CONQUEST_HTML_PARSER in the environment (inherited by worker processes), or
+#   - call set_backend() (e.g. from a --parser command line flag).
+# Small cell fragments always go through parse_fragment(), which uses
+# html.parser: lxml and html5lib wrap fragments in <html><body><p>, which
+# would change the generated markup.
+#
+# Run this file to check that every installed backend produces byte-identical
+# location pages (and merged page) to html.parser:
+#     python html_backends.py
+# ============================================================
+DEFAULT_BACKEND = "html.parser"
+ENV_VAR = "CONQUEST_HTML_PARSER"
+
+# Backend name -> (BeautifulSoup features string, module that must be importable).
+# Only backends that pass check_conformance belong here: html5lib does not
+# (the location parser gets only the header rows of each dextable and writes
+# empty tables), so it is not offered.
+BACKENDS = {
+    "html.parser": ("html.parser", None),
+    "lxml": ("lxml", "lxml"),
+}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCATION_INPUT_DIR = os.path.join(SCRIPT_DIR, "shtml's of location")
+
+def available_backends():
+    """
+    Returns the names of the backends whose parser library is installed.
+    """
+    names = []
+    for name, (_, module_name) in BACKENDS.items():
+        if module_name is None:
+            names.append(name)
+            continue
+        try:
+            __import__(module_name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def current_backend():
+    """
+    Returns the configured backend name, falling back to html.parser.
+    """
+    return os.environ.get(ENV_VAR) or DEFAULT_BACKEND
+
+def set_backend(name):
+    """
+    Selects the backend for this process and any worker processes it starts.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    if name not in available_backends():
+        raise ValueError(f"HTML parser backend '{name}' is not installed.")
+    os.environ[ENV_VAR] = name
+
+def make_soup(markup, backend=None):
+    """
+    Parses a whole document with the configured (or given) backend.
+    """
+    name = backend or current_backend()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return BeautifulSoup(markup, BACKENDS[name][0])
+
+def parse_fragment(markup):
+    """
+    Parses a small HTML fragment (a table cell's contents) without adding any
+    <html>/<body> wrapper, so decode() gives back just the fragment.
+    """
+    return BeautifulSoup(markup, "html.parser")
+
+def _build_with(backend, input_files, output_dir):
+    """
+    Runs the location parser and the location merger with the given backend.
+    Returns (seconds, merged output path).
+    """
+    from script_loader import LOCATION_MERGER, LOCATION_PARSER, load_script
+
+    parser = load_script(LOCATION_PARSER)
+    merger = load_script(LOCATION_MERGER)
+    previous = os.environ.get(ENV_VAR)
+    os.environ[ENV_VAR] = backend
+    try:
+        page_dir = os.path.join(output_dir, "pages")
+        os.makedirs(page_dir)
+        store_file = os.path.join(output_dir, "store.sqlite")
+        start = time.perf_counter()
+        for input_file in input_files:
+            parser.process_file(input_file, page_dir, force=True, store_file=store_file)
+        elapsed = time.perf_counter() - start
+        merged_file = os.path.join(output_dir, "merged.html")
+        merger.merge_html_files(page_dir, merged_file)
+    finally:
+        if previous is None:
+            os.environ.pop(ENV_VAR, None)
+        else:
+            os.environ[ENV_VAR] = previous
+    return elapsed, merged_file
+
+def check_conformance(input_dir=LOCATION_INPUT_DIR, backends=None):
+    """
+    Builds every location page (and the merged page) once per backend and
+    compares the results byte for byte against html.parser.
+    Returns a dict of backend -> list of differing file names (empty when identical).
+    """
+    backends = backends or available_backends()
+    input_files = sorted(glob.glob(os.path.join(input_dir, "*.shtml")))
+    differences = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        builds = {}
+        for backend in [DEFAULT_BACKEND] + [b for b in backends if b != DEFAULT_BACKEND]:
+            output_dir = os.path.join(temp_dir, backend)
+            elapsed, merged_file = _build_with(backend, input_files, output_dir)
+            builds[backend] = (os.path.join(output_dir, "pages"), merged_file)
+            print(f"[INFO] {backend}: parsed {len(input_files)} pages in {elapsed:.2f}s")
+
+        reference_pages, reference_merged = builds[DEFAULT_BACKEND]
+        page_names = sorted(f for f in os.listdir(reference_pages) if f.endswith(".html"))
+        for backend, (pages, merged_file) in builds.items():
+            if backend == DEFAULT_BACKEND:
+                continue
+            _, mismatch, errors = filecmp.cmpfiles(reference_pages, pages, page_names, shallow=False)
+            extra = sorted(set(f for f in os.listdir(pages) if f.endswith(".html")) - set(page_names))
+            differing = mismatch + errors + extra
+            if not filecmp.cmp(reference_merged, merged_file, shallow=False):
+                differing.append(os.path.basename(merged_file))
+            differences[backend] = differing
+    return differences
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Check that each HTML parser backend produces identical conquest_locations output."
+    )
+    arg_parser.add_argument("--input-dir", default=LOCATION_INPUT_DIR, help="directory of location .shtml files")
+    arg_parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS),
+                            help="backends to check (default: all installed)")
+    args = arg_parser.parse_args(argv)
+
+    missing = sorted(set(BACKENDS) - set(available_backends()))
+    if missing:
+        print(f"[INFO] Not installed, skipped: {', '.join(missing)}")
+    differences = check_conformance(args.input_dir, args.backends)
+    failed = False
+    for backend, differing in differences.items():
+        if differing:
+            failed = True
+            print(f"[FAIL] {backend}: {len(differing)} file(s) differ from {DEFAULT_BACKEND}: {', '.join(differing)}")
+        else:
+            print(f"[OK] {backend}: identical to {DEFAULT_BACKEND}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import posixpath  # Used to correctly join URL paths
+
+from bs4 import Tag
+from bs4.dammit import EntitySubstitution
+from bs4.formatter import HTMLFormatter
+
+import asset_store
+import instrumentation
+
+# ============================================================
+# Shared cell clean-up used by the parser scripts' fix_images helpers.
+# Image URLs are rewritten while the cell is serialized (through a custom
+# formatter), so no cell is ever decoded and parsed a second time, and the
+# page soup's <img> tags are left untouched.
+#
+# The scripts resolve image paths differently, so the policy is explicit:
+#   SRC_ROOTED         only "/..." paths get BASE_URL (multi_conquest_parse)
+#   SRC_RELATIVE       anything not starting with "http" gets BASE_URL,
+#                      adding a leading "/" if missing (universal)
+#   SRC_PAGE_RELATIVE  like SRC_RELATIVE, but "./x" and "x" are first joined
+#                      onto the page's base_path (swarm parse)
+#
+# While a sprite atlas is enabled (see asset_store), images that are in it
+# are replaced with atlas <span>s, in place, before the cell is serialized.
+# ============================================================
+SRC_ROOTED = "rooted"
+SRC_RELATIVE = "relative"
+SRC_PAGE_RELATIVE = "page"
+
+def resolve_image_src(src, base_url, policy=SRC_ROOTED, base_path="/"):
+    """
+    Returns the rewritten src for an <img>, or None if it should be left as is.
+    """
+    if policy == SRC_ROOTED:
+        return base_url + src if src.startswith("/") else None
+    if policy == SRC_RELATIVE:
+        if src.startswith("http"):
+            return None
+        if not src.startswith("/"):
+            src = "/" + src
+        return base_url + src
+    if policy == SRC_PAGE_RELATIVE:
+        src = src.strip()
+        # Remove leading dot if present.
+        if src.startswith("."):
+            src = src.lstrip(".")
+        if src.startswith("http"):
+            return None
+        if not src.startswith("/"):
+            src = posixpath.join(base_path, src)
+            if not src.startswith("/"):
+                src = "/" + src
+        return base_url + src
+    raise ValueError(f"Unknown image src policy: {policy}")
+
+class ImageRewriteFormatter(HTMLFormatter):
+    """
+    The default ("minimal") HTML formatter, except that every <img> is written
+    with its src resolved against base_url and, if max_width is given, an
+    inline max-width style appended.
+    """
+
+    def __init__(self, base_url, policy=SRC_ROOTED, base_path="/", max_width=None):
+        super().__init__(entity_substitution=EntitySubstitution.substitute_xml)
+        self.base_url = base_url
+        self.policy = policy
+        self.base_path = base_path
+        self.max_width = max_width
+        self.rewritten = 0  # <img> srcs rewritten so far
+
+    def attributes(self, tag):
+        if tag.name != "img":
+            return super().attributes(tag)
+        attrs = dict(tag.attrs or {})
+        src = resolve_image_src(attrs.get("src", ""), self.base_url, self.policy, self.base_path)
+        if src is not None:
+            attrs["src"] = src
+            self.rewritten += 1
+        if self.max_width:
+            current_style = attrs.get("style", "")
+            attrs["style"] = (current_style + " " if current_style else "") + f"max-width:{self.max_width}px; height:auto;"
+        return sorted(attrs.items())
+
+def apply_atlas(cell_tag, atlas, base_url, policy=SRC_ROOTED, base_path="/", max_width=None):
+    """
+    Replaces (in place) every <img> in cell_tag that the atlas has with
+    <span class="..." data-src="<resolved URL>">. Images that max_width would
+    shrink are left alone, since atlas sprites are not scaled.
+    Returns the number of images replaced.
+    """
+    replaced = 0
+    for img in cell_tag.find_all("img"):
+        src = img.get("src", "")
+        src = resolve_image_src(src, base_url, policy, base_path) or src
+        sprite = atlas.lookup(src)
+        if sprite is None or (max_width and sprite["width"] > max_width):
+            continue
+        img.replace_with(Tag(name="span", attrs={"class": sprite["classes"], "data-src": src}))
+        replaced += 1
+    return replaced
+
+def rewrite_cell_html(cell_tag, base_url, policy=SRC_ROOTED, base_path="/", max_width=None, strip_links=False):
+    """
+    Returns the inner HTML of cell_tag with image URLs made absolute (see the
+    SRC_* policies) and, optionally, image widths capped at max_width pixels.
+    With strip_links, every <a> in the cell is unwrapped (its contents kept)
+    first; this is done in place and is harmless to repeat. So is the atlas
+    replacement, when an atlas is enabled.
+    """
+    if strip_links:
+        for a in cell_tag.find_all("a"):
+            a.unwrap()
+    atlas = asset_store.active_atlas()
+    if atlas is not None:
+        instrumentation.count("atlas_images", apply_atlas(cell_tag, atlas, base_url, policy, base_path, max_width))
+    formatter = ImageRewriteFormatter(base_url, policy, base_path, max_width)
+    cell_html = cell_tag.decode_contents(formatter=formatter)
+    instrumentation.count("images_rewritten", formatter.rewritten)
+    return cell_html
@@ -0,0 +1,211 @@
+import argparse
+import cProfile
+import datetime
+import functools
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+# ============================================================
+# Opt-in instrumentation for process_file (location pages), the swarm parser's
+# main() and merge_html_files.
+# Off by default; it is switched on through the environment, so worker
+# processes started by the location parser inherit it:
+#   CONQUEST_INSTRUMENT=<file.jsonl>    append one JSON line per instrumented run
+#   CONQUEST_PROFILE_DIR=<directory>    also write a cProfile dump per run
+# (or call enable(), e.g. from the location parser's --instrument flag).
+#
+# Each line holds the run's kind and input name, status ("ok"; "error" if it
+# raised; "failed" if it returned None where that means failure), total
+# wall/CPU seconds, peak traced memory (tracemalloc), per-stage wall/CPU
+# seconds and counters (areas, rows, images rewritten, ...). Stages are marked
+# with lap(name), which charges everything since the previous lap (or the
+# start of the run) to name.
+#
+# Run this file on a log to see the batch totals and the slowest inputs:
+#     python instrumentation.py instrument.jsonl
+# ============================================================
+LOG_ENV_VAR = "CONQUEST_INSTRUMENT"
+PROFILE_ENV_VAR = "CONQUEST_PROFILE_DIR"
+
+# Runs in progress in this process, innermost last.
+_active = []
+
+def enable(log_file, profile_dir=None):
+    """
+    Turns instrumentation on for this process and any worker processes it starts.
+    """
+    os.environ[LOG_ENV_VAR] = os.path.abspath(log_file)
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        os.environ[PROFILE_ENV_VAR] = os.path.abspath(profile_dir)
+    else:
+        os.environ.pop(PROFILE_ENV_VAR, None)
+
+def enabled():
+    return bool(os.environ.get(LOG_ENV_VAR))
+
+class Run:
+    """
+    Measurements of one instrumented call. Use through instrumented(); the
+    module-level lap() and count() apply to the innermost active Run.
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.stages = {}
+        self.counts = {}
+        self.profile = None
+        self.profile_file = None
+        self.traced = False
+
+    def start(self):
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.traced = True
+        profile_dir = os.environ.get(PROFILE_ENV_VAR)
+        # Only the outermost run is profiled; profilers cannot be nested.
+        if profile_dir and not any(run.profile for run in _active):
+            safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", self.name)
+            self.profile_file = os.path.join(profile_dir, f"{self.kind}-{safe_name}-{os.getpid()}.prof")
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.wall_start = self.lap_wall = time.perf_counter()
+        self.cpu_start = self.lap_cpu = time.process_time()
+
+    def lap(self, stage):
+        wall, cpu = time.perf_counter(), time.process_time()
+        totals = self.stages.setdefault(stage, {"wall": 0.0, "cpu": 0.0})
+        totals["wall"] += wall - self.lap_wall
+        totals["cpu"] += cpu - self.lap_cpu
+        self.lap_wall, self.lap_cpu = wall, cpu
+
+    def count(self, key, amount=1):
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    def finish(self, error=None, failed=False):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_file)
+        peak_memory = None
+        if self.traced:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "pid": os.getpid(),
+            "started": self.started,
+            "status": "error" if error else "failed" if failed else "ok",
+            "error": f"{type(error).__name__}: {error}" if error else None,
+            "wall": wall,
+            "cpu": cpu,
+            "peak_memory": peak_memory,
+            "stages": self.stages,
+            "counts": self.counts,
+            "profile": self.profile_file,
+        }
+
+def _write_record(record):
+    # One short write per line in append mode, so lines from parallel workers do not interleave.
+    with open(os.environ[LOG_ENV_VAR], "a", encoding="utf-8") as log:
+        log.write(json.dumps(record, sort_keys=True) + "\n")
+
+def instrumented(kind, name_arg=None, none_fails=False):
+    """
+    Decorator that records one Run per call while instrumentation is enabled
+    (and does nothing otherwise). The run is named after the basename of
+    positional argument name_arg, or after kind if name_arg is None. With
+    none_fails, a call that returns None is recorded as failed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            name = kind
+            if name_arg is not None and len(args) > name_arg:
+                name = os.path.basename(str(args[name_arg]))
+            run = Run(kind, name)
+            _active.append(run)
+            run.start()
+            error = None
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _active.remove(run)
+                _write_record(run.finish(error, none_fails and result is None))
+        return wrapper
+    return decorator
+
+def lap(stage):
+    """
+    Charges the time since the previous lap (or the start of the run) to stage.
+    """
+    if _active:
+        _active[-1].lap(stage)
+
+def count(key, amount=1):
+    """
+    Adds amount to the counter key of the current run.
+    """
+    if _active:
+        _active[-1].count(key, amount)
+
+def load_records(log_file):
+    records = []
+    with open(log_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+def summarize(records, top=5):
+    """
+    Prints per-kind totals, each stage's median and slowest inputs, and any failed runs.
+    """
+    for kind in sorted({record["kind"] for record in records}):
+        runs = [record for record in records if record["kind"] == kind]
+        print(f"== {kind}: {len(runs)} run(s), {sum(r['wall'] for r in runs):.2f}s wall, "
+              f"{sum(r['cpu'] for r in runs):.2f}s CPU")
+        stage_names = []
+        for run in runs:
+            stage_names.extend(s for s in run["stages"] if s not in stage_names)
+        for stage in ["wall"] + stage_names:
+            timed = [(run["wall"] if stage == "wall" else run["stages"].get(stage, {}).get("wall", 0.0), run["name"])
+                     for run in runs]
+            slowest = sorted(timed, reverse=True)[:top]
+            print(f"  {stage:<12} median {statistics.median(t for t, _ in timed) * 1000:9.1f} ms   slowest: "
+                  + ", ".join(f"{name} {seconds * 1000:.1f} ms" for seconds, name in slowest))
+        peaks = [(run["peak_memory"], run["name"]) for run in runs if run.get("peak_memory")]
+        if peaks:
+            peak, name = max(peaks)
+            print(f"  peak memory  {peak / 1e6:.1f} MB ({name})")
+        for run in runs:
+            if run["status"] != "ok":
+                print(f"  [ERROR] {run['name']}: {run['error'] or 'no output'}")
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Summarize an instrumentation JSON lines log.")
+    arg_parser.add_argument("log_file", help="file written via CONQUEST_INSTRUMENT / --instrument")
+    arg_parser.add_argument("--top", type=int, default=5, help="slowest inputs to list per stage (default: %(default)s)")
+    args = arg_parser.parse_args(argv)
+    summarize(load_records(args.log_file), args.top)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import argparse
+import os
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# ============================================================
+# Vectorized port of "Pokemon Conquest IV Calculator.xlsx".
+#
+# A warrior-linked Pokémon's stat is
+#     stat = floor(floor((base + iv) * link) * energy)
+# with iv 0..31, link in percent and one of five energy levels (90-110%).
+# The workbook computes this one Pokémon per sheet; here every function takes
+# NumPy arrays and broadcasts, so whole rosters x every link x every energy
+# level are one call. Link and energy are whole percentages (13 = 13%,
+# 110 = 110%) and all the arithmetic is integer, so results do not depend on
+# how 0.13 or 1.1 happen to round in floating point.
+#
+# Forward:  stat_at_iv, stat_range, stat_table
+# Reverse:  iv_range (known link), link_range, iv_range_unknown_link
+#           (the workbook's formulas), exact_iv_range, screen
+#
+# Run this file to check the formulas against the values the workbook has
+# stored for its three calculator sheets:
+#     python iv_calculator.py verify
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKBOOK_FILE = os.path.join(SCRIPT_DIR, "Pokemon Conquest IV Calculator.xlsx")
+BASE_STATS_SHEET = "Pokemon List"
+CALCULATOR_SHEETS = ["Sheet1", "Sheet2", "Sheet3"]
+
+STAT_NAMES = ["HP", "Attack", "Defence", "Speed"]
+MAX_IV = 31
+ENERGY_LEVELS = np.array([90, 95, 100, 105, 110])
+LINK_LEVELS = np.arange(1, 101)
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+def stat_at_iv(base, iv, link, energy):
+    """
+    Stat for the given base stat, IV, link % and energy % (all broadcast).
+    """
+    base, iv, link, energy = np.broadcast_arrays(*(np.asarray(x, dtype=np.int64) for x in (base, iv, link, energy)))
+    return ((base + iv) * link // 100) * energy // 100
+
+def stat_range(base, link, energy):
+    """
+    Returns (min, max): the stats at IV 0 and IV 31 (workbook rows 4 and 5).
+    """
+    return stat_at_iv(base, 0, link, energy), stat_at_iv(base, MAX_IV, link, energy)
+
+def stat_table(base, links=LINK_LEVELS, energies=ENERGY_LEVELS):
+    """
+    Min and max stats for every link and energy level at once.
+    base has shape (..., 4) (HP, Attack, Defence, Speed); the results have
+    shape (..., len(links), len(energies), 4).
+    """
+    base = np.asarray(base, dtype=np.int64)[..., None, None, :]
+    link = np.asarray(links, dtype=np.int64)[:, None, None]
+    energy = np.asarray(energies, dtype=np.int64)[None, :, None]
+    return stat_range(base, link, energy)
+
+def _stat_floor(stat, energy):
+    # Smallest value of floor((base + iv) * link) that can give stat at this energy.
+    return _ceil_div(stat * 100, energy)
+
+def iv_min(base, stat, link, energy):
+    """
+    Lowest IV consistent with an observed stat (workbook row 9). Values above
+    31 or below 0 mean the stat is out of reach at this link and energy.
+    """
+    base, stat, link, energy = (np.asarray(x, dtype=np.int64) for x in (base, stat, link, energy))
+    return _ceil_div(_stat_floor(stat, energy) * 100, link) - base
+
+def iv_max(base, stat, link, energy):
+    """
+    Highest IV consistent with an observed stat, capped at 31 (workbook row 10).
+    """
+    base, stat, link, energy = (np.asarray(x, dtype=np.int64) for x in (base, stat, link, energy))
+    floor_stat = _stat_floor(stat, energy)
+    # Extra whole units of (base + iv) * link that still floor to the same stat.
+    slack = (floor_stat * energy - stat * 100) // 100
+    return np.minimum((slack + 1) * 100 // link + iv_min(base, stat, link, energy), MAX_IV)
+
+def iv_range(base, stat, link, energy):
+    """
+    Returns (iv_min, iv_max) for a Pokémon whose link is known.
+    """
+    return iv_min(base, stat, link, energy), iv_max(base, stat, link, energy)
+
+def exact_iv_range(base, stat, link, energy):
+    """
+    Returns (iv_min, iv_max, possible): the exact IVs 0..31 that give stat.
+    iv_min matches the workbook; the workbook's iv_max only counts one extra
+    unit of slack and can come out too low, so this bound is the one to trust.
+    """
+    base, stat, link, energy = (np.asarray(x, dtype=np.int64) for x in (base, stat, link, energy))
+    # floor((base + iv) * link) must lie in [low_units, high_units] to floor to stat at this energy.
+    low_units = _stat_floor(stat, energy)
+    high_units = _ceil_div((stat + 1) * 100, energy) - 1
+    low = np.maximum(_ceil_div(low_units * 100, link) - base, 0)
+    high = np.minimum(_ceil_div((high_units + 1) * 100, link) - 1 - base, MAX_IV)
+    return low, high, (low <= high) & (low_units <= high_units)
+
+def link_range(base, stat, energy):
+    """
+    Returns (min_link, max_link) per stat, in percent: the links that could
+    produce each observed stat (workbook rows 12 and 13). Like the workbook,
+    the max link can come out too low; base and energy must be positive.
+    """
+    base, stat, energy = (np.asarray(x, dtype=np.int64) for x in (base, stat, energy))
+    min_link = _ceil_div(_stat_floor(stat, energy) * 100, base + MAX_IV)
+    max_link = _ceil_div((stat + 1) * 10000, base * energy) - 1
+    return min_link, max_link
+
+def iv_range_unknown_link(base, stat, energy):
+    """
+    IV ranges for a wild Pokémon whose link is unknown (workbook rows 15 and 16).
+    base and stat have shape (..., 4); the link is narrowed to the range all four
+    stats agree on (G12:G13), the lowest IVs come from the highest possible link
+    and the highest IVs from the lowest one.
+    Returns (iv_min, iv_max, min_link, max_link); the links have shape (...).
+    """
+    base = np.asarray(base, dtype=np.int64)
+    stat = np.asarray(stat, dtype=np.int64)
+    energy = np.asarray(energy, dtype=np.int64)
+    min_links, max_links = link_range(base, stat, energy[..., None])
+    min_link = min_links.max(axis=-1)
+    max_link = max_links.min(axis=-1)
+    return (
+        iv_min(base, stat, max_link[..., None], energy[..., None]),
+        iv_max(base, stat, min_link[..., None], energy[..., None]),
+        min_link,
+        max_link,
+    )
+
+def screen(base, stat, links=LINK_LEVELS, energies=ENERGY_LEVELS):
+    """
+    Reverse calculation for every link and energy level at once.
+    base and stat have shape (..., 4); returns (iv_min, iv_max, possible) with
+    shape (..., len(links), len(energies), 4), where possible marks the
+    combinations under which the observed stat can actually occur (see
+    exact_iv_range).
+    """
+    base = np.asarray(base, dtype=np.int64)[..., None, None, :]
+    stat = np.asarray(stat, dtype=np.int64)[..., None, None, :]
+    link = np.asarray(links, dtype=np.int64)[:, None, None]
+    energy = np.asarray(energies, dtype=np.int64)[None, :, None]
+    return exact_iv_range(base, stat, link, energy)
+
+# ------------------------------------------------------------
+# Workbook access (plain zipfile + ElementTree, no spreadsheet library needed).
+# ------------------------------------------------------------
+SHEET_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+PACKAGE_REL_NS = {"r": "http://schemas.openxmlformats.org/package/2006/relationships"}
+
+def read_workbook(path=WORKBOOK_FILE):
+    """
+    Returns {sheet name: {cell ref: (formula or None, cached value)}}. Shared
+    formulas are only stored on their first cell; the others get formula None.
+    """
+    with zipfile.ZipFile(path) as xlsx:
+        strings = []
+        if "xl/sharedStrings.xml" in xlsx.namelist():
+            for item in ET.fromstring(xlsx.read("xl/sharedStrings.xml")).findall("m:si", SHEET_NS):
+                strings.append("".join(t.text or "" for t in item.iter(f"{{{SHEET_NS['m']}}}t")))
+        targets = {
+            rel.get("Id"): rel.get("Target")
+            for rel in ET.fromstring(xlsx.read("xl/_rels/workbook.xml.rels")).findall("r:Relationship", PACKAGE_REL_NS)
+        }
+        sheets = {}
+        for sheet in ET.fromstring(xlsx.read("xl/workbook.xml")).find("m:sheets", SHEET_NS):
+            cells = {}
+            root = ET.fromstring(xlsx.read("xl/" + targets[sheet.get(REL_NS)]))
+            for cell in root.iter(f"{{{SHEET_NS['m']}}}c"):
+                formula = cell.find("m:f", SHEET_NS)
+                value = cell.find("m:v", SHEET_NS)
+                value = value.text if value is not None else None
+                if cell.get("t") == "s" and value is not None:
+                    value = strings[int(value)]
+                cells[cell.get("r")] = (formula.text if formula is not None else None, value)
+            sheets[sheet.get("name")] = cells
+    return sheets
+
+def _number(cells, ref):
+    value = cells.get(ref, (None, None))[1]
+    return float(value) if value not in (None, "") else None
+
+def _percent(value):
+    return int(round(value * 100))
+
+def load_base_stats(path=WORKBOOK_FILE):
+    """
+    Returns {Pokémon name: [HP, Attack, Defence, Speed]} from the workbook's Pokemon List.
+    """
+    cells = read_workbook(path)[BASE_STATS_SHEET]
+    base_stats = {}
+    row = 2
+    while cells.get(f"A{row}", (None, None))[1]:
+        stats = [_number(cells, f"{column}{row}") for column in "BCDE"]
+        if None not in stats:
+            base_stats[cells[f"A{row}"][1]] = [int(s) for s in stats]
+        row += 1
+    return base_stats
+
+def verify(path=WORKBOOK_FILE):
+    """
+    Recomputes every result row of the calculator sheets from their inputs and
+    compares it with the value stored in the workbook.
+    Returns a list of (sheet, cell, expected, got) mismatches.
+    """
+    columns = "CDEF"
+    mismatches = []
+    for sheet_name, cells in read_workbook(path).items():
+        if sheet_name not in CALCULATOR_SHEETS:
+            continue
+        base = np.array([_number(cells, f"{c}3") for c in columns], dtype=np.int64)
+        stat = np.array([_number(cells, f"{c}8") for c in columns], dtype=np.int64)
+        link = _percent(_number(cells, "G3"))
+        energy = _percent(_number(cells, "H3"))
+        selected_iv = int(_number(cells, "G6"))
+        min_links, max_links = link_range(base, stat, energy)
+        wild_min_link, wild_max_link = int(min_links.max()), int(max_links.min())
+        # Each sheet's row 16 names the link cell it divides by; Sheet1 uses G13
+        # (the max link) where Sheets 2 and 3 use G12.
+        row16_link = wild_min_link if "$G$12" in (cells.get("C16", (None, None))[0] or "") else wild_max_link
+        expected_rows = {
+            4: stat_range(base, link, energy)[0],
+            5: stat_range(base, link, energy)[1],
+            6: stat_at_iv(base, selected_iv, link, energy),
+            9: iv_min(base, stat, link, energy),
+            10: iv_max(base, stat, link, energy),
+            12: min_links / 100,
+            13: max_links / 100,
+            15: iv_min(base, stat, wild_max_link, energy),
+            16: iv_max(base, stat, row16_link, energy),
+        }
+        checks = [(f"{c}{row}", values[i]) for row, values in expected_rows.items() for i, c in enumerate(columns)]
+        checks += [("G12", wild_min_link / 100), ("G13", wild_max_link / 100)]
+        for ref, got in checks:
+            expected = _number(cells, ref)
+            if expected is None or abs(expected - float(got)) > 1e-9:
+                mismatches.append((sheet_name, ref, expected, float(got)))
+    return mismatches
+
+def _format_range(low, high):
+    if low > high:
+        return "none"
+    return f"{low}-{high}" if low != high else f"{low}"
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Pokémon Conquest stat / IV calculator.")
+    arg_parser.add_argument("--workbook", default=WORKBOOK_FILE, help="IV calculator workbook (default: %(default)s)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("verify", help="check the formulas against the values stored in the workbook")
+    stats_parser = commands.add_parser("stats", help="min/max stats for a Pokémon at a link and energy")
+    stats_parser.add_argument("pokemon")
+    stats_parser.add_argument("--link", type=int, required=True, help="link in percent")
+    stats_parser.add_argument("--energy", type=int, default=100, help="energy in percent (default: %(default)s)")
+    ivs_parser = commands.add_parser("ivs", help="IV ranges from observed HP, Attack, Defence and Speed")
+    ivs_parser.add_argument("pokemon")
+    ivs_parser.add_argument("stats", type=int, nargs=4, metavar="STAT")
+    ivs_parser.add_argument("--link", type=int, help="link in percent (omit for a wild Pokémon)")
+    ivs_parser.add_argument("--energy", type=int, default=100, help="energy in percent (default: %(default)s)")
+    args = arg_parser.parse_args(argv)
+    # The reverse formulas divide by link and energy.
+    if args.command != "verify":
+        if args.energy <= 0:
+            arg_parser.error("--energy must be a positive percentage")
+        if args.link is not None and args.link <= 0:
+            arg_parser.error("--link must be a positive percentage")
+    if args.command == "ivs" and min(args.stats) < 0:
+        arg_parser.error("stats cannot be negative")
+
+    if args.command == "verify":
+        mismatches = verify(args.workbook)
+        for sheet_name, ref, expected, got in mismatches:
+            print(f"[FAIL] {sheet_name}!{ref}: workbook has {expected}, calculator gives {got}")
+        if mismatches:
+            return 1
+        print(f"[OK] All calculator sheets in {os.path.basename(args.workbook)} match")
+        return 0
+
+    base_stats = {name.lower(): stats for name, stats in load_base_stats(args.workbook).items()}
+    base = base_stats.get(args.pokemon.lower())
+    if base is None:
+        print(f"[ERROR] '{args.pokemon}' is not in the workbook's {BASE_STATS_SHEET}")
+        return 2
+    if min(base) <= 0:
+        print(f"[ERROR] '{args.pokemon}' has a base stat of 0 or less in the workbook's {BASE_STATS_SHEET}")
+        return 2
+    if args.command == "stats":
+        low, high = stat_range(base, args.link, args.energy)
+        for name, a, b in zip(STAT_NAMES, low, high):
+            print(f"{name:<8} {_format_range(a, b)}")
+        return 0
+    if args.link is not None:
+        low, high, _ = exact_iv_range(base, args.stats, args.link, args.energy)
+    else:
+        # Not the workbook's link_range / iv_range_unknown_link, whose bounds can come
+        # out too tight: every link level, kept if all four stats can occur at it.
+        links = LINK_LEVELS
+        lows, highs, possible = exact_iv_range(base, args.stats, links[:, None], args.energy)
+        possible = possible.all(axis=-1)
+        if possible.any():
+            links = links[possible]
+            low, high = lows[possible].min(axis=0), highs[possible].max(axis=0)
+            print(f"Link     {_format_range(links[0], links[-1])}%")
+        else:
+            low, high = np.full(4, MAX_IV + 1), np.zeros(4, dtype=np.int64)
+            print("Link     none")
+    for name, a, b in zip(STAT_NAMES, low, high):
+        print(f"{name:<8} IV {_format_range(a, b)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
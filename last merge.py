@@ -1,5 +1,10 @@
 import os
-from bs4 import BeautifulSoup
+
+import html_backends
+import instrumentation
+import output_optimizer
+import page_render
+import static_server
 
 # ============================================================
 # EDITABLE VARIABLES:
@@ -11,15 +16,8 @@ INPUT_FILES = [
     "/Users/nicholaschang/Helpful Scripts/conquest parse/swarm_pokemon.html",
 ]
 
-def merge_html_files(input_files, output_file):
-    """
-    Merges ALL content from each HTML file in the input file list into a single file.
-    Each file's raw HTML (including any <html>/<head>/<body> tags) is placed inside a <div>
-    in one big <body>. This preserves all data, though the resulting file may not be strictly
-    valid HTML if multiple <html> or <head> tags are present.
-    """
-    # 1) Start with a DOCTYPE + minimal skeleton
-    base_html = """<!DOCTYPE html>
+# 1) Start with a DOCTYPE + minimal skeleton
+SKELETON_HTML = """<!DOCTYPE html>
 <html>
 <head>
   <meta charset="UTF-8"/>
@@ -28,46 +26,54 @@ def merge_html_files(input_files, output_file):
 <body>
 </body>
 </html>"""
-    merged_soup = BeautifulSoup(base_html, "html.parser")
-    merged_body = merged_soup.body
 
+@instrumentation.instrumented("final_merge", name_arg=1)
+def merge_html_files(input_files, output_file, streaming=True):
+    """
+    Merges ALL content from each HTML file in the input file list into a single file.
+    Each file's raw HTML (including any <html>/<head>/<body> tags) is placed inside a <div>
+    in one big <body>. This preserves all data, though the resulting file may not be strictly
+    valid HTML if multiple <html> or <head> tags are present.
+
+    By default the merge is streamed: the skeleton header is written first, then
+    each file's wrapper <div> as soon as that file is parsed, then the footer, so
+    memory use is bounded by the largest single input. streaming=False builds the
+    whole merged tree in memory first; both produce byte-identical output.
+    With output_optimizer's mode on, the merged document is optimized before
+    it is written.
+    """
     # 2) Sort the list of input files (optional)
     input_files = sorted(input_files)
+    instrumentation.count("files", len(input_files))
+    instrumentation.lap("list")
 
-    # 3) Loop through each file and merge its content
-    for file_path in input_files:
-        if not os.path.isfile(file_path):
-            print(f"[WARNING] File not found: {file_path}")
-            continue
-
-        file_name = os.path.basename(file_path)
-        with open(file_path, 'r', encoding='utf-8') as f:
-            file_data = f.read()
-
-        # Create a wrapper <div> to hold the entire content of this file
-        wrapper_div = merged_soup.new_tag("div", **{"class": "merged-file"})
-
-        # Optional: Add comments to mark the start and end of each file's content
-        start_comment = merged_soup.new_string(f"<!-- START of {file_name} -->")
-        end_comment = merged_soup.new_string(f"<!-- END of {file_name} -->")
-        
-        wrapper_div.append(start_comment)
-        
-        # Parse the file’s HTML and append all its top-level elements
-        file_soup = BeautifulSoup(file_data, "html.parser")
-        for child in file_soup.contents:
-            wrapper_div.append(child)
-        
-        wrapper_div.append(end_comment)
-        merged_body.append(wrapper_div)
-
-    # 4) Write the merged HTML to the output file
-    with open(output_file, 'w', encoding='utf-8') as out:
-        out.write(str(merged_soup))
+    # 3) Merge each file's content and write the merged HTML to the output file
+    if output_optimizer.enabled():
+        chunks = page_render.iter_merged_chunks(input_files, SKELETON_HTML, output_file)
+        output_optimizer.write_optimized(output_file, chunks)
+        instrumentation.lap("write")
+    elif streaming:
+        with open(output_file, 'w', encoding='utf-8') as out:
+            for chunk in page_render.iter_merged_chunks(input_files, SKELETON_HTML, output_file):
+                instrumentation.lap("build")
+                out.write(chunk)
+                instrumentation.lap("write")
+    else:
+        merged_soup = html_backends.parse_fragment(SKELETON_HTML)
+        merged_body = merged_soup.body
+        for file_path, file_data in page_render.read_input_files(input_files):
+            prefix = page_render.link_prefix(file_path, output_file)
+            merged_body.append(page_render.build_wrapper_div(merged_soup, os.path.basename(file_path), file_data, prefix))
+        instrumentation.lap("build")
+        with open(output_file, 'w', encoding='utf-8') as out:
+            out.write(str(merged_soup))
+        instrumentation.lap("write")
 
     print(f"[INFO] Successfully merged {len(input_files)} files into: {output_file}")
 
 if __name__ == "__main__":
     print("Merging HTML files...")
     merge_html_files(INPUT_FILES, OUTPUT_FILE)
+    # Compressed copies for static_server.py, so it never compresses on request.
+    static_server.precompress_file(OUTPUT_FILE)
     print(f"Done! Created merged file: {OUTPUT_FILE}")
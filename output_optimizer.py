@@ -0,0 +1,335 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from bs4 import Doctype, NavigableString, Tag
+
+import build_cache
+import html_backends
+import static_server
+import trainer_annotations
+
+# ============================================================
+# Optimized output mode for the generated pages and the merged documents.
+#
+# The default output keeps every page self-contained: each table, <h3> and
+# spacer <div> carries its inline style, each page has its own copy of the
+# Trainers <script>, and a merge keeps every page's <head> (so all_pokemon.html
+# ends up with 19 <title>s and 19 scripts in its body). With the mode on, a
+# page or merge is written as:
+#   - the known inline styles (SHARED_STYLES) replaced by classes from one
+#     shared stylesheet, conquest.<hash>.css, which also stands in for the
+#     repeated presentational attributes (img border="0")
+#   - each Trainers <script> replaced by a data-trainers-page attribute on the
+#     element it handled, and one shared conquest.<hash>.js for all of them
+#     (trainer_annotations.shared_script)
+#   - the <head> of every merged page dropped (stylesheets it links are kept
+#     once in the document's own <head>), along with its <html>/<body> tags
+#   - whitespace between tags dropped and runs of whitespace collapsed,
+#     except in <script>, <style>, <pre>, <textarea> and editable cells
+#   - .gz (and .br, with brotli installed) siblings from static_server
+# The shared files are written next to the page, named by their content, so
+# static_server can cache them forever. Each file's size before and after and
+# its compressed sizes are printed (with --compare, the CLI also prints the
+# gzip size of the unoptimized file and the parse time before and after,
+# which cost several extra parses per file). Turn the mode on with
+# CONQUEST_OPTIMIZE=1 in the environment (inherited by worker processes),
+# enable(), or build.py --optimize. Already written files can be optimized
+# in place:
+#     python output_optimizer.py all_pokemon.html conquest_locations/*.html
+#
+# Optimized merges cannot be patched block by block, so watch.py merges in
+# full while the mode is on.
+# ============================================================
+ENV_VAR = "CONQUEST_OPTIMIZE"
+OPTIMIZER_VERSION = 1  # Bump when the optimized output changes, to invalidate the build cache.
+ASSET_PREFIX = "conquest."
+
+# Inline style (normalized: lowercase, no spaces, no trailing ";") -> class.
+SHARED_STYLES = {
+    "border-collapse:collapse": "c-table",
+    "margin-bottom:5px": "c-area",
+    "margin-bottom:20px": "c-gap",
+    "max-width:50px;height:auto": "c-art",
+    "width:60px": "c-pic",
+    "color:red": "c-error",
+}
+# Presentational attributes dropped from every tag; the rule in the shared
+# stylesheet does the same.
+SHARED_ATTRIBUTES = {
+    ("img", "border", "0"): "img{border:0}",
+}
+
+SHARED_ASSET_RE = re.compile(r"(?:^|/)conquest\.[0-9a-f]{12}\.(?:css|js)$")
+# The page name in a trainer_annotations.localstorage_script.
+TRAINERS_PAGE_RE = re.compile(r"const page = (\"(?:[^\"\\]|\\.)*\");\s*const storeKey = '"
+                              + re.escape(trainer_annotations.STORAGE_PREFIX) + "'")
+WHITESPACE_RE = re.compile(r"\s+")
+# Whitespace-only text directly inside these is never rendered...
+STRUCTURE_TAGS = {"[document]", "html", "head", "table", "thead", "tbody", "tfoot", "tr", "ul", "ol"}
+# ...nor inside these when it is at either end or next to another of them.
+BLOCK_TAGS = {"body", "div", "table", "tr", "td", "th", "h1", "h2", "h3", "p", "li", "br",
+              "title", "meta", "link", "script", "style"}
+PRESERVE_TAGS = {"script", "style", "pre", "textarea"}
+DOCUMENT_TAGS = ("html", "head", "body")
+
+def enable():
+    """
+    Turns the mode on for this process and any worker processes it starts.
+    """
+    os.environ[ENV_VAR] = "1"
+
+def enabled():
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+def fingerprint():
+    """
+    Identifies the optimized output (None while the mode is off), for build fingerprints.
+    """
+    return OPTIMIZER_VERSION if enabled() else None
+
+def shared_stylesheet():
+    return ("".join(f".{name}{{{style}}}\n" for style, name in SHARED_STYLES.items())
+            + "".join(f"{rule}\n" for rule in SHARED_ATTRIBUTES.values()))
+
+def asset_name(text, ext):
+    return f"{ASSET_PREFIX}{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}.{ext}"
+
+def shared_assets(directory):
+    """
+    The paths of the shared files (of any build) in directory.
+    """
+    return sorted(path for path in glob.glob(os.path.join(glob.escape(directory), ASSET_PREFIX + "*"))
+                  if SHARED_ASSET_RE.search(os.path.basename(path)))
+
+def write_shared_assets(directory):
+    """
+    Writes the shared stylesheet and script into directory (if not there yet)
+    and drops those of earlier builds. Returns their file names.
+    """
+    names = []
+    for text, ext in ((shared_stylesheet(), "css"), (trainer_annotations.shared_script(), "js")):
+        name = asset_name(text, ext)
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            build_cache.write_atomic(path, text)
+        names.append(name)
+    for path in shared_assets(directory):
+        if os.path.basename(path) not in names:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another worker got to it first.
+    return names
+
+def _normalize_style(style):
+    return WHITESPACE_RE.sub("", style).lower().rstrip(";")
+
+def _owner(tag, roots):
+    """
+    The element a tag's contents end up in once the nested <html>/<head>/<body>
+    tags of merged pages are gone (as a browser treats them).
+    """
+    while tag.parent is not None and tag.name in DOCUMENT_TAGS and not any(tag is root for root in roots):
+        tag = tag.parent
+    return tag
+
+def _replace_scripts(soup, roots):
+    """
+    Replaces each Trainers script with a data-trainers-page attribute on the
+    element it handled, and drops links to the shared script. Returns True if
+    any page needs the shared script.
+    """
+    uses_script = False
+    for script in soup.find_all("script"):
+        if script.get("src"):
+            if SHARED_ASSET_RE.search(script["src"]):
+                script.decompose()
+            continue
+        match = TRAINERS_PAGE_RE.search(script.string or "")
+        if not match:
+            continue
+        owner = _owner(script.parent, roots)
+        page = json.loads(match.group(1))
+        if owner.get("data-trainers-page", page) != page:
+            continue  # Two pages in one element: keep this one's script.
+        owner["data-trainers-page"] = page
+        script.decompose()
+        uses_script = True
+    return uses_script or soup.find(attrs={"data-trainers-page": True}) is not None
+
+def _flatten_documents(soup, roots, head):
+    """
+    Drops the doctype and <head> of every merged page (keeping stylesheets
+    other than the shared one, once, in head) and unwraps its <html> and <body>, moving their
+    attributes onto the element that takes their place. Returns True if a
+    link to the shared stylesheet was dropped (the pages were optimized).
+    """
+    linked = {link.get("href") for link in head.find_all("link")}
+    shared_linked = False
+    # Only the document's own doctype stays; those of the merged pages go with their <html>.
+    for doctype in soup.find_all(string=lambda text: isinstance(text, Doctype)):
+        if doctype is not soup.contents[0]:
+            doctype.extract()
+    for tag in soup.find_all(DOCUMENT_TAGS):
+        if any(tag is root for root in roots):
+            continue
+        if tag.name == "head":
+            for link in tag.find_all("link", rel="stylesheet", href=True):
+                if SHARED_ASSET_RE.search(link["href"]):
+                    shared_linked = True
+                elif link["href"] not in linked:
+                    linked.add(link["href"])
+                    head.append(link.extract())
+            tag.decompose()
+            continue
+        owner = _owner(tag.parent, roots)
+        for name, value in tag.attrs.items():
+            owner.attrs.setdefault(name, value)
+        tag.unwrap()
+    for link in head.find_all("link", href=SHARED_ASSET_RE):
+        link.decompose()
+        shared_linked = True
+    return shared_linked
+
+def _replace_styles(soup):
+    """
+    Moves every SHARED_STYLES inline style into its class and drops the
+    SHARED_ATTRIBUTES. Returns True if any was found.
+    """
+    used = False
+    for tag_name, attribute, value in SHARED_ATTRIBUTES:
+        for tag in soup.find_all(tag_name, attrs={attribute: value}):
+            del tag[attribute]
+            used = True
+    for tag in soup.find_all(style=True):
+        name = SHARED_STYLES.get(_normalize_style(tag["style"]))
+        if name is None:
+            continue
+        del tag["style"]
+        classes = tag.get("class") or []
+        tag["class"] = (classes.split() if isinstance(classes, str) else list(classes)) + [name]
+        used = True
+    return used
+
+def _droppable(text):
+    """
+    True if a whitespace-only text node does not show up on the page.
+    """
+    if text.parent.name in STRUCTURE_TAGS:
+        return True
+    if text.parent.name not in BLOCK_TAGS:
+        return False
+    return all(sibling is None or (isinstance(sibling, Tag) and sibling.name in BLOCK_TAGS)
+               for sibling in (text.previous_sibling, text.next_sibling))
+
+def _minify(soup):
+    for text in soup.find_all(string=True):
+        if type(text) is not NavigableString:
+            continue  # Comments, the doctype, ...
+        if any(parent.name in PRESERVE_TAGS or parent.has_attr("contenteditable")
+               for parent in text.parents if parent.name != "[document]"):
+            continue
+        if not text.strip():
+            if _droppable(text):
+                text.extract()
+            elif text != " ":
+                text.replace_with(" ")
+            continue
+        collapsed = WHITESPACE_RE.sub(" ", text)
+        if collapsed != text:
+            text.replace_with(collapsed)
+
+def optimize_html(text, asset_dir):
+    """
+    Returns the optimized form of a page or merged document whose shared
+    files are (and are written) in asset_dir.
+    """
+    soup = html_backends.parse_fragment(text)
+    root_html = soup.find("html")
+    if root_html is None:
+        return text
+    head = root_html.find("head", recursive=False)
+    if head is None:
+        head = soup.new_tag("head")
+        root_html.insert(0, head)
+    body = root_html.find("body", recursive=False)
+    roots = [root_html, head] + ([body] if body is not None else [])
+
+    uses_script = _replace_scripts(soup, roots)
+    uses_styles = _flatten_documents(soup, roots, head)
+    uses_styles = _replace_styles(soup) or uses_styles
+    css_name, js_name = write_shared_assets(asset_dir)
+    if uses_styles:
+        head.append(soup.new_tag("link", rel="stylesheet", href=css_name))
+    if uses_script:
+        head.append(soup.new_tag("script", src=js_name, defer=None))
+    _minify(soup)
+    return str(soup)
+
+def _parse_seconds(text, repeat=3):
+    """
+    Best of repeat html.parser parses of text, in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html_backends.parse_fragment(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _kb(size):
+    return f"{size / 1024:.1f} KB"
+
+def write_optimized(path, chunks, compare=False):
+    """
+    Optimizes the rendered chunks of a page or merge (one tree, so the whole
+    document), writes them to path (with the shared files and compressed
+    siblings next to it) and reports the sizes. compare also reports the
+    unoptimized gzip size and parse times, at the cost of extra parses.
+    Returns the hex SHA-256 of the written file.
+    """
+    text = "".join(chunks)
+    before = len(text.encode("utf-8"))
+    optimized = optimize_html(text, os.path.dirname(os.path.abspath(path)))
+    data = optimized.encode("utf-8")
+    build_cache.write_atomic(path, data)
+    static_server.precompress_file(path)
+
+    after = len(data)
+    compressed = [f"{suffix[1:]} {_kb(os.path.getsize(path + suffix))}"
+                  for _, suffix in static_server.ENCODINGS if os.path.isfile(path + suffix)]
+    timing = ""
+    if compare:
+        # What gzip alone would have made of the unoptimized page, for comparison.
+        compressed.append(f"unoptimized gz {_kb(len(gzip.compress(text.encode('utf-8'), compresslevel=9, mtime=0)))}")
+        timing = f", parse {_parse_seconds(text) * 1000:.1f} -> {_parse_seconds(optimized) * 1000:.1f} ms"
+    print(f"[INFO] Optimized {os.path.basename(path)}: {_kb(before)} -> {_kb(after)} "
+          f"({(after - before) * 100 / max(before, 1):+.0f}%"
+          + (f"; {', '.join(compressed)}" if compressed else "") + ")" + timing)
+    return build_cache.bytes_digest(data)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Optimize generated or merged pages in place.")
+    arg_parser.add_argument("files", nargs="+", help="HTML files to rewrite")
+    arg_parser.add_argument("--compare", action="store_true",
+                            help="also report the unoptimized gzip size and the parse time before and after")
+    args = arg_parser.parse_args(argv)
+
+    for path in args.files:
+        if not os.path.isfile(path):
+            print(f"[ERROR] File not found: {path}")
+            return 1
+        with open(path, "r", encoding="utf-8") as f:
+            write_optimized(path, [f.read()], args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
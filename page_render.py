@@ -0,0 +1,257 @@
+import functools
+import hashlib
+import os
+import pathlib
+import posixpath
+import re
+import urllib.parse
+from html import escape
+from bs4 import NavigableString
+
+import build_cache
+import html_backends
+import output_optimizer
+
+# ============================================================
+# Streaming renderer shared by the generated pages (location, swarm and
+# universal) and the merged outputs (merger / last merge).
+#
+# A Template is compiled once into its literal text and {{name}} slots.
+# Rendering yields the text chunk by chunk; a slot's value may be a string or
+# any iterable of strings (e.g. a generator yielding one table row at a time),
+# which is consumed only as the output reaches it. write() sends every chunk
+# straight to an open file, so a page is never held in memory as a whole and
+# the file is written from the first chunk on.
+# ============================================================
+SLOT_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+class Template:
+    def __init__(self, source):
+        # Literal text and slot names, alternating; always starts and ends with text.
+        self.parts = SLOT_RE.split(source)
+        self.slots = self.parts[1::2]
+
+    @classmethod
+    def around(cls, before, slot, after):
+        """
+        A template of literal text (taken as is, braces and all) around one slot.
+        """
+        template = cls("")
+        template.parts = [before, slot, after]
+        template.slots = [slot]
+        return template
+
+    def iter_render(self, **values):
+        """
+        Yields the rendered text in chunks. Every slot needs a value.
+        """
+        missing = [slot for slot in self.slots if slot not in values]
+        if missing:
+            raise KeyError(f"No value for template slot(s): {', '.join(missing)}")
+        for position, part in enumerate(self.parts):
+            if position % 2 == 0:
+                if part:
+                    yield part
+                continue
+            value = values[part]
+            if isinstance(value, str):
+                yield value
+            else:
+                yield from value
+
+    def render(self, **values):
+        return "".join(self.iter_render(**values))
+
+    def write(self, out, **values):
+        """
+        Writes the rendered text, UTF-8 encoded, to a binary file as it is
+        produced. Returns the hex SHA-256 of everything written.
+        """
+        digest = hashlib.sha256()
+        for chunk in self.iter_render(**values):
+            data = chunk.encode("utf-8")
+            digest.update(data)
+            out.write(data)
+        return digest.hexdigest()
+
+    def write_file(self, path, **values):
+        """
+        Renders into path (optimized, if output_optimizer's mode is on).
+        Returns the hex SHA-256 of the file's contents.
+        """
+        if output_optimizer.enabled():
+            return output_optimizer.write_optimized(path, self.iter_render(**values))
+        with open(path, "wb") as out:
+            return self.write(out, **values)
+
+# The generated location/swarm page. head goes right after <title> (e.g.
+# asset_store.stylesheet_link()); body and script go inside <body>.
+PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+  <title>{{title}}</title>{{head}}
+</head>
+<body>
+  <h1>{{heading}}</h1>
+  {{body}}
+  {{script}}
+</body>
+</html>
+""")
+
+TABLE_ATTRS = 'border="1" cellpadding="5" cellspacing="0" style="border-collapse:collapse;"'
+
+def iter_table_html(headers, rows, row_keys=None, table_attrs=TABLE_ATTRS, header_attrs=None):
+    """
+    Yields an HTML table with the provided headers and rows, one row per chunk.
+    The final column (Trainers) is contenteditable; with row_keys (see
+    pokemon_store.annotation_keys), each Trainers cell carries its row's key so
+    saved notes follow the row, not its position. header_attrs maps a header
+    to extra attributes for its <th> (e.g. {"Pic": " style='width:60px;'"}).
+    """
+    header_attrs = header_attrs or {}
+    yield (f"<table {table_attrs}>\n<thead><tr>"
+           + "".join(f"\n<th{header_attrs.get(head, '')}>{head}</th>" for head in headers)
+           + "\n</tr></thead>\n<tbody>")
+    for row_index, row in enumerate(rows):
+        html = ["\n<tr>"]
+        for col_index, cell in enumerate(row):
+            if col_index == len(row) - 1:
+                key_attr = f' data-key="{escape(row_keys[row_index])}"' if row_keys else ""
+                html.append(f'\n<td contenteditable="true" class="trainers-col"{key_attr}>{cell}</td>')
+            else:
+                html.append(f"\n<td>{cell}</td>")
+        html.append("\n</tr>")
+        yield "".join(html)
+    yield "\n</tbody>\n</table>"
+
+def table_html(headers, rows, row_keys=None, table_attrs=TABLE_ATTRS, header_attrs=None):
+    return "".join(iter_table_html(headers, rows, row_keys, table_attrs, header_attrs))
+
+def read_input_files(file_paths):
+    """
+    Yields (file_path, file_data) for each existing file, one at a time,
+    warning about (and skipping) any that are missing.
+    """
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            print(f"[WARNING] File not found: {file_path}")
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield file_path, f.read()
+
+def link_prefix(file_path, output_file):
+    """
+    The directory of file_path relative to that of output_file, as a URL path
+    ("" when they are the same, or when there is no relative path).
+    """
+    try:
+        relative = os.path.relpath(os.path.dirname(os.path.abspath(file_path)),
+                                   os.path.dirname(os.path.abspath(output_file)))
+    except ValueError:
+        return ""
+    return "" if relative == os.curdir else pathlib.PurePath(relative).as_posix()
+
+def rebase_links(file_soup, prefix):
+    """
+    Rewrites the relative <link href>s (e.g. the atlas stylesheet) of a page
+    being merged, so they resolve from the merged document, which is prefix
+    away from the page.
+    """
+    for link in file_soup.find_all("link", href=True):
+        href = link["href"]
+        parts = urllib.parse.urlsplit(href)
+        if parts.scheme or parts.netloc or href.startswith(("/", "#")):
+            continue
+        link["href"] = posixpath.normpath(posixpath.join(prefix, href))
+
+def build_wrapper_div(soup, file_name, file_data, prefix=""):
+    """
+    Parses one file's raw HTML and returns a <div class="merged-file"> (created in
+    the given soup) holding all of its top-level elements between START/END markers.
+    prefix (see link_prefix) is where the file is relative to the merged
+    document; its relative links are rebased by it.
+    """
+    # Create a wrapper <div> to hold the entire content of this file
+    wrapper_div = soup.new_tag("div", **{"class": "merged-file"})
+
+    # Optional: Add comments to mark the start and end of each file's content
+    start_comment = soup.new_string(f"<!-- START of {file_name} -->")
+    end_comment = soup.new_string(f"<!-- END of {file_name} -->")
+
+    wrapper_div.append(start_comment)
+
+    # Parse the file’s HTML and append all its top-level elements.
+    # Whitespace-only text between them is dropped, so the result does not
+    # depend on which parser backend kept or discarded it.
+    file_soup = html_backends.make_soup(file_data)
+    if prefix:
+        rebase_links(file_soup, prefix)
+    for child in list(file_soup.contents):
+        if type(child) is NavigableString and not child.strip():
+            continue
+        wrapper_div.append(child)
+
+    wrapper_div.append(end_comment)
+    return wrapper_div
+
+def wrapper_markers(file_name):
+    """
+    Returns how the start and the end of file_name's wrapper <div> appear in a
+    serialized merged document.
+    """
+    start = '<div class="merged-file">' + NavigableString(f"<!-- START of {file_name} -->").output_ready()
+    end = NavigableString(f"<!-- END of {file_name} -->").output_ready() + "</div>"
+    return start, end
+
+def patch_merged_file(merged_path, file_path):
+    """
+    Replaces file_path's wrapper <div> in an already merged document with one
+    built from the file's current contents; the rest of the document is kept
+    byte for byte, so the result equals a full merge. Returns False (and writes
+    nothing) if the document has no block for the file.
+    """
+    file_name = os.path.basename(file_path)
+    start_marker, end_marker = wrapper_markers(file_name)
+    with open(merged_path, "r", encoding="utf-8") as f:
+        merged = f.read()
+    start = merged.find(start_marker)
+    end = merged.find(end_marker, start)
+    if start < 0 or end < 0:
+        return False
+    with open(file_path, "r", encoding="utf-8") as f:
+        wrapper = str(build_wrapper_div(html_backends.parse_fragment(""), file_name, f.read(),
+                                        link_prefix(file_path, merged_path)))
+    build_cache.write_atomic(merged_path, merged[:start] + wrapper + merged[end + len(end_marker):])
+    return True
+
+@functools.lru_cache(maxsize=None)
+def merged_template(skeleton_html):
+    """
+    Compiles a merge skeleton into a Template whose {{files}} slot sits at the
+    end of <body>. The skeleton is serialized once, exactly as the non-streaming
+    merge would, so both produce the same bytes.
+    """
+    placeholder = "@@MERGED-FILES@@"
+    skeleton = html_backends.parse_fragment(skeleton_html)
+    skeleton.body.append(skeleton.new_string(placeholder))
+    header, footer = str(skeleton).split(placeholder)
+    return Template.around(header, "files", footer)
+
+def iter_wrapper_divs(file_paths, output_file):
+    """
+    Yields one serialized wrapper <div> per file, for the merged document
+    output_file. Only one input file's soup is alive at a time.
+    """
+    for file_path, file_data in read_input_files(file_paths):
+        yield str(build_wrapper_div(html_backends.parse_fragment(""), os.path.basename(file_path), file_data,
+                                    link_prefix(file_path, output_file)))
+
+def iter_merged_chunks(file_paths, skeleton_html, output_file):
+    """
+    Yields the merged document output_file piece by piece: the skeleton up to
+    the end of <body>, then one serialized wrapper <div> per file, then the
+    closing tags.
+    """
+    return merged_template(skeleton_html).iter_render(files=iter_wrapper_divs(file_paths, output_file))
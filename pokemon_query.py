@@ -0,0 +1,355 @@
+import argparse
+import bisect
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+import pokemon_store
+
+# ============================================================
+# In-memory query engine over the parsed Pokémon rows, for questions like
+# "every Water type with Speed >= 4 and Movement >= 4" without searching the
+# merged HTML by hand.
+#
+# Rows are numbered 0..n-1 and every index is a bitmap (a Python int with bit i
+# set for row i), so predicates combine with & and counting is bit_count():
+#   numeric columns  sorted distinct values plus, for each, the bitmap of rows
+#                    with a value >= it; any range is two bisects and one &~
+#   set columns      value -> bitmap (type, location, area, name, ...)
+# Sorting walks the sort column's values in order, so top-k only looks at as
+# many value buckets as it needs.
+#
+#     python pokemon_query.py type=water "speed>=4" "movement>=4" --sort speed --desc --limit 10
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(SCRIPT_DIR, pokemon_store.STORE_NAME)
+
+NUMERIC_COLUMNS = ["dex_no", "hp", "attack", "defence", "speed", "movement", "area_level"]
+# Set column -> record field; list fields index every item.
+SET_COLUMNS = {
+    "source": "source",
+    "location": "location",
+    "area": "area",
+    "name": "name",
+    "type": "types",
+    "ability": "abilities",
+    "nation": "nation",
+}
+COLUMNS = NUMERIC_COLUMNS + list(SET_COLUMNS)
+OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "in"]
+
+PREDICATE_RE = re.compile(r"^\s*([a-z_]+)\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*$", re.IGNORECASE)
+NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+
+# Bits set in each byte value, lowest first.
+_BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+class QueryError(ValueError):
+    pass
+
+def _bitmap(row_ids, size):
+    bits = bytearray((size + 7) // 8)
+    for row_id in row_ids:
+        bits[row_id >> 3] |= 1 << (row_id & 7)
+    return int.from_bytes(bits, "little")
+
+def iter_bits(mask):
+    """
+    Yields the set bit positions of mask in ascending order. Only non-zero bytes
+    are visited, so sparse masks over millions of rows stay cheap.
+    """
+    if not mask:
+        return
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for match in NONZERO_BYTE_RE.finditer(data):
+        base = match.start() * 8
+        for bit in _BYTE_BITS[data[match.start()]]:
+            yield base + bit
+
+def _normalize(value):
+    return value.strip().lower() if isinstance(value, str) else value
+
+class NumericIndex:
+    """
+    Sorted-value index over one integer column. Rows whose value is None are
+    only matched by "!=".
+    """
+
+    def __init__(self, values):
+        buckets = {}
+        for row_id, value in enumerate(values):
+            if value is not None:
+                buckets.setdefault(value, []).append(row_id)
+        self.keys = sorted(buckets)
+        self.buckets = [_bitmap(buckets[key], len(values)) for key in self.keys]
+        # at_least[i] = rows with a value >= keys[i]; one extra 0 at the end.
+        self.at_least = [0] * (len(self.keys) + 1)
+        for i in range(len(self.keys) - 1, -1, -1):
+            self.at_least[i] = self.at_least[i + 1] | self.buckets[i]
+        self.present = self.at_least[0]
+
+    def tiled(self, repeat):
+        tiled = copy.copy(self)
+        tiled.buckets = [bucket * repeat for bucket in self.buckets]
+        tiled.at_least = [mask * repeat for mask in self.at_least]
+        tiled.present = tiled.at_least[0]
+        return tiled
+
+    def range(self, low=None, high=None):
+        """
+        Bitmap of rows with low <= value <= high (either bound may be None).
+        """
+        start = 0 if low is None else bisect.bisect_left(self.keys, low)
+        stop = len(self.keys) if high is None else bisect.bisect_right(self.keys, high)
+        if start >= stop:
+            return 0
+        return self.at_least[start] & ~self.at_least[stop]
+
+    def match(self, op, value):
+        if op == "=":
+            return self.range(value, value)
+        if op == "!=":
+            return ~self.range(value, value)
+        if op == "<":
+            return self.range(None, value - 1)
+        if op == "<=":
+            return self.range(None, value)
+        if op == ">":
+            return self.range(value + 1, None)
+        if op == ">=":
+            return self.range(value, None)
+        raise QueryError(f"Operator '{op}' is not supported on numeric columns")
+
+    def ordered_buckets(self, descending=False):
+        """
+        Yields the value buckets in sort order; rows without a value come last.
+        """
+        order = range(len(self.keys) - 1, -1, -1) if descending else range(len(self.keys))
+        for i in order:
+            yield self.buckets[i]
+        yield ~self.present
+
+class SetIndex:
+    """
+    Value -> bitmap index over a text column (or each item of a list column).
+    """
+
+    def __init__(self, values):
+        rows_by_value = {}
+        for row_id, value in enumerate(values):
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                rows_by_value.setdefault(_normalize(item), []).append(row_id)
+        self.bitmaps = {value: _bitmap(row_ids, len(values)) for value, row_ids in rows_by_value.items()}
+
+    def tiled(self, repeat):
+        tiled = copy.copy(self)
+        tiled.bitmaps = {value: mask * repeat for value, mask in self.bitmaps.items()}
+        return tiled
+
+    def match(self, op, value):
+        if op == "in":
+            mask = 0
+            for item in value:
+                mask |= self.bitmaps.get(_normalize(item), 0)
+            return mask
+        if op == "=":
+            return self.bitmaps.get(_normalize(value), 0)
+        if op == "!=":
+            return ~self.bitmaps.get(_normalize(value), 0)
+        raise QueryError(f"Operator '{op}' is not supported on text columns")
+
+class PokemonIndex:
+    """
+    Indexed, read-only view of a list of Pokémon records (dicts with the
+    pokemon_store.row_record fields plus source, location and area).
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.size = len(records)
+        self.all_rows = (1 << self.size) - 1
+        self.numeric = {column: NumericIndex([r.get(column) for r in records]) for column in NUMERIC_COLUMNS}
+        self.sets = {column: SetIndex([r.get(field) for r in records]) for column, field in SET_COLUMNS.items()}
+
+    @classmethod
+    def from_store(cls, db_path=DEFAULT_STORE):
+        """
+        Loads every row of the SQLite store written by the parser scripts.
+        """
+        if not os.path.isfile(db_path):
+            raise FileNotFoundError(f"Store not found: {db_path}")
+        conn = pokemon_store.connect(db_path)
+        try:
+            rows = conn.execute(
+                """SELECT pages.source, pokemon.* FROM pokemon
+                   JOIN areas ON areas.area_id = pokemon.area_id
+                   JOIN pages ON pages.page_id = areas.page_id
+                   ORDER BY pokemon.pokemon_id"""
+            ).fetchall()
+        finally:
+            conn.close()
+        records = []
+        for row in rows:
+            record = {column: row[column] for column in ["source", "location", "area", "name"] + NUMERIC_COLUMNS}
+            record["types"] = row["types"].split()
+            record["abilities"] = [a for a in row["abilities"].split(", ") if a]
+            record["nation"] = [n for n in row["nation"].split(", ") if n]
+            records.append(record)
+        return cls(records)
+
+    @classmethod
+    def from_tables(cls, tables):
+        """
+        Builds the index straight from parsed tables, without a store.
+        tables is a list of (source, location, headers, areas) with areas as
+        returned by the parsers: a list of (area_name, status, rows).
+        """
+        records = []
+        for source, location, headers, areas in tables:
+            for area_name, _, rows in areas:
+                for row in rows:
+                    record = pokemon_store.row_record(headers, row)
+                    record.update(source=source, location=location, area=area_name)
+                    records.append(record)
+        return cls(records)
+
+    def tiled(self, factor):
+        """
+        Returns an index over the records repeated factor times (for load testing).
+        Multiplying an n-bit bitmap by 1 + 2**n + 2**2n + ... lays factor copies
+        of it side by side, so no index has to be rebuilt row by row.
+        """
+        repeat = ((1 << (self.size * factor)) - 1) // ((1 << self.size) - 1) if self.size else 0
+        tiled = copy.copy(self)
+        tiled.records = self.records * factor
+        tiled.size = self.size * factor
+        tiled.all_rows = (1 << tiled.size) - 1
+        tiled.numeric = {column: index.tiled(repeat) for column, index in self.numeric.items()}
+        tiled.sets = {column: index.tiled(repeat) for column, index in self.sets.items()}
+        return tiled
+
+    def mask(self, where=()):
+        """
+        Bitmap of the rows matching every (column, op, value) predicate in where.
+        """
+        mask = self.all_rows
+        for column, op, value in where:
+            if column in self.numeric:
+                matched = self.numeric[column].match(op, value)
+            elif column in self.sets:
+                matched = self.sets[column].match(op, value)
+            else:
+                raise QueryError(f"Unknown column '{column}'. Choose from: {', '.join(COLUMNS)}")
+            mask &= matched
+            if not mask:
+                break
+        return mask
+
+    def count(self, where=()):
+        return self.mask(where).bit_count()
+
+    def select_ids(self, where=(), order_by=None, descending=False, limit=None):
+        """
+        Returns the matching row numbers, sorted by the numeric column order_by
+        (ties and unsorted results in row order), at most limit of them.
+        """
+        mask = self.mask(where)
+        if order_by is None:
+            buckets = [mask]
+        elif order_by in self.numeric:
+            buckets = self.numeric[order_by].ordered_buckets(descending)
+        else:
+            raise QueryError(f"Can only sort by a numeric column: {', '.join(NUMERIC_COLUMNS)}")
+        row_ids = []
+        for bucket in buckets:
+            if limit is not None and len(row_ids) >= limit:
+                break
+            for row_id in iter_bits(bucket & mask):
+                if limit is not None and len(row_ids) >= limit:
+                    break
+                row_ids.append(row_id)
+        return row_ids
+
+    def select(self, where=(), order_by=None, descending=False, limit=None):
+        """
+        Like select_ids, but returns the records themselves.
+        """
+        return [self.records[row_id] for row_id in self.select_ids(where, order_by, descending, limit)]
+
+def parse_predicate(text):
+    """
+    Parses "speed>=4", "type=water" or "type=water,ice" into (column, op, value).
+    A comma-separated value on a text column means "any of".
+    """
+    match = PREDICATE_RE.match(text)
+    if not match:
+        raise QueryError(f"Cannot parse predicate '{text}' (expected e.g. speed>=4 or type=water)")
+    column, op, value = match.group(1).lower(), match.group(2), match.group(3)
+    if column in NUMERIC_COLUMNS:
+        if not value.lstrip("-").isdigit():
+            raise QueryError(f"'{column}' needs a whole number, got '{value}'")
+        return column, op, int(value)
+    if column in SET_COLUMNS:
+        if op == "=" and "," in value:
+            return column, "in", [item for item in value.split(",") if item.strip()]
+        return column, op, value
+    raise QueryError(f"Unknown column '{column}'. Choose from: {', '.join(COLUMNS)}")
+
+def format_record(record):
+    types = "/".join(record["types"])
+    stats = " ".join(f"{column}={record[column]}" for column in ["hp", "attack", "defence", "speed", "movement"])
+    level = f" lvl {record['area_level']}" if record.get("area_level") is not None else ""
+    return f"#{record['dex_no'] or '?':>3} {record['name']:<12} {types:<16} {stats}  {record['location']} / {record['area']}{level}"
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Query the parsed Pokémon rows, e.g.: type=water 'speed>=4' 'movement>=4' --sort speed --desc"
+    )
+    arg_parser.add_argument("predicates", nargs="*", help=f"column<op>value with op one of = != < <= > >=; "
+                                                          f"columns: {', '.join(COLUMNS)}")
+    arg_parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite store to load (default: %(default)s)")
+    arg_parser.add_argument("--sort", choices=NUMERIC_COLUMNS, help="numeric column to sort by")
+    arg_parser.add_argument("--desc", action="store_true", help="sort in descending order")
+    arg_parser.add_argument("--limit", type=int, help="return at most this many rows")
+    arg_parser.add_argument("--count", action="store_true", help="only print the number of matching rows")
+    arg_parser.add_argument("--json", action="store_true", help="print the matching rows as JSON")
+    arg_parser.add_argument("--tile", type=int, default=1, help="repeat the rows this many times (load testing)")
+    arg_parser.add_argument("--time", action="store_true", help="report index build and query times")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        where = [parse_predicate(text) for text in args.predicates]
+        build_start = time.perf_counter()
+        index = PokemonIndex.from_store(args.store)
+        if args.tile > 1:
+            index = index.tiled(args.tile)
+        build_time = time.perf_counter() - build_start
+
+        query_start = time.perf_counter()
+        if args.count:
+            result = index.count(where)
+        else:
+            result = index.select(where, args.sort, args.desc, args.limit)
+        query_time = time.perf_counter() - query_start
+    except (QueryError, FileNotFoundError) as e:
+        print(f"[ERROR] {e}")
+        return 2
+
+    if args.count:
+        print(result)
+    elif args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        for record in result:
+            print(format_record(record))
+        print(f"{len(result)} row(s)")
+    if args.time:
+        print(f"[INFO] {index.size} rows indexed in {build_time * 1000:.1f} ms; query took {query_time * 1e6:.0f} µs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
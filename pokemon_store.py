@@ -0,0 +1,308 @@
+import json
+import os
+import re
+import sqlite3
+from html import escape
+
+# ============================================================
+# Typed SQLite store that sits between parsing and HTML rendering.
+# The parsers save every page here and render their HTML back out of it,
+# so other tools can query the data without scraping our own HTML.
+#
+#   pages          one row per generated page ("location"/"swarm" + name)
+#   areas          the page's areas in order, with a lookup status
+#   pokemon        one typed record per table row
+#   pokemon_types  (pokemon_id, type) pairs, indexed by type
+#   annotations    Trainers notes per page and row key ("<area>|<dex no.>");
+#                  user data, so it survives re-parses and schema upgrades
+#
+# Each pokemon row also keeps the exact rendered cells (cells_json) so that
+# pages rendered from the store are byte-identical to the parsed tables, and
+# its Trainers cell is filled from the page's annotations when it is saved.
+# ============================================================
+STORE_NAME = "conquest_pokemon.sqlite"
+SCHEMA_VERSION = 2  # Bump whenever SCHEMA changes.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id       INTEGER PRIMARY KEY,
+    source        TEXT NOT NULL,
+    location      TEXT NOT NULL,
+    headers_json  TEXT NOT NULL,
+    input_sha256  TEXT,
+    UNIQUE (source, location)
+);
+CREATE TABLE IF NOT EXISTS areas (
+    area_id   INTEGER PRIMARY KEY,
+    page_id   INTEGER NOT NULL REFERENCES pages(page_id) ON DELETE CASCADE,
+    position  INTEGER NOT NULL,
+    name      TEXT NOT NULL,
+    status    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pokemon (
+    pokemon_id  INTEGER PRIMARY KEY,
+    area_id     INTEGER NOT NULL REFERENCES areas(area_id) ON DELETE CASCADE,
+    position    INTEGER NOT NULL,
+    location    TEXT NOT NULL,
+    area        TEXT NOT NULL,
+    dex_no      INTEGER,
+    name        TEXT NOT NULL,
+    types       TEXT NOT NULL,
+    hp          INTEGER,
+    attack      INTEGER,
+    defence     INTEGER,
+    speed       INTEGER,
+    movement    INTEGER,
+    area_level  INTEGER,
+    area_level_text TEXT NOT NULL,
+    abilities   TEXT NOT NULL,
+    nation      TEXT NOT NULL,
+    trainers    TEXT NOT NULL DEFAULT '',
+    annotation_key TEXT NOT NULL DEFAULT '',
+    cells_json  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pokemon_types (
+    pokemon_id  INTEGER NOT NULL REFERENCES pokemon(pokemon_id) ON DELETE CASCADE,
+    type        TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    page        TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    text        TEXT NOT NULL,
+    PRIMARY KEY (page, key)
+);
+CREATE INDEX IF NOT EXISTS areas_page ON areas(page_id, position);
+CREATE INDEX IF NOT EXISTS pokemon_area ON pokemon(area_id, position);
+CREATE INDEX IF NOT EXISTS pokemon_location ON pokemon(location, area);
+CREATE INDEX IF NOT EXISTS pokemon_dex ON pokemon(dex_no);
+CREATE INDEX IF NOT EXISTS pokemon_name ON pokemon(name);
+CREATE INDEX IF NOT EXISTS pokemon_types_type ON pokemon_types(type, pokemon_id);
+CREATE INDEX IF NOT EXISTS pokemon_types_pokemon ON pokemon_types(pokemon_id);
+CREATE INDEX IF NOT EXISTS pokemon_annotation ON pokemon(location, annotation_key);
+"""
+
+# Tables holding user data rather than parsed data; never dropped on upgrade.
+USER_TABLES = {"annotations"}
+
+# Area statuses, matching the three outcomes of parse_area_section.
+AREA_OK = "ok"
+AREA_NOT_FOUND = "not_found"
+AREA_NO_TABLE = "no_table"
+
+# Header name (lowercased) -> typed column it feeds.
+STAT_COLUMNS = {
+    "hp": "hp",
+    "attack": "attack",
+    "defence": "defence",
+    "speed": "speed",
+    "movement range": "movement",
+}
+
+TYPE_SRC_RE = re.compile(r"/type/([a-z]+)\.gif", re.IGNORECASE)
+LEVEL_RE = re.compile(r"Level\s*(\d+)", re.IGNORECASE)
+DIGITS_RE = re.compile(r"\d+")
+BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+
+def connect(db_path):
+    """
+    Opens (and if needed creates) the store at db_path.
+    A generous timeout lets several parser processes write to it at once.
+    """
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Apart from USER_TABLES the store only holds derived data, so an older
+    # schema is simply dropped and the next parse repopulates it. The upgrade
+    # runs as one transaction under the write lock, and only if no other
+    # process has done it since the first check.
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    if table not in USER_TABLES:
+                        conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    conn.executescript(SCHEMA)
+    return conn
+
+def _int_or_none(text):
+    text = text.strip()
+    return int(text) if text.isdigit() else None
+
+def _text_lines(html):
+    """
+    Turns a small HTML fragment into its text items, split on <br>.
+    """
+    return [part.strip() for part in TAG_RE.sub("", BR_RE.sub("\n", html)).split("\n") if part.strip()]
+
+def row_record(headers, row):
+    """
+    Converts one rendered table row (as produced by extract_table_data or
+    extract_swarm_table_data) into a dict of typed fields, keyed by column name.
+    """
+    cells = {head.lower(): value for head, value in zip(headers, row)}
+    dex_match = DIGITS_RE.search(cells.get("no.", ""))
+    area_level_text = " ".join(_text_lines(cells.get("area level", "")))
+    level_match = LEVEL_RE.search(area_level_text)
+    record = {
+        "dex_no": int(dex_match.group()) if dex_match else None,
+        "name": cells.get("name", ""),
+        "types": [t.lower() for t in TYPE_SRC_RE.findall(cells.get("type", ""))],
+        "area_level": int(level_match.group(1)) if level_match else None,
+        "area_level_text": area_level_text,
+        "abilities": _text_lines(cells.get("abilities", "")),
+        "nation": _text_lines(cells.get("nation", "")),
+        "trainers": cells.get("trainers", ""),
+    }
+    for head, column in STAT_COLUMNS.items():
+        record[column] = _int_or_none(TAG_RE.sub("", cells.get(head, "")))
+    return record
+
+def annotation_keys(area_name, headers, rows):
+    """
+    Returns the stable key of each row's Trainers note: "<area>|<dex no.>"
+    (the name if a row has no number), with "|2", "|3", ... appended to repeats
+    within the area. Unlike the row position, the key survives reordering.
+    """
+    keys = []
+    seen = {}
+    for row in rows:
+        record = row_record(headers, row)
+        key = f"{area_name}|{record['dex_no'] if record['dex_no'] is not None else record['name'].lower()}"
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}|{seen[key]}")
+    return keys
+
+def save_page(conn, source, location, headers, areas, input_digest=None):
+    """
+    Replaces everything stored for (source, location) with the given areas.
+    areas is a list of (area_name, status, rows) in page order; rows are lists
+    of rendered cell strings in the order of headers. Rows with a stored
+    annotation get it as their Trainers value.
+    """
+    notes = load_annotations(conn, location)
+    with conn:
+        conn.execute("DELETE FROM pages WHERE source = ? AND location = ?", (source, location))
+        page_id = conn.execute(
+            "INSERT INTO pages (source, location, headers_json, input_sha256) VALUES (?, ?, ?, ?)",
+            (source, location, json.dumps(headers), input_digest),
+        ).lastrowid
+        for area_position, (area_name, status, rows) in enumerate(areas):
+            area_id = conn.execute(
+                "INSERT INTO areas (page_id, position, name, status) VALUES (?, ?, ?, ?)",
+                (page_id, area_position, area_name, status),
+            ).lastrowid
+            keys = annotation_keys(area_name, headers, rows)
+            for row_position, row in enumerate(rows):
+                record = row_record(headers, row)
+                pokemon_id = conn.execute(
+                    """INSERT INTO pokemon (area_id, position, location, area, dex_no, name, types,
+                                            hp, attack, defence, speed, movement, area_level,
+                                            area_level_text, abilities, nation, trainers,
+                                            annotation_key, cells_json)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        area_id, row_position, location, area_name, record["dex_no"], record["name"],
+                        " ".join(record["types"]), record["hp"], record["attack"], record["defence"],
+                        record["speed"], record["movement"], record["area_level"], record["area_level_text"],
+                        ", ".join(record["abilities"]), ", ".join(record["nation"]),
+                        escape(notes[keys[row_position]], quote=False) if keys[row_position] in notes else record["trainers"], keys[row_position], json.dumps(row),
+                    ),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO pokemon_types (pokemon_id, type) VALUES (?, ?)",
+                    [(pokemon_id, type_name) for type_name in record["types"]],
+                )
+
+def load_page(conn, source, location):
+    """
+    Reads a page back for rendering.
+    Returns (headers, areas) with areas as a list of (area_name, status, rows),
+    or None if the page is not in the store. The Trainers column is filled from
+    the stored trainers value.
+    """
+    page = conn.execute(
+        "SELECT page_id, headers_json FROM pages WHERE source = ? AND location = ?", (source, location)
+    ).fetchone()
+    if page is None:
+        return None
+    headers = json.loads(page["headers_json"])
+    trainers_index = len(headers) - 1
+    areas = []
+    for area in conn.execute(
+        "SELECT area_id, name, status FROM areas WHERE page_id = ? ORDER BY position", (page["page_id"],)
+    ).fetchall():
+        rows = []
+        for pokemon in conn.execute(
+            "SELECT cells_json, trainers FROM pokemon WHERE area_id = ? ORDER BY position", (area["area_id"],)
+        ):
+            row = json.loads(pokemon["cells_json"])
+            row[trainers_index] = pokemon["trainers"]
+            rows.append(row)
+        areas.append((area["name"], area["status"], rows))
+    return headers, areas
+
+def load_annotations(conn, page):
+    """
+    Returns {row key: text} for one page ("swarm" or a location name).
+    """
+    return {row["key"]: row["text"] for row in conn.execute(
+        "SELECT key, text FROM annotations WHERE page = ?", (page,)
+    )}
+
+def save_annotations(conn, page, notes):
+    """
+    Stores (adds or replaces) the given {row key: text} notes for a page and
+    copies them, HTML-escaped, into the page's stored rows. The page's input hash is cleared,
+    so the next parser run re-renders it with the new notes.
+    Returns the number of notes whose text changed.
+    """
+    current = load_annotations(conn, page)
+    changed = {key: text for key, text in notes.items() if current.get(key) != text}
+    if not changed:
+        return 0
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO annotations (page, key, text) VALUES (?, ?, ?)",
+            [(page, key, text) for key, text in changed.items()],
+        )
+        conn.executemany(
+            "UPDATE pokemon SET trainers = ? WHERE location = ? AND annotation_key = ?",
+            [(escape(text, quote=False), page, key) for key, text in changed.items()],
+        )
+        conn.execute("UPDATE pages SET input_sha256 = NULL WHERE location = ?", (page,))
+    return len(changed)
+
+def export_annotations(conn):
+    """
+    Returns every stored note as {page: {row key: text}}.
+    """
+    notes = {}
+    for row in conn.execute("SELECT page, key, text FROM annotations ORDER BY page, key"):
+        notes.setdefault(row["page"], {})[row["key"]] = row["text"]
+    return notes
+
+def has_input(db_path, input_digest):
+    """
+    Returns True if a page built from input bytes with this digest is in the store.
+    Used by the build cache so a deleted or stale store forces a re-parse.
+    """
+    if not os.path.isfile(db_path):
+        return False
+    conn = connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT 1 FROM pages WHERE input_sha256 = ? LIMIT 1", (input_digest,)
+        ).fetchone() is not None
+    finally:
+        conn.close()
@@ -0,0 +1,271 @@
+import argparse
+import heapq
+import math
+import random
+import re
+import sys
+import time
+
+import cross_reference
+from pokemon_query import iter_bits
+
+# ============================================================
+# Which areas to visit to find every Pokémon on a wish list, in as few areas
+# as possible (minimum set cover).
+#
+# The areas come from the cross-reference (cross_reference.py). Only the
+# wanted Pokémon get a bit, so each area is a small int bitset of the targets
+# it offers, and the "Level N+" requirement of the Area Level column decides
+# which Pokémon count: with --level 2 an area only offers what appears at
+# level 2 or lower. Special conditions ("Have 70% link with ...") and
+# post-game-only rows are left out unless asked for.
+#
+#   greedy  lazy greedy: take the area covering the most uncovered targets,
+#           re-scoring an area only when it reaches the top of the heap
+#           (its gain can only have dropped since it was last scored)
+#   exact   branch and bound seeded with the greedy answer; branches on the
+#           uncovered target with the fewest areas, prunes with
+#           chosen + ceil(uncovered / best remaining gain) >= best
+#
+#     python route_planner.py eevee starly 147 --level 2
+#     python route_planner.py --exact riolu gible deino axew
+#     python route_planner.py --synthetic 5000 600 --targets 200
+# ============================================================
+DEFAULT_NODE_LIMIT = 200000  # Exact search nodes before settling for the best cover found.
+EXACT_TARGET_LIMIT = 64  # Larger wish lists are planned greedily even with --exact.
+
+# "Level 2+", "Level 3", and the page's "Leve l2+".
+LEVEL_RE = re.compile(r"l\s*e\s*v\s*e\s*l\s*(\d+)", re.IGNORECASE)
+POST_GAME_RE = re.compile(r"post[\s-]*game", re.IGNORECASE)
+
+def parse_requirement(text):
+    """
+    Returns (level, post_game) for an Area Level cell; level is None when the
+    cell is a special condition rather than a level ("--" counts as level 1).
+    """
+    text = text or ""
+    match = LEVEL_RE.search(text)
+    if match:
+        return int(match.group(1)), bool(POST_GAME_RE.search(text))
+    if text.strip() in ("", "--", "-"):
+        return 1, False
+    return None, bool(POST_GAME_RE.search(text))
+
+def available_areas(xref, max_level=None, post_game=False, special=False, swarms=False):
+    """
+    Returns [(label, {dex: level needed})] for every area (and, with swarms,
+    every swarm nation) under the given constraints.
+    """
+    offers = [({}, f"{location} / {area}") for location, area, _ in xref["areas"]]
+    swarm_offers = {}
+    for dex, entry in xref["pokemon"].items():
+        dex = int(dex)
+        for area_id, requirement, _ in entry["areas"]:
+            level, is_post_game = parse_requirement(requirement)
+            if level is None and not special:
+                continue
+            if is_post_game and not post_game:
+                continue
+            if max_level is not None and level is not None and level > max_level:
+                continue
+            needed = offers[area_id][0]
+            needed[dex] = min(needed.get(dex, level or 0), level or 0)
+        if swarms and entry["swarm"]:
+            for nation in entry["swarm"]["nations"]:
+                swarm_offers.setdefault(f"swarm in {nation}", {})[dex] = 0
+    return [(label, needed) for needed, label in offers] + sorted(swarm_offers.items())
+
+def target_masks(offers, targets):
+    """
+    Bit i stands for targets[i]. Returns one mask per offer.
+    """
+    bits = {dex: 1 << i for i, dex in enumerate(targets)}
+    masks = []
+    for _, needed in offers:
+        mask = 0
+        for dex in needed:
+            mask |= bits.get(dex, 0)
+        masks.append(mask)
+    return masks
+
+def greedy_cover(masks, universe):
+    """
+    Returns the indexes of a cover of universe (as far as masks reach it),
+    picking the largest gain first. Ties go to the lower index.
+    """
+    heap = [(-(mask & universe).bit_count(), i) for i, mask in enumerate(masks) if mask & universe]
+    heapq.heapify(heap)
+    remaining = universe
+    chosen = []
+    while remaining and heap:
+        _, i = heapq.heappop(heap)
+        gain = (masks[i] & remaining).bit_count()
+        if not gain:
+            continue
+        # Stale score: put it back with the current gain unless it still beats the next one.
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        chosen.append(i)
+        remaining &= ~masks[i]
+    return chosen
+
+def _prune(masks, universe):
+    """
+    Indexes of the masks worth branching on: restricted to universe, non-empty,
+    and not a subset of another one (the lower index wins among equals).
+    """
+    restricted = {}
+    for i, mask in enumerate(masks):
+        mask &= universe
+        if mask and mask not in restricted:
+            restricted[mask] = i
+    by_size = sorted(restricted, key=lambda mask: -mask.bit_count())
+    kept = []
+    for mask in by_size:
+        if not any(mask & ~other == 0 for other in kept):
+            kept.append(mask)
+    return [restricted[mask] for mask in kept]
+
+def exact_cover(masks, universe, node_limit=DEFAULT_NODE_LIMIT):
+    """
+    Returns (indexes of a smallest cover, proven optimal). The search stops
+    after node_limit nodes with the best cover found so far.
+    """
+    reachable = 0
+    for mask in masks:
+        reachable |= mask
+    universe &= reachable
+    best = greedy_cover(masks, universe)
+    # Largest first, so the best gain is found without scoring every candidate.
+    candidates = sorted(_prune(masks, universe), key=lambda i: -(masks[i] & universe).bit_count())
+    sizes = [(masks[i] & universe).bit_count() for i in candidates]
+    covering = {bit: [i for i in candidates if masks[i] >> bit & 1] for bit in iter_bits(universe)}
+    depth_reached = {}  # remaining -> fewest areas it was reached with
+    nodes = 0
+
+    def search(remaining, chosen):
+        nonlocal best, nodes
+        nodes += 1
+        if nodes > node_limit:
+            return
+        if not remaining:
+            if len(chosen) < len(best):
+                best = list(chosen)
+            return
+        if depth_reached.get(remaining, len(chosen) + 1) <= len(chosen):
+            return
+        depth_reached[remaining] = len(chosen)
+        max_gain = 0
+        for i, size in zip(candidates, sizes):
+            if size <= max_gain:
+                break
+            max_gain = max(max_gain, (masks[i] & remaining).bit_count())
+        if len(chosen) + math.ceil(remaining.bit_count() / max_gain) >= len(best):
+            return
+        bit = min(iter_bits(remaining), key=lambda b: len(covering[b]))
+        for i in sorted(covering[bit], key=lambda i: -(masks[i] & remaining).bit_count()):
+            chosen.append(i)
+            search(remaining & ~masks[i], chosen)
+            chosen.pop()
+
+    search(universe, [])
+    return best, nodes <= node_limit
+
+def plan(offers, targets, exact=False, node_limit=DEFAULT_NODE_LIMIT):
+    """
+    Plans a route through offers ([(label, {dex: level})]) covering targets
+    (dex numbers). Returns (route, missing, optimal): route is a list of
+    (label, {dex: level}) restricted to the targets each stop contributes,
+    missing the targets no offer has.
+    """
+    masks = target_masks(offers, targets)
+    universe = (1 << len(targets)) - 1
+    optimal = False
+    if exact and len(targets) <= EXACT_TARGET_LIMIT:
+        chosen, optimal = exact_cover(masks, universe, node_limit)
+    else:
+        chosen = greedy_cover(masks, universe)
+    route = []
+    covered = 0
+    for i in chosen:
+        label, needed = offers[i]
+        new = masks[i] & ~covered
+        covered |= masks[i]
+        route.append((label, {targets[bit]: needed[targets[bit]] for bit in iter_bits(new)}))
+    missing = [targets[bit] for bit in iter_bits(universe & ~covered)]
+    return route, missing, optimal
+
+def synthetic_offers(area_count, species_count, per_area=12, seed=0):
+    """
+    Random areas for timing: each offers per_area species (Zipf-like, so some
+    species are common and some rare) at level 1-3.
+    """
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(species_count)]
+    offers = []
+    for i in range(area_count):
+        species = set(rng.choices(range(1, species_count + 1), weights, k=per_area))
+        offers.append((f"area {i}", {dex: rng.randint(1, 3) for dex in species}))
+    return offers
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Plan the fewest areas to visit for a list of Pokémon.")
+    arg_parser.add_argument("pokemon", nargs="*", help="dex numbers or names")
+    arg_parser.add_argument("--xref", default=cross_reference.DEFAULT_OUTPUT,
+                            help="cross-reference file (default: %(default)s)")
+    arg_parser.add_argument("--level", type=int, help="highest area level reached (default: any)")
+    arg_parser.add_argument("--post-game", action="store_true", help="include post-game-only appearances")
+    arg_parser.add_argument("--special", action="store_true",
+                            help="include appearances with special conditions instead of a level")
+    arg_parser.add_argument("--swarms", action="store_true", help="count swarm nations as stops too")
+    arg_parser.add_argument("--exact", action="store_true",
+                            help=f"find a smallest route (up to {EXACT_TARGET_LIMIT} targets)")
+    arg_parser.add_argument("--node-limit", type=int, default=DEFAULT_NODE_LIMIT,
+                            help="exact search nodes before giving up on proving optimality (default: %(default)s)")
+    arg_parser.add_argument("--synthetic", nargs=2, type=int, metavar=("AREAS", "SPECIES"),
+                            help="time the planner on random data instead")
+    arg_parser.add_argument("--targets", type=int, default=50, help="wish list size with --synthetic (default: %(default)s)")
+    args = arg_parser.parse_args(argv)
+
+    if args.synthetic:
+        offers = synthetic_offers(*args.synthetic)
+        species = sorted({dex for _, needed in offers for dex in needed})
+        targets = random.Random(1).sample(species, min(args.targets, len(species)))
+        names = {dex: f"#{dex}" for dex in targets}
+    else:
+        try:
+            xref = cross_reference.load_xref(args.xref)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}")
+            return 1
+        if not args.pokemon:
+            arg_parser.error("name at least one Pokémon (or use --synthetic)")
+        targets = []
+        for query in args.pokemon:
+            found = cross_reference.find(xref, query)
+            if found is None:
+                print(f"[ERROR] No Pokémon '{query}' in {args.xref}")
+                return 1
+            if found[0] not in targets:
+                targets.append(found[0])
+        offers = available_areas(xref, args.level, args.post_game, args.special, args.swarms)
+        names = {dex: f"#{dex:03d} {xref['pokemon'][str(dex)]['name']}" for dex in targets}
+
+    start = time.perf_counter()
+    route, missing, optimal = plan(offers, targets, args.exact, args.node_limit)
+    elapsed = time.perf_counter() - start
+
+    method = "exact" if args.exact and len(targets) <= EXACT_TARGET_LIMIT else "greedy"
+    print(f"Route: {len(route)} stop(s) for {len(targets) - len(missing)}/{len(targets)} Pokémon "
+          f"({method}{', optimal' if optimal else ''}; {len(offers)} areas, {elapsed * 1000:.1f} ms)")
+    for label, got in route:
+        level = max(got.values(), default=0)
+        print(f"  {label}" + (f" (level {level}+)" if level > 1 else "") + ": "
+              + ", ".join(names[dex] for dex in got))
+    if missing:
+        print("Not available under these constraints: " + ", ".join(names[dex] for dex in missing))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
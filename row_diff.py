@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import time
+
+import pokemon_store
+
+# ============================================================
+# What changed between two builds of the Pokémon lists, row by row.
+#
+# Rows are pulled out of either build by one regex pass over its HTML (any of
+# the generated pages, merged.html, all_pokemon.html, the saved "§§§ FINAL
+# CONQUEST LIST.html"), or out of a SQLite store. Every row is normalized
+# to its fields (location, area, dex no., name, types, stats, level
+# requirement, abilities, nation) and keyed by "<location>|<area>|<dex no.>"
+# (with "|2", "|3"... for repeats), so row order and markup (image paths,
+# <br> vs <br/>, attribute order) do not matter. A hash of the fields tells
+# whether a row with the same key changed. Both sides go into dicts, so the
+# diff is linear in the number of rows.
+#
+#     python row_diff.py backups/all_pokemon.html "§§§ FINAL CONQUEST LIST.html"
+#     python row_diff.py old.html new.html --format text
+# The JSON output lists, per changed area, the added, removed and changed
+# rows (with each changed field's old and new value). Exit status: 0 if the
+# builds match, 1 if they differ, 2 on errors, like diff.
+# ============================================================
+DIFF_VERSION = 1
+STAT_FIELDS = ["hp", "attack", "defence", "speed", "movement"]
+FIELDS = ["name", "types"] + STAT_FIELDS + ["area_level", "abilities", "nation"]
+
+# Value of a field in rows whose table has no such column (as in the store).
+MISSING_VALUES = {"area_level": "", "abilities": [], "nation": [], "trainers": ""}
+
+# Header text (lowercased) -> field.
+HEADER_FIELDS = {
+    "no.": "dex_no",
+    "name": "name",
+    "type": "types",
+    "hp": "hp",
+    "attack": "attack",
+    "defence": "defence",
+    "speed": "speed",
+    "movement range": "movement",
+    "area level": "area_level",
+    "abilities": "abilities",
+    "nation": "nation",
+    "trainers": "trainers",
+}
+
+TAG_EVENT_RE = re.compile(r"<(/?)(h1|h3|table|tr|th|td)\b[^>]*>", re.IGNORECASE)
+BR_RE = re.compile(r"</?br\s*/?>", re.IGNORECASE)
+IMG_SRC_RE = re.compile(r"""<img\b[^>]*?\bsrc\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+SPACE_RE = re.compile(r"[ \t\r\f\v]+")
+# "normal(1).gif" -> "normal": a browser's name for a second copy of a file.
+COPY_SUFFIX_RE = re.compile(r"\(\d+\)$")
+SWARM_HEADING = "swarm pokemon"
+
+def _lines(cell_html):
+    text = html.unescape(pokemon_store.TAG_RE.sub("", BR_RE.sub("\n", cell_html)))
+    return [SPACE_RE.sub(" ", line).strip() for line in text.split("\n") if line.strip()]
+
+def normalize_cell(field, cell_html):
+    """
+    Returns a cell's comparable value for the given field.
+    """
+    if field == "types":
+        srcs = ("".join(groups) for groups in IMG_SRC_RE.findall(cell_html))
+        stems = (os.path.splitext(os.path.basename(src))[0].lower() for src in srcs)
+        return [COPY_SUFFIX_RE.sub("", stem) for stem in stems]
+    lines = _lines(cell_html)
+    if field == "dex_no":
+        digits = pokemon_store.DIGITS_RE.search(" ".join(lines))
+        return int(digits.group()) if digits else None
+    if field in STAT_FIELDS:
+        text = " ".join(lines)
+        return int(text) if text.isdigit() else None
+    if field in ("abilities", "nation"):
+        return lines
+    return " ".join(lines)
+
+def _heading_text(fragment):
+    return " ".join(_lines(fragment)).lower()
+
+def iter_html_rows(text):
+    """
+    Yields (location, area, fields) for every data row of every table with a
+    header row in a generated page or merged document. Tables nested inside
+    cells (the "pkmn" picture tables) are part of their cell.
+    """
+    location = area = None
+    depth = 0
+    data_depth = None  # Depth of the table whose rows are being read.
+    headers = []
+    row = None
+    cell_start = heading_start = None
+    for match in TAG_EVENT_RE.finditer(text):
+        closing, tag = match.group(1), match.group(2).lower()
+        if tag == "table":
+            if not closing:
+                depth += 1
+            else:
+                if depth == data_depth:
+                    data_depth = None
+                depth -= 1
+            continue
+        if tag in ("h1", "h3"):
+            if data_depth is not None:
+                continue
+            if not closing:
+                heading_start = match.end()
+            elif heading_start is not None:
+                heading = _heading_text(text[heading_start:match.start()])
+                heading_start = None
+                if tag == "h1":
+                    location = "swarm" if heading == SWARM_HEADING else heading
+                    area = "swarm" if heading == SWARM_HEADING else None
+                else:
+                    area = heading
+            continue
+        if tag == "th" and not closing and data_depth is None and depth:
+            data_depth = depth
+            headers = []
+        if depth != data_depth:
+            continue
+        if tag == "tr":
+            if not closing:
+                row = []
+            elif row is not None:
+                if len(row) == len(headers) and "no." in headers:
+                    fields = dict(MISSING_VALUES)
+                    fields.update((HEADER_FIELDS[head], normalize_cell(HEADER_FIELDS[head], cell))
+                                  for head, cell in zip(headers, row) if head in HEADER_FIELDS)
+                    yield location, area or location, fields
+                row = None
+        elif not closing:
+            cell_start = match.end()
+        elif cell_start is not None:
+            cell = text[cell_start:match.start()]
+            cell_start = None
+            if tag == "th":
+                headers.append(_heading_text(cell))
+            elif row is not None:
+                row.append(cell)
+
+def iter_store_rows(db_path):
+    """
+    Yields (location, area, fields) for every row in a SQLite store.
+    """
+    conn = pokemon_store.connect(db_path)
+    try:
+        for row in conn.execute("SELECT * FROM pokemon ORDER BY pokemon_id"):
+            fields = {
+                "dex_no": row["dex_no"],
+                "name": row["name"],
+                "types": row["types"].split(),
+                "area_level": row["area_level_text"],
+                "abilities": [a for a in row["abilities"].split(", ") if a],
+                "nation": [n for n in row["nation"].split(", ") if n],
+                "trainers": " ".join(_lines(row["trainers"])),
+            }
+            for stat in STAT_FIELDS:
+                fields[stat] = row[stat]
+            yield row["location"], row["area"], fields
+    finally:
+        conn.close()
+
+def row_hash(fields, compared):
+    payload = json.dumps([fields.get(field) for field in compared], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=12).digest()
+
+def index_rows(rows, compared=FIELDS):
+    """
+    Returns {row key: (location, area, fields, hash)} for (location, area,
+    fields) rows; repeats of a key within an area get "|2", "|3", ...
+    """
+    index = {}
+    seen = {}
+    for location, area, fields in rows:
+        ident = fields.get("dex_no")
+        if ident is None:
+            ident = str(fields.get("name", "")).lower()
+        key = f"{location}|{area}|{ident}"
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}|{seen[key]}"
+        index[key] = (location, area, fields, row_hash(fields, compared))
+    return index
+
+def load_index(path, compared=FIELDS):
+    """
+    Indexes the rows of a build: an HTML file or a SQLite store.
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head.startswith(b"SQLite format 3"):
+        return index_rows(iter_store_rows(path), compared)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return index_rows(iter_html_rows(f.read()), compared)
+
+def _summary(fields):
+    return {"dex_no": fields.get("dex_no"), "name": fields.get("name")}
+
+def diff_indexes(old, new, compared=FIELDS):
+    """
+    Compares two indexes. Returns the machine-readable report: totals, the
+    changed areas in order, and per area the added / removed / changed rows.
+    """
+    areas = {}
+
+    def area_entry(location, area):
+        return areas.setdefault(f"{location} / {area}", {
+            "location": location, "area": area, "added": [], "removed": [], "changed": [],
+        })
+
+    for key, (location, area, fields, digest) in new.items():
+        previous = old.get(key)
+        if previous is None:
+            area_entry(location, area)["added"].append(_summary(fields))
+        elif previous[3] != digest:
+            changes = {field: [previous[2].get(field), fields.get(field)]
+                       for field in compared if previous[2].get(field) != fields.get(field)}
+            area_entry(location, area)["changed"].append(dict(_summary(fields), fields=changes))
+    for key, (location, area, fields, _) in old.items():
+        if key not in new:
+            area_entry(location, area)["removed"].append(_summary(fields))
+
+    counts = {kind: sum(len(entry[kind]) for entry in areas.values()) for kind in ("added", "removed", "changed")}
+    return {
+        "version": DIFF_VERSION,
+        "rows": {"old": len(old), "new": len(new)},
+        "counts": counts,
+        "unchanged": len(new) - counts["added"] - counts["changed"],
+        "changed_areas": sorted(areas),
+        "areas": {name: areas[name] for name in sorted(areas)},
+    }
+
+def diff_files(old_path, new_path, compared=FIELDS):
+    return diff_indexes(load_index(old_path, compared), load_index(new_path, compared), compared)
+
+def format_text(report):
+    """
+    Yields a human-readable version of a report.
+    """
+    counts = report["counts"]
+    yield (f"{report['rows']['old']} -> {report['rows']['new']} rows: {counts['added']} added, "
+           f"{counts['removed']} removed, {counts['changed']} changed, {report['unchanged']} unchanged")
+    for name, entry in report["areas"].items():
+        yield f"{name}:"
+        for kind, sign in (("removed", "-"), ("added", "+")):
+            for row in entry[kind]:
+                yield f"  {sign} #{row['dex_no']} {row['name']}"
+        for row in entry["changed"]:
+            changes = "; ".join(f"{field}: {old!r} -> {new!r}" for field, (old, new) in row["fields"].items())
+            yield f"  ~ #{row['dex_no']} {row['name']}: {changes}"
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Diff the Pokémon rows of two builds.")
+    arg_parser.add_argument("old", help="older build: a generated/merged HTML file or a SQLite store")
+    arg_parser.add_argument("new", help="newer build, in either form")
+    arg_parser.add_argument("--format", choices=["json", "text"], default="json",
+                            help="report format (default: %(default)s)")
+    arg_parser.add_argument("--trainers", action="store_true", help="also compare the Trainers notes")
+    arg_parser.add_argument("-o", "--output", help="write the report to this file instead of stdout")
+    args = arg_parser.parse_args(argv)
+
+    compared = FIELDS + ["trainers"] if args.trainers else FIELDS
+    start = time.perf_counter()
+    try:
+        report = diff_files(args.old, args.new, compared)
+    except OSError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+    text = (json.dumps(report, indent=1, ensure_ascii=False) + "\n" if args.format == "json"
+            else "\n".join(format_text(report)) + "\n")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    print(f"[INFO] Compared {report['rows']['old']} and {report['rows']['new']} rows in {elapsed * 1000:.0f} ms",
+          file=sys.stderr)
+    return 1 if report["changed_areas"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
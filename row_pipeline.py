@@ -0,0 +1,256 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+import pokemon_store
+
+# ============================================================
+# Lazy row extraction: rows -> transforms -> sinks.
+#
+# A source table is described by its columns: a name, the <td> it is read
+# from and the function that turns that cell into a value. A consumer asks
+# for the columns it needs by name (select), and iter_rows yields one row
+# per <tr> as it is reached, computing only those columns. So a data-only
+# consumer never pays for fix_images on the Pic and Type cells.
+#
+# Each source offers two kinds of columns:
+#   rendered  the generated table's headers ("No.", "Pic", "Type", ...), as
+#             HTML; what extract_table_data and the pages use
+#   typed     the store's fields (dex_no, name, types, hp, ..., nation), as
+#             ints, strings and lists read straight from the cells
+#
+# Transforms are generators over rows (with_fields); sinks write each row
+# as it arrives (write_csv, write_jsonl). The CLI exports every location
+# page and the swarm page that way, with no rendering and no image work:
+#     python row_pipeline.py -o rows.csv
+#     python row_pipeline.py --format jsonl --fields dex_no,name,hp,speed
+# ============================================================
+Column = namedtuple("Column", "name cell extract")  # cell: <td> index, or None for a constant column
+
+STAT_FIELDS = ["hp", "attack", "defence", "speed", "movement"]
+DEFAULT_FIELDS = (["dex_no", "name", "types"] + STAT_FIELDS
+                  + ["area_level", "area_level_text", "abilities", "nation"])
+
+def text(cell):
+    return cell.get_text(strip=True)
+
+def blank(cell):
+    return ""
+
+def missing(cell):
+    return None
+
+def integer(cell):
+    value = cell.get_text(strip=True)
+    return int(value) if value.isdigit() else None
+
+def dex_number(cell):
+    match = pokemon_store.DIGITS_RE.search(cell.get_text(strip=True))
+    return int(match.group()) if match else None
+
+def type_names(cell):
+    """
+    The type names in a cell's type icon paths, without rewriting them.
+    """
+    names = []
+    for img in cell.find_all("img"):
+        match = pokemon_store.TYPE_SRC_RE.search(img.get("src", ""))
+        if match:
+            names.append(match.group(1).lower())
+    return names
+
+def area_level(cell):
+    match = pokemon_store.LEVEL_RE.search(cell.get_text(strip=True))
+    return int(match.group(1)) if match else None
+
+def lines(cell):
+    return [line.strip() for line in cell.get_text(separator="\n").split("\n") if line.strip()]
+
+# Typed field -> how it is read from its cell.
+FIELD_EXTRACTORS = {
+    "dex_no": dex_number,
+    "name": text,
+    "types": type_names,
+    "hp": integer,
+    "attack": integer,
+    "defence": integer,
+    "speed": integer,
+    "movement": integer,
+    "area_level": area_level,
+    "area_level_text": text,
+    "abilities": lines,
+    "nation": lines,
+}
+
+def field_columns(cells):
+    """
+    Returns the typed columns of a table whose fields are in the given
+    cells ({field: <td> index}).
+    """
+    return [Column(field, cell, FIELD_EXTRACTORS[field]) for field, cell in cells.items()]
+
+def select(columns, names, strict=True):
+    """
+    Returns the columns with the given names, in that order. Names match
+    exactly, or else case-insensitively ("HP" is the swarm table's "Hp").
+    A name the table does not have raises ValueError, or with strict=False
+    becomes a column of None.
+    """
+    exact = {column.name: column for column in columns}
+    folded = {}
+    for column in columns:
+        folded.setdefault(column.name.lower(), column)
+    selected = []
+    for name in names:
+        column = exact.get(name) or folded.get(name.lower())
+        if column is None:
+            if strict:
+                raise ValueError(f"Unknown column: {name}")
+            column = Column(name, None, missing)
+        selected.append(column)
+    return selected
+
+def iter_rows(table, columns, min_cells):
+    """
+    Yields one list of values (in the order of columns) per data row of
+    table, skipping its header row and rows with fewer than min_cells cells.
+    """
+    trs = (child for child in table.children if getattr(child, "name", None) == "tr")
+    next(trs, None)  # header row
+    for tr in trs:
+        cells = [child for child in tr.children if getattr(child, "name", None) == "td"]
+        if len(cells) < min_cells:
+            continue
+        yield [column.extract(None if column.cell is None else cells[column.cell]) for column in columns]
+
+def with_fields(rows, *values):
+    """
+    Prepends values (e.g. the location and area) to every row.
+    """
+    values = list(values)
+    for row in rows:
+        yield values + row
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join(str(item) for item in value)
+    return value
+
+def write_csv(rows, headers, out):
+    """
+    Writes a header line and then each row as it arrives. Lists are joined
+    with "; ". Returns the number of rows written.
+    """
+    writer = csv.writer(out)
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+    return count
+
+def write_jsonl(rows, headers, out):
+    """
+    Writes each row as it arrives, as one JSON object per line.
+    Returns the number of rows written.
+    """
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(headers, row)), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+SINKS = {"csv": write_csv, "jsonl": write_jsonl}
+
+def iter_location_rows(input_dir, names):
+    """
+    Yields [location, area, *values of names] for every row of every location
+    page in input_dir, without rendering anything.
+    """
+    import encoding_detect
+    import html_backends
+    from script_loader import LOCATION_PARSER, load_script
+
+    parser = load_script(LOCATION_PARSER)
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.lower().endswith((".shtml", ".html")):
+            continue
+        with open(os.path.join(input_dir, file_name), "rb") as f:
+            raw_data = f.read()
+        encoding, _ = encoding_detect.detect_encoding(raw_data)
+        soup = html_backends.make_soup(raw_data.decode(encoding, errors="replace"))
+        location = parser.location_name(soup)
+        area_names = parser.get_area_names_from_anchors(soup) or parser.get_area_names_from_anctab(soup)
+        area_index = parser.build_area_index(soup)
+        for area_name in area_names:
+            _, table = parser.find_area_table(area_index, area_name)
+            if table:
+                yield from with_fields(parser.iter_table_rows(table, names, strict=False), location, area_name)
+
+def iter_swarm_rows(swarm_page, names):
+    """
+    Yields ["swarm", "swarm", *values of names] for every row of the swarm page.
+    """
+    import encoding_detect
+    import html_backends
+    from script_loader import SWARM_PARSER, load_script
+
+    parser = load_script(SWARM_PARSER)
+    with open(swarm_page, "rb") as f:
+        raw_data = f.read()
+    encoding, _ = encoding_detect.detect_encoding(raw_data)
+    table = html_backends.make_soup(raw_data.decode(encoding, errors="replace")).find("table", class_="tab")
+    if table:
+        yield from with_fields(parser.iter_swarm_table_rows(table, names, strict=False), "swarm", "swarm")
+
+def main(argv=None):
+    import build
+    from script_loader import LOCATION_PARSER, SCRIPT_DIR, SWARM_PARSER, load_script
+
+    arg_parser = argparse.ArgumentParser(description="Export the Pokémon rows of the source pages as CSV or JSON Lines.")
+    arg_parser.add_argument("--root", default=SCRIPT_DIR,
+                            help="directory laid out as for build.py (default: %(default)s)")
+    arg_parser.add_argument("--fields", default=",".join(DEFAULT_FIELDS),
+                            help="comma-separated typed fields or table headers (default: %(default)s)")
+    arg_parser.add_argument("--format", choices=sorted(SINKS), default="csv", help="output format (default: %(default)s)")
+    arg_parser.add_argument("-o", "--output", help="write to this file instead of stdout")
+    arg_parser.add_argument("--no-locations", action="store_true", help="leave out the location pages")
+    arg_parser.add_argument("--no-swarm", action="store_true", help="leave out the swarm page")
+    args = arg_parser.parse_args(argv)
+
+    names = [name.strip() for name in args.fields.split(",") if name.strip()]
+    location_parser, swarm_parser = load_script(LOCATION_PARSER), load_script(SWARM_PARSER)
+    known = location_parser.TABLE_COLUMNS + location_parser.FIELD_COLUMNS
+    known += swarm_parser.SWARM_COLUMNS + swarm_parser.FIELD_COLUMNS
+    try:
+        select(known, names)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    paths = build.build_paths(args.root)
+    rows = iter(())
+    if not args.no_locations:
+        if not os.path.isdir(paths["location_pages"]):
+            print(f"[ERROR] Input directory not found: {paths['location_pages']}", file=sys.stderr)
+            return 1
+        rows = iter_location_rows(paths["location_pages"], names)
+    if not args.no_swarm and os.path.isfile(paths["swarm_page"]):
+        rows = (row for source in (rows, iter_swarm_rows(paths["swarm_page"], names)) for row in source)
+
+    start = time.perf_counter()
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        count = SINKS[args.format](rows, ["location", "area"] + names, out)
+    finally:
+        if args.output:
+            out.close()
+    print(f"[INFO] Exported {count} rows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import sys
+
+# ============================================================
+# The parser scripts have names like "§ multi_conquest_parse.py" that cannot
+# be imported normally. load_script imports one of them by file name so other
+# tools can reuse its functions. Functions of a loaded script pickle by the
+# module name load_script gives it, so a process pool worker can only run them
+# if the script is loaded there too: inherited under fork, but under spawn the
+# pool needs initializer=load_script, initargs=(file name,).
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOCATION_PARSER = "§ multi_conquest_parse.py"
+SWARM_PARSER = "§ swarm parse.py"
+LOCATION_MERGER = "§ merger.py"
+FINAL_MERGER = "last merge.py"
+
+def load_script(file_name):
+    """
+    Imports the script SCRIPT_DIR/file_name and returns it as a module.
+    Each script is loaded once and registered in sys.modules under a
+    sanitized name, so repeated calls return the same module object.
+    """
+    module_name = "script_" + "".join(c if c.isalnum() else "_" for c in file_name[:-3]).strip("_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
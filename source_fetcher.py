@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import ssl
+import sys
+import time
+import urllib.parse
+import zlib
+
+import asset_store
+import build
+import build_cache
+import encoding_detect
+import html_backends
+from script_loader import SCRIPT_DIR
+
+# ============================================================
+# Refreshes the saved serebii pages: the 17 location pages in
+# "shtml's of location" and swarms.shtml, plus the images their tables show
+# (Pokemon icons and pictures, type icons; see asset_store.SRC_PATTERNS).
+#
+#   - asyncio, one pooled HTTP/1.1 keep-alive client for every request
+#   - at most --concurrency requests at a time, --per-host connections per
+#     host, and requests to one host started at most --rate times a second
+#   - every response's ETag / Last-Modified is kept in .fetch_state.json and
+#     sent back as If-None-Match / If-Modified-Since, so an unchanged page or
+#     image costs a 304 and is not written again
+#   - files are written atomically (temporary file + rename), so the parsers
+#     (or watch.py) never see a half-downloaded page
+#
+# Images are saved the way a browser saves a page: "aurora.shtml" gets an
+# "aurora_files" directory next to it, which asset_store.py collects.
+#     python source_fetcher.py                      # everything, then: python build.py
+#     python source_fetcher.py aurora swarms        # just these pages
+#     python source_fetcher.py --base-url http://127.0.0.1:8000   # a local mirror
+# ============================================================
+BASE_URL = "https://www.serebii.net"
+PAGE_PATH = "/conquest/"  # Where the pages live under BASE_URL.
+LOCATION_PAGES = [
+    "aurora", "avia", "chrysalia", "cragspur", "dragnor", "fontaine", "greenleaf", "ignis", "illusio",
+    "nixtorm", "pugilis", "spectra", "terrera", "valora", "violight", "viperia", "yaksha",
+]
+SWARM_PAGE = "swarms"
+PAGE_EXTENSION = ".shtml"
+STATE_NAME = ".fetch_state.json"
+STATE_VERSION = 1
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_RATE = 5.0  # Requests per second and host; 0 for no limit.
+TIMEOUT = 30.0  # Seconds per request.
+MAX_REDIRECTS = 5
+USER_AGENT = "conquest-parse source_fetcher"
+
+class HttpError(Exception):
+    pass
+
+class Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+class RateLimiter:
+    """
+    Spaces out the start of requests to each host by 1/rate seconds.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self.next_start.get(host, now))
+        self.next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+class HttpClient:
+    """
+    A small HTTP/1.1 client keeping idle keep-alive connections per
+    (scheme, host, port) for reuse. Only GET is needed here.
+    """
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, rate=DEFAULT_RATE, timeout=TIMEOUT):
+        self.per_host = per_host
+        self.rate_limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.idle = {}
+        self.slots = {}
+        self.ssl_context = ssl.create_default_context()
+        self.connections_opened = 0
+
+    async def get(self, url, headers=None):
+        """
+        GETs url, following redirects. Returns a Response; the body is decoded
+        from gzip/deflate if the server compressed it.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await asyncio.wait_for(self._get_once(url, headers or {}), self.timeout)
+            location = response.headers.get("location")
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                return response
+            url = urllib.parse.urljoin(url, location)
+        raise HttpError(f"too many redirects: {url}")
+
+    async def _get_once(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise HttpError(f"unsupported URL: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        host = parts.hostname if port in (80, 443) else f"{parts.hostname}:{port}"
+        request = [f"GET {target} HTTP/1.1", f"Host: {host}", f"User-Agent: {USER_AGENT}",
+                   "Accept-Encoding: gzip, deflate", "Connection: keep-alive"]
+        request += [f"{name}: {value}" for name, value in headers.items()]
+        request = ("\r\n".join(request) + "\r\n\r\n").encode("latin-1")
+
+        slots = self.slots.setdefault(key, asyncio.Semaphore(self.per_host))
+        async with slots:
+            await self.rate_limiter.wait(parts.hostname)
+            idle = self.idle.setdefault(key, [])
+            while True:
+                reused = bool(idle)
+                reader, writer = idle.pop() if reused else await self._open(key)
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    status, response_headers, body, keep_alive = await self._read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue  # The server closed an idle connection; try a fresh one.
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    idle.append((reader, writer))
+                else:
+                    writer.close()
+                return Response(url, status, response_headers, body)
+
+    async def _open(self, key):
+        scheme, hostname, port = key
+        self.connections_opened += 1
+        return await asyncio.open_connection(hostname, port, ssl=self.ssl_context if scheme == "https" else None)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise HttpError(f"bad status line: {status_line!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = parts[0] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        if status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while (await reader.readline()).strip():
+                        pass  # trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        encoding = headers.get("content-encoding", "").lower()
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        return status, headers, body, keep_alive
+
+    async def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+def page_url(base_url, page):
+    return base_url.rstrip("/") + PAGE_PATH + page + PAGE_EXTENSION
+
+def page_file(paths, page):
+    if page == SWARM_PAGE:
+        return paths["swarm_page"]
+    return os.path.join(paths["location_pages"], page + PAGE_EXTENSION)
+
+def saved_files_dir(page_path):
+    """
+    "<dir>/aurora.shtml" -> "<dir>/aurora_files", where a browser saves the page's images.
+    """
+    return os.path.splitext(page_path)[0] + "_files"
+
+def image_urls(page_path, url):
+    """
+    Returns the absolute URLs of the table images (icons, pictures, types)
+    a saved page references, resolved against the page's URL.
+    """
+    with open(page_path, "rb") as f:
+        raw_data = f.read()
+    encoding, _ = encoding_detect.detect_encoding(raw_data)
+    soup = html_backends.make_soup(raw_data.decode(encoding, errors="replace"))
+    urls = set()
+    for img in soup.find_all("img", src=True):
+        src = urllib.parse.urljoin(url, img["src"])
+        if any(pattern.search(urllib.parse.urlsplit(src).path) for _, pattern in asset_store.SRC_PATTERNS):
+            urls.add(src)
+    return sorted(urls)
+
+def local_names(urls):
+    """
+    Maps each image URL of one page to a file name in its *_files directory:
+    the URL's last path segment, with "(1)", "(2)"... added, as browsers do,
+    when two URLs end the same way ("icon/133.png" and "pokemon/133.png").
+    """
+    names = {}
+    taken = set()
+    for url in urls:
+        name = os.path.basename(urllib.parse.urlsplit(url).path)
+        stem, ext = os.path.splitext(name)
+        copy = 0
+        while name.lower() in taken:
+            copy += 1
+            name = f"{stem}({copy}){ext}"
+        taken.add(name.lower())
+        names[url] = name
+    return names
+
+class Fetcher:
+    """
+    Downloads URLs into local files, conditionally where the last response's
+    validators are known, and records the validators for the next run.
+    """
+
+    def __init__(self, client, state, concurrency=DEFAULT_CONCURRENCY, force=False):
+        self.client = client
+        self.state = state
+        self.limit = asyncio.Semaphore(concurrency)
+        self.force = force
+        self.counts = {"downloaded": 0, "not modified": 0, "failed": 0}
+
+    async def fetch(self, url, local_paths):
+        """
+        Makes every path in local_paths hold the current contents of url.
+        Returns True on success (downloaded or not modified).
+        """
+        entry = self.state.get(url, {})
+        headers = {}
+        # Only ask for a 304 if every local copy is exactly what was downloaded.
+        if not self.force and entry and all(build_cache.file_digest(path) == entry.get("sha256")
+                                            for path in local_paths):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            async with self.limit:
+                response = await self.client.get(url, headers)
+        except (OSError, asyncio.TimeoutError, HttpError, ValueError, EOFError, zlib.error) as e:
+            print(f"[ERROR] {url}: {e or type(e).__name__}")
+            self.counts["failed"] += 1
+            return False
+        if response.status == 304:
+            self.counts["not modified"] += 1
+            return True
+        if response.status != 200:
+            print(f"[ERROR] {url}: HTTP {response.status}")
+            self.counts["failed"] += 1
+            return False
+        for path in local_paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            build_cache.write_atomic(path, response.body)
+        self.state[url] = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "sha256": build_cache.bytes_digest(response.body),
+        }
+        self.counts["downloaded"] += 1
+        print(f"[INFO] Downloaded {url} ({len(response.body)} bytes)")
+        return True
+
+async def refresh(paths, pages, base_url=BASE_URL, images=True, concurrency=DEFAULT_CONCURRENCY,
+                  per_host=DEFAULT_PER_HOST, rate=DEFAULT_RATE, force=False):
+    """
+    Fetches the pages, then every table image they reference. Returns
+    (counts, connections opened).
+    """
+    state_path = os.path.join(paths["root"], STATE_NAME)
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            saved_state = json.load(f)
+    except (OSError, ValueError):
+        saved_state = {}
+    state = saved_state.get("urls", {}) if saved_state.get("version") == STATE_VERSION else {}
+
+    client = HttpClient(per_host, rate)
+    fetcher = Fetcher(client, state, concurrency, force)
+    try:
+        page_urls = {page: page_url(base_url, page) for page in pages}
+        results = await asyncio.gather(*(fetcher.fetch(page_urls[page], [page_file(paths, page)]) for page in pages))
+
+        if images:
+            # One request per image, however many pages show it.
+            targets = {}
+            for page, ok in zip(pages, results):
+                path = page_file(paths, page)
+                if not ok and not os.path.isfile(path):
+                    continue
+                names = local_names(image_urls(path, page_urls[page]))
+                for url, name in names.items():
+                    targets.setdefault(url, []).append(os.path.join(saved_files_dir(path), name))
+            await asyncio.gather(*(fetcher.fetch(url, targets[url]) for url in sorted(targets)))
+    finally:
+        await client.close()
+        build_cache.write_atomic(state_path, json.dumps({"version": STATE_VERSION, "urls": state},
+                                                        indent=2, sort_keys=True))
+    return fetcher.counts, client.connections_opened
+
+def main(argv=None):
+    all_pages = LOCATION_PAGES + [SWARM_PAGE]
+    arg_parser = argparse.ArgumentParser(description="Download the serebii source pages and their images.")
+    arg_parser.add_argument("pages", nargs="*", metavar="PAGE",
+                            help=f"pages to refresh (default: all {len(all_pages)}: the locations and {SWARM_PAGE})")
+    arg_parser.add_argument("--root", default=SCRIPT_DIR,
+                            help="directory laid out as for build.py (default: %(default)s)")
+    arg_parser.add_argument("--base-url", default=BASE_URL, help="site to fetch from (default: %(default)s)")
+    arg_parser.add_argument("--no-images", action="store_true", help="only fetch the pages")
+    arg_parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                            help="requests in flight at once (default: %(default)s)")
+    arg_parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST,
+                            help="connections per host (default: %(default)s)")
+    arg_parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                            help="requests started per second and host, 0 for no limit (default: %(default)s)")
+    arg_parser.add_argument("-f", "--force", action="store_true",
+                            help="download everything, without If-None-Match / If-Modified-Since")
+    args = arg_parser.parse_args(argv)
+    unknown = [page for page in args.pages if page not in all_pages]
+    if unknown:
+        arg_parser.error(f"unknown page(s): {', '.join(unknown)}")
+
+    paths = build.build_paths(args.root)
+    os.makedirs(paths["location_pages"], exist_ok=True)
+    start = time.perf_counter()
+    counts, connections = asyncio.run(refresh(
+        paths, args.pages or all_pages, args.base_url, not args.no_images,
+        max(1, args.concurrency), max(1, args.per_host), args.rate, args.force,
+    ))
+    print(f"[INFO] {counts['downloaded']} downloaded, {counts['not modified']} not modified, "
+          f"{counts['failed']} failed; {connections} connection(s), {time.perf_counter() - start:.2f}s")
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+import argparse
+import asyncio
+import email.utils
+import gzip
+import mimetypes
+import os
+import re
+import sys
+import urllib.parse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import build_cache
+
+# ============================================================
+# Small offline HTTP server for the generated pages (index.html ->
+# "§§§ FINAL CONQUEST LIST.html" and its sprite/type images).
+#
+#   - one asyncio process, HTTP/1.1 keep-alive, GET and HEAD only
+#   - strong ETags from each file's SHA-256; If-None-Match answers 304
+#   - files named by their content hash (conquest.<hash>.css/js, the atlases
+#     and objects in assets/, the virtual list's shards) are served as
+#     immutable for a year; everything else is revalidated on every load
+#   - "<file>.br" / "<file>.gz" variants written by precompress() (for the
+#     files that are served, see served) are sent to clients that accept
+#     them; files without one are compressed once in memory
+#
+# Generate the variants (the last merge does this for its output), then serve:
+#     python static_server.py precompress
+#     python static_server.py serve --port 8000
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+INDEX_FILE = "index.html"
+
+# Only the pages and what they load are served: not the SQLite store, the
+# scripts, or anything in or under a dot-prefixed name (.build_state.json, ...).
+SERVED_EXTENSIONS = (".html", ".htm", ".css", ".js", ".json", ".svg", ".png", ".gif", ".jpg", ".jpeg",
+                     ".webp", ".ico")
+COMPRESSIBLE_EXTENSIONS = (".html", ".htm", ".css", ".js", ".json", ".svg")
+# "<name>.<12 hex digits>.<ext>" or "<SHA-256>.<ext>": the name changes with the content.
+HASHED_NAME_RE = re.compile(r"(?:^|\.)(?:[0-9a-f]{12}|[0-9a-f]{64})\.\w+$")
+MIN_COMPRESS_SIZE = 1024  # Smaller files are not worth a variant.
+# Content-Encoding -> variant suffix, in order of preference.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+VARIANT_SUFFIXES = tuple(suffix for _, suffix in ENCODINGS)
+
+REVALIDATE = "no-cache"
+IMMUTABLE = "public, max-age=31536000, immutable"
+MAX_HEADER_BYTES = 16 * 1024
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11) if brotli else None
+    # mtime=0 keeps the .gz bytes identical for identical input.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def _compressible(path):
+    return path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+def served(relative_path):
+    """
+    True if the file at relative_path (relative to the served root) is one
+    the server hands out: not dot-prefixed and one of the SERVED_EXTENSIONS.
+    """
+    if any(segment.startswith(".") for segment in relative_path.split(os.sep)):
+        return False
+    return relative_path.lower().endswith(SERVED_EXTENSIONS)
+
+def precompress_file(path):
+    """
+    Writes "<path>.br" (if brotli is installed) and "<path>.gz" next to path,
+    unless they are already there. Returns the variants written.
+    """
+    written = []
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return written
+    for encoding, suffix in ENCODINGS:
+        variant = path + suffix
+        # Variants are rewritten whenever the original is newer.
+        if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+            continue
+        compressed = _compress(data, encoding)
+        if compressed is None or len(compressed) >= len(data):
+            continue
+        temp_path = variant + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(temp_path, variant)
+        written.append(variant)
+    return written
+
+def precompress(root=SCRIPT_DIR):
+    """
+    Precompresses every compressible file under root that is served (see
+    served). Returns the variants written.
+    """
+    written = []
+    for directory, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if not d.startswith(".") and d != "__pycache__"]
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            if _compressible(file_name) and served(os.path.relpath(path, root)):
+                written.extend(precompress_file(path))
+    return written
+
+class FileCache:
+    """
+    Files (and their compressed forms) by path, reloaded when the file's
+    modification time or size changes.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(path)
+        if entry is None or entry["key"] != key:
+            with open(path, "rb") as f:
+                data = f.read()
+            entry = {
+                "key": key,
+                "data": data,
+                "etag": '"' + build_cache.bytes_digest(data)[:32] + '"',
+                "modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+                "variants": {},
+            }
+            self.entries[path] = entry
+        return entry
+
+    def variant(self, path, entry, encoding, suffix):
+        """
+        Returns the encoded bytes of a cached file, preferring a fresh
+        precompressed file on disk; None if there is no (smaller) variant.
+        """
+        if encoding in entry["variants"]:
+            return entry["variants"][encoding]
+        encoded = None
+        variant_path = path + suffix
+        if os.path.exists(variant_path) and os.path.getmtime(variant_path) >= os.path.getmtime(path):
+            with open(variant_path, "rb") as f:
+                encoded = f.read()
+        elif _compressible(path) and len(entry["data"]) >= MIN_COMPRESS_SIZE:
+            encoded = _compress(entry["data"], encoding)
+        if encoded is not None and len(encoded) >= len(entry["data"]):
+            encoded = None
+        entry["variants"][encoding] = encoded
+        return encoded
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+class StaticServer:
+    def __init__(self, root=SCRIPT_DIR):
+        self.root = os.path.realpath(root)
+        self.cache = FileCache()
+
+    def resolve(self, url_path):
+        """
+        Maps a request path to a file under root, or None (missing, outside
+        root, dot-prefixed, or not one of the SERVED_EXTENSIONS).
+        """
+        path = urllib.parse.unquote(urllib.parse.urlsplit(url_path).path)
+        if any(segment.startswith(".") for segment in path.split("/")):
+            return None
+        full_path = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if full_path != self.root and not full_path.startswith(self.root + os.sep):
+            return None
+        if os.path.isdir(full_path):
+            full_path = os.path.join(full_path, INDEX_FILE)
+        if not os.path.isfile(full_path) or not served(os.path.relpath(full_path, self.root)):
+            return None
+        return full_path
+
+    def respond(self, method, url_path, headers):
+        """
+        Returns (status, reason, response headers, body) for one request.
+        """
+        if method not in ("GET", "HEAD"):
+            return 405, "Method Not Allowed", [("Allow", "GET, HEAD")], b""
+        path = self.resolve(url_path)
+        if path is None:
+            return 404, "Not Found", [("Content-Type", "text/plain; charset=utf-8")], b"Not found\n"
+        entry = self.cache.get(path)
+
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        body = entry["data"]
+        etag = entry["etag"]
+        content_encoding = None
+        accepted = _accepted_encodings(headers.get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                encoded = self.cache.variant(path, entry, encoding, suffix)
+                if encoded is not None:
+                    body = encoded
+                    content_encoding = encoding
+                    # Each content-coding is a different representation, so it gets its own strong ETag.
+                    etag = etag[:-1] + "-" + suffix[1:] + '"'
+                    break
+        response_headers = [
+            ("ETag", etag),
+            ("Last-Modified", entry["modified"]),
+            ("Cache-Control", IMMUTABLE if HASHED_NAME_RE.search(os.path.basename(path)) else REVALIDATE),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if_none_match = headers.get("if-none-match", "")
+        if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return 304, "Not Modified", response_headers, b""
+        if content_encoding:
+            response_headers.append(("Content-Encoding", content_encoding))
+        response_headers.append(("Content-Type", content_type))
+        return 200, "OK", response_headers, body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("iso-8859-1").split("\r\n")
+                parts = lines[0].split()
+                if len(parts) != 3:
+                    await self._send(writer, "HEAD", 400, "Bad Request", [], b"", keep_alive=False)
+                    break
+                method, url_path, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                status, reason, response_headers, body = self.respond(method, url_path, headers)
+                await self._send(writer, method, status, reason, response_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _send(self, writer, method, status, reason, headers, body, keep_alive):
+        lines = [f"HTTP/1.1 {status} {reason}", f"Date: {email.utils.formatdate(usegmt=True)}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD" and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+async def serve(root=SCRIPT_DIR, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = StaticServer(root)
+    listener = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    print(f"[INFO] Serving {server.root} on http://{host}:{port}/ (Ctrl-C to stop)")
+    async with listener:
+        await listener.serve_forever()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Serve the generated Conquest pages locally.")
+    arg_parser.add_argument("--root", default=SCRIPT_DIR, help="directory to serve (default: %(default)s)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="address to bind (default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port (default: %(default)s)")
+    commands.add_parser("precompress", help="write .gz (and .br, if brotli is installed) variants of the pages")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "precompress":
+        written = precompress(args.root)
+        print(f"[INFO] Wrote {len(written)} compressed variant(s)"
+              + ("" if brotli else "; brotli is not installed, so only gzip was written"))
+        return 0
+    try:
+        asyncio.run(serve(args.root, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
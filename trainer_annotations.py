@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+
+import pokemon_store
+
+# ============================================================
+# Trainers notes, keyed by page and "<area>|<dex no.>" (see
+# pokemon_store.annotation_keys) instead of by row position.
+#
+# In the browser each page keeps all of its notes under one localStorage key,
+# "conquest_trainers_<page>", as a JSON object that is read once on load and
+# written in one go on every edit. Notes saved under the old per-cell keys
+# ("trainers_cell_<page>_<index>") are carried over when the page's own file
+# (not a merged document) loads.
+#
+# Notes can be moved between the browser and the store, so regenerated pages
+# come with them already filled in:
+#   - in the browser console:  copy(exportConquestTrainers())  and save as notes.json
+#   - python trainer_annotations.py import notes.json   (then re-run the parsers)
+#   - python trainer_annotations.py export notes.json
+# Both files use the same {page: {row key: text}} format.
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(SCRIPT_DIR, pokemon_store.STORE_NAME)
+STORAGE_PREFIX = "conquest_trainers_"
+LEGACY_STORAGE_PREFIX = "trainers_cell_"
+
+# Defines exportConquestTrainers(), which returns every page's notes as
+# {page: {row key: text}} JSON (the format of the import command).
+EXPORT_FUNCTION = f"""window.exportConquestTrainers = function() {{
+    const all = {{}};
+    for (let i = 0; i < localStorage.length; i++) {{
+      const key = localStorage.key(i);
+      if (key.startsWith('{STORAGE_PREFIX}')) all[key.slice({len(STORAGE_PREFIX)})] = JSON.parse(localStorage.getItem(key));
+    }}
+    return JSON.stringify(all, null, 2);
+  }};"""
+
+# Loads the notes of page into the Trainers cells under scope and saves every
+# edit; storeKey is the page's localStorage key.
+LOAD_NOTES = f"""    const trainerCells = scope.querySelectorAll('td.trainers-col[data-key]');
+    const saved = localStorage.getItem(storeKey);
+    let notes = {{}};
+    try {{
+      notes = JSON.parse(saved || '{{}}') || {{}};
+    }} catch (e) {{
+      notes = {{}};
+    }}
+    // Carry over notes saved under the old per-cell keys. Those were numbered
+    // across the whole document, and in a merged document every page's script
+    // wrote them, so they only map to rows when this page is alone in its
+    // document; elsewhere they are left for the page's own file to carry over.
+    // A note already saved under the new key wins.
+    const allCells = document.querySelectorAll('td.trainers-col');
+    if (allCells.length === trainerCells.length) {{
+      let migrated = false;
+      trainerCells.forEach(cell => {{
+        const oldKey = '{LEGACY_STORAGE_PREFIX}' + page + '_' + Array.prototype.indexOf.call(allCells, cell);
+        const old = localStorage.getItem(oldKey);
+        if (old !== null) {{
+          if (!Object.prototype.hasOwnProperty.call(notes, cell.dataset.key)) notes[cell.dataset.key] = old;
+          localStorage.removeItem(oldKey);
+          migrated = true;
+        }}
+      }});
+      if (migrated) localStorage.setItem(storeKey, JSON.stringify(notes));
+    }}
+    trainerCells.forEach(cell => {{
+      const key = cell.dataset.key;
+      if (Object.prototype.hasOwnProperty.call(notes, key)) cell.textContent = notes[key];
+      cell.addEventListener('blur', () => {{
+        notes[key] = cell.textContent;
+        localStorage.setItem(storeKey, JSON.stringify(notes));
+      }});
+    }});
+"""
+
+def localstorage_script(page):
+    """
+    Returns the <script> that loads and saves a page's Trainers notes. It only
+    handles the Trainers cells next to it (the page, or the page's wrapper in a
+    merged file), so several pages can share one document.
+    """
+    return f"""<script>
+(function() {{
+  const page = {json.dumps(page)};
+  const storeKey = '{STORAGE_PREFIX}' + page;
+  const scope = document.currentScript ? document.currentScript.parentElement : document;
+  document.addEventListener('DOMContentLoaded', function() {{
+{LOAD_NOTES}  }});
+  {EXPORT_FUNCTION}
+}})();
+</script>"""
+
+def shared_script():
+    """
+    Returns the JavaScript (without <script> tags) that does what
+    localstorage_script does for every element with a data-trainers-page
+    attribute, so one copy of it serves any number of pages.
+    """
+    return f"""(function() {{
+  function loadNotes(page, scope) {{
+    const storeKey = '{STORAGE_PREFIX}' + page;
+{LOAD_NOTES}  }}
+  document.addEventListener('DOMContentLoaded', function() {{
+    document.querySelectorAll('[data-trainers-page]').forEach(scope => loadNotes(scope.dataset.trainersPage, scope));
+  }});
+  {EXPORT_FUNCTION}
+}})();
+"""
+
+def import_notes(db_path, notes):
+    """
+    Stores {page: {row key: text}} notes. Returns the number of notes changed.
+    """
+    conn = pokemon_store.connect(db_path)
+    try:
+        return sum(pokemon_store.save_annotations(conn, page, page_notes) for page, page_notes in notes.items())
+    finally:
+        conn.close()
+
+def export_notes(db_path):
+    conn = pokemon_store.connect(db_path)
+    try:
+        return pokemon_store.export_annotations(conn)
+    finally:
+        conn.close()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Import or export Trainers notes.")
+    arg_parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite store (default: %(default)s)")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="load notes from a JSON file into the store")
+    import_parser.add_argument("file")
+    export_parser = commands.add_parser("export", help="write the stored notes to a JSON file")
+    export_parser.add_argument("file")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "import":
+        with open(args.file, "r", encoding="utf-8") as f:
+            notes = json.load(f)
+        if not isinstance(notes, dict) or not all(isinstance(v, dict) for v in notes.values()):
+            print(f"[ERROR] {args.file} is not a {{page: {{row key: text}}}} object")
+            return 2
+        changed = import_notes(args.store, notes)
+        print(f"[INFO] Imported {changed} changed note(s); re-run the parsers to render them")
+        return 0
+    notes = export_notes(args.store)
+    with open(args.file, "w", encoding="utf-8") as f:
+        json.dump(notes, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"[INFO] Exported {sum(len(v) for v in notes.values())} note(s) to {args.file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
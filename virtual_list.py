@@ -0,0 +1,427 @@
+import argparse
+import json
+import os
+import re
+import sys
+import urllib.parse
+from html import escape
+
+import asset_store
+import build_cache
+import pokemon_store
+import static_server
+import trainer_annotations
+
+# ============================================================
+# Data-driven version of the final list: instead of every row of every area
+# as static markup, it writes
+#   <output>.html          a small shell: one section per page with its table
+#                          header and a spacer as tall as its rows will be,
+#                          plus the renderer below
+#   <output>_data/*.json   one compact JSON shard per page (location pages,
+#                          then swarm), named after a hash of its content
+# The renderer fetches a page's shard only when its section comes near the
+# viewport and keeps just the visible rows (plus a few either side) in the
+# DOM, so the first paint does not depend on how many rows there are.
+#
+# Rows come from the SQLite store written by the parser scripts. Trainers
+# cells are editable and share their notes with the location pages (one
+# localStorage entry per page, see trainer_annotations).
+#
+# fetch() does not work on file:// pages, so open it through the local server:
+#     python virtual_list.py --tile 50
+#     python static_server.py serve   ->  http://127.0.0.1:8000/conquest_list_virtual.html
+# ============================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.path.join(SCRIPT_DIR, pokemon_store.STORE_NAME)
+DEFAULT_OUTPUT = os.path.join(SCRIPT_DIR, "conquest_list_virtual.html")
+LIST_TITLE = "All Pokemon and Trainers in Pokemon Conquest"
+SOURCE_ORDER = ["location", "swarm"]  # Page order of the final list.
+
+# Every row of a page gets the same height, so the renderer can place rows by
+# index alone; it is sized for the page's tallest (most <br>-lines) cell.
+MIN_ROW_HEIGHT = 40
+LINE_HEIGHT = 18
+ROW_PADDING = 12
+# Fixed column widths (by lowercased header), so columns do not shift as rows come and go.
+COLUMN_WIDTHS = {
+    "no.": "4.5em",
+    "pic": "64px",
+    "name": "8em",
+    "type": "76px",
+    "hp": "3.5em",
+    "attack": "4em",
+    "defence": "4.5em",
+    "speed": "3.5em",
+    "movement range": "5.5em",
+    "area level": "6em",
+    "abilities": "9em",
+    "nation": "7em",
+}
+
+# The Pic cells' one-cell <table class="pkmn"> wrapper, which adds nothing.
+PKMN_TABLE_RE = re.compile(
+    r'^\s*<table class="pkmn">\s*(?:<tbody>\s*)?<tr>\s*<td>(.*)</td>\s*</tr>\s*(?:</tbody>\s*)?</table>\s*$',
+    re.DOTALL,
+)
+BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+UNSAFE_NAME_RE = re.compile(r"[^a-z0-9]+")
+
+STYLE = """
+body { font-family: sans-serif; }
+nav a { margin-right: 0.75em; }
+table.vtable { table-layout: fixed; width: 100%; border-collapse: collapse; }
+.vtable th, .vtable td { border: 1px solid #000; padding: 0 5px; overflow: hidden; }
+.vtable thead th { position: sticky; top: 0; background: #fff; }
+.vtable tr.row, .vtable tr.area, .vtable tr.error { height: var(--row); }
+.vtable tr.area th { text-align: left; font-size: 1.15em; }
+.vtable tr.error td { color: red; }
+.vtable tr.spacer td { padding: 0; border: 0; }
+.vtable img { max-height: calc(var(--row) - 8px); width: auto; vertical-align: middle; }
+.vtable td.trainers-col { white-space: nowrap; text-overflow: ellipsis; }
+.vtable td.trainers-col:focus { white-space: normal; text-overflow: clip; }
+"""
+
+RENDERER = """
+(function() {
+  const pages = JSON.parse(document.getElementById('vlist-manifest').textContent);
+  const storagePrefix = %(storage_prefix)s;
+  const overscan = 8;  // rows rendered above and below the viewport
+  const views = [];    // per page, once its shard has loaded
+
+  function escapeHtml(text) {
+    return text.replace(/[&<>"]/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})[c]);
+  }
+
+  function flatten(shard) {
+    // One item per rendered row: an area heading, an error, or a Pokemon.
+    const items = [];
+    shard.areas.forEach(area => {
+      if (area.error !== undefined) {
+        items.push({error: area.error});
+        return;
+      }
+      items.push({area: area.name});
+      area.rows.forEach((cells, i) => items.push({cells: cells, key: area.keys[i]}));
+    });
+    return items;
+  }
+
+  function rowHtml(view, index) {
+    const item = view.items[index];
+    const columns = view.page.columns;
+    if (item.area !== undefined) return '<tr class="area"><th colspan="' + columns + '">' + escapeHtml(item.area) + '</th></tr>';
+    if (item.error !== undefined) return '<tr class="error"><td colspan="' + columns + '">' + escapeHtml(item.error) + '</td></tr>';
+    const last = item.cells.length - 1;
+    let html = '<tr class="row">';
+    for (let c = 0; c < last; c++) html += '<td>' + item.cells[c] + '</td>';
+    const note = Object.prototype.hasOwnProperty.call(view.notes, item.key) ? escapeHtml(view.notes[item.key]) : item.cells[last];
+    return html + '<td contenteditable="true" class="trainers-col" data-key="' + escapeHtml(item.key) + '">' + note + '</td></tr>';
+  }
+
+  function rowsHtml(view, first, last) {
+    let html = '';
+    for (let i = first; i < last; i++) html += rowHtml(view, i);
+    return html;
+  }
+
+  function visibleRange(view) {
+    // Rows are all view.rowHeight tall, so the range follows from the tbody's position.
+    const count = view.items.length;
+    const top = view.tbody.getBoundingClientRect().top;
+    const first = Math.min(count, Math.max(0, Math.floor(-top / view.rowHeight) - overscan));
+    const last = Math.max(first, Math.min(count, Math.ceil((window.innerHeight - top) / view.rowHeight) + overscan));
+    return [first, last];
+  }
+
+  function applyRange(view, first, last) {
+    // Adds and removes rows only at the edges, so a cell being edited stays put while in range.
+    if (first === view.first && last === view.last) return;
+    if (first >= view.last || last <= view.first) {
+      while (view.top.nextElementSibling !== view.bottom) view.top.nextElementSibling.remove();
+      view.top.insertAdjacentHTML('afterend', rowsHtml(view, first, last));
+    } else {
+      for (let i = view.first; i < first; i++) view.top.nextElementSibling.remove();
+      if (first < view.first) view.top.insertAdjacentHTML('afterend', rowsHtml(view, first, view.first));
+      for (let i = last; i < view.last; i++) view.bottom.previousElementSibling.remove();
+      if (last > view.last) view.bottom.insertAdjacentHTML('beforebegin', rowsHtml(view, view.last, last));
+    }
+    view.first = first;
+    view.last = last;
+    view.top.cells[0].style.height = first * view.rowHeight + 'px';
+    view.bottom.cells[0].style.height = (view.items.length - last) * view.rowHeight + 'px';
+  }
+
+  function checkRowHeight(view) {
+    // A row taller than planned (e.g. a bigger sprite) would drift; re-plan with its real height.
+    const row = view.tbody.querySelector('tr.row');
+    if (!row) return false;
+    view.measured = true;
+    const height = row.getBoundingClientRect().height;
+    if (height <= view.rowHeight + 0.5) return false;
+    view.rowHeight = Math.ceil(height);
+    view.section.style.setProperty('--row', view.rowHeight + 'px');
+    view.first = view.last = -1;  // re-render with the new spacer heights
+    return true;
+  }
+
+  let scheduled = false;
+  function update() {
+    scheduled = false;
+    // Read every position first, then change the DOM, so each frame lays out once.
+    const ranges = views.map(visibleRange);
+    views.forEach((view, i) => applyRange(view, ranges[i][0], ranges[i][1]));
+    if (views.some(view => !view.measured && checkRowHeight(view))) schedule();
+  }
+  function schedule() {
+    if (!scheduled) {
+      scheduled = true;
+      requestAnimationFrame(update);
+    }
+  }
+
+  function loadNotes(page) {
+    try {
+      return JSON.parse(localStorage.getItem(storagePrefix + page) || '{}') || {};
+    } catch (e) {
+      return {};
+    }
+  }
+
+  function load(index) {
+    const page = pages[index];
+    const section = document.getElementById(page.id);
+    fetch(page.shard).then(response => {
+      if (!response.ok) throw new Error(response.status + ' ' + response.statusText);
+      return response.json();
+    }).then(shard => {
+      const tbody = section.querySelector('tbody');
+      const view = {
+        page: page, section: section, tbody: tbody, items: flatten(shard), notes: loadNotes(page.page),
+        rowHeight: page.rowHeight, top: tbody.rows[0], bottom: tbody.rows[1], first: -1, last: -1, measured: false,
+      };
+      tbody.addEventListener('input', event => {
+        const cell = event.target.closest('td.trainers-col');
+        if (!cell) return;
+        view.notes[cell.dataset.key] = cell.textContent;
+        localStorage.setItem(storagePrefix + page.page, JSON.stringify(view.notes));
+      });
+      views.push(view);
+      schedule();
+    }).catch(error => {
+      const message = document.createElement('p');
+      message.style.color = 'red';
+      message.textContent = 'Could not load ' + page.shard + ' (' + error.message + '); open this page through static_server.py.';
+      section.insertBefore(message, section.querySelector('table'));
+    });
+  }
+
+  const observer = new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+      if (!entry.isIntersecting) return;
+      observer.unobserve(entry.target);
+      load(Number(entry.target.dataset.index));
+    });
+  }, {rootMargin: '100%% 0px'});
+  pages.forEach(page => observer.observe(document.getElementById(page.id)));
+  window.addEventListener('scroll', schedule, {passive: true});
+  window.addEventListener('resize', schedule);
+
+  %(export_function)s
+})();
+"""
+
+def load_pages(conn):
+    """
+    Returns every stored page as (source, page, headers, areas), in the order
+    of the final list: location pages by name, then the swarm page.
+    """
+    names = conn.execute("SELECT source, location FROM pages").fetchall()
+    order = {source: position for position, source in enumerate(SOURCE_ORDER)}
+    names = sorted(names, key=lambda row: (order.get(row["source"], len(order)), row["source"], row["location"]))
+    pages = []
+    for row in names:
+        headers, areas = pokemon_store.load_page(conn, row["source"], row["location"])
+        pages.append((row["source"], row["location"], headers, areas))
+    return pages
+
+def tile_areas(areas, factor):
+    """
+    Repeats every area's rows factor times (for load testing).
+    """
+    return [(area_name, status, rows * factor) for area_name, status, rows in areas]
+
+def compact_cell(cell):
+    """
+    Drops the Pic cells' one-cell table wrapper; other cells are kept as they are.
+    """
+    match = PKMN_TABLE_RE.match(cell)
+    return match.group(1).strip() if match else cell
+
+def build_shard(headers, areas):
+    """
+    Returns the JSON-ready shard of one page: its areas in order, each either
+    {"name", "rows", "keys"} or {"error"} (worded like the static pages).
+    Rows are lists of cell HTML in the order of headers; keys are the rows'
+    Trainers note keys (pokemon_store.annotation_keys).
+    """
+    shard_areas = []
+    for area_name, status, rows in areas:
+        if status == pokemon_store.AREA_NOT_FOUND:
+            shard_areas.append({"error": f"Could not find area: {area_name}"})
+        elif status == pokemon_store.AREA_NO_TABLE:
+            shard_areas.append({"error": f"No dextable found for {area_name}"})
+        else:
+            shard_areas.append({
+                "name": area_name.title(),
+                "rows": [[compact_cell(cell) for cell in row] for row in rows],
+                "keys": pokemon_store.annotation_keys(area_name, headers, rows),
+            })
+    return {"areas": shard_areas}
+
+def row_height(shard):
+    """
+    Height in pixels of every row of a page, enough for its tallest cell.
+    """
+    lines = max((len(BR_RE.findall(cell)) + 1 for area in shard["areas"] for row in area.get("rows", [])
+                 for cell in row), default=1)
+    return max(MIN_ROW_HEIGHT, lines * LINE_HEIGHT + ROW_PADDING)
+
+def item_count(shard):
+    return sum(1 + len(area.get("rows", [])) if "name" in area else 1 for area in shard["areas"])
+
+def write_shard(data_dir, page, shard):
+    """
+    Writes a shard as "<page>.<content hash>.json" (so the static server may
+    cache it for good) and returns its file name.
+    """
+    data = json.dumps(shard, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    file_name = f"{UNSAFE_NAME_RE.sub('-', page.lower()).strip('-') or 'page'}.{build_cache.bytes_digest(data)[:12]}.json"
+    path = os.path.join(data_dir, file_name)
+    if not os.path.exists(path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    return file_name
+
+def render_shell(entries, title=LIST_TITLE, output_file=DEFAULT_OUTPUT):
+    """
+    Returns the list page for the given manifest entries (see write_virtual_list),
+    to be written to output_file.
+    """
+    nav = " ".join(f'<a href="#{entry["id"]}">{escape(entry["title"])}</a>' for entry in entries)
+    sections = []
+    for index, entry in enumerate(entries):
+        cols = "".join(
+            f'<col style="width:{COLUMN_WIDTHS[head.lower()]}">' if head.lower() in COLUMN_WIDTHS else "<col>"
+            for head in entry["headers"]
+        )
+        heads = "".join(f"<th>{head}</th>" for head in entry["headers"])
+        columns = len(entry["headers"])
+        sections.append(
+            f'<section id="{entry["id"]}" data-index="{index}" style="--row:{entry["rowHeight"]}px">\n'
+            f'<h2>{escape(entry["title"])}</h2>\n'
+            f'<table class="vtable"><colgroup>{cols}</colgroup><thead><tr>{heads}</tr></thead><tbody>'
+            f'<tr class="spacer"><td colspan="{columns}" style="height:{entry["items"] * entry["rowHeight"]}px"></td></tr>'
+            f'<tr class="spacer"><td colspan="{columns}" style="height:0px"></td></tr>'
+            f"</tbody></table>\n</section>"
+        )
+    manifest = [
+        {"id": entry["id"], "page": entry["page"], "title": entry["title"], "shard": entry["shard"],
+         "items": entry["items"], "rowHeight": entry["rowHeight"], "columns": len(entry["headers"])}
+        for entry in entries
+    ]
+    # "</" would end the <script> early.
+    manifest_json = json.dumps(manifest, ensure_ascii=False).replace("</", "<\\/")
+    sections_html = "\n".join(sections)
+    renderer = RENDERER % {
+        "storage_prefix": json.dumps(trainer_annotations.STORAGE_PREFIX),
+        "export_function": trainer_annotations.EXPORT_FUNCTION,
+    }
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+  <title>{escape(title)}</title>{asset_store.stylesheet_link(output_file)}
+  <style>{STYLE}</style>
+</head>
+<body>
+<h1>{escape(title)}</h1>
+<nav>{nav}</nav>
+{sections_html}
+<script type="application/json" id="vlist-manifest">{manifest_json}</script>
+<script>{renderer}</script>
+</body>
+</html>
+"""
+
+def write_virtual_list(db_path, output_file, tile=1, precompress=True):
+    """
+    Writes the list page and its shards (into "<output stem>_data/", removing
+    shards from earlier runs). Returns the number of pages and rows written.
+    """
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Store not found: {db_path}")
+    conn = pokemon_store.connect(db_path)
+    try:
+        pages = load_pages(conn)
+    finally:
+        conn.close()
+
+    data_name = os.path.splitext(os.path.basename(output_file))[0] + "_data"
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(output_file)), data_name)
+    os.makedirs(data_dir, exist_ok=True)
+    entries = []
+    total_rows = 0
+    for source, page, headers, areas in pages:
+        if tile > 1:
+            areas = tile_areas(areas, tile)
+        shard = build_shard(headers, areas)
+        file_name = write_shard(data_dir, page, shard)
+        total_rows += sum(len(rows) for _, _, rows in areas)
+        entries.append({
+            "id": f"page-{UNSAFE_NAME_RE.sub('-', f'{source} {page}'.lower()).strip('-')}",
+            "page": page,
+            "title": page.title(),
+            "shard": urllib.parse.quote(f"{data_name}/{file_name}"),
+            "file": file_name,
+            "headers": headers,
+            "items": item_count(shard),
+            "rowHeight": row_height(shard),
+        })
+
+    current = {entry["file"] for entry in entries}
+    for file_name in os.listdir(data_dir):
+        shard_name = file_name
+        for suffix in static_server.VARIANT_SUFFIXES:
+            if shard_name.endswith(suffix):
+                shard_name = shard_name[:-len(suffix)]
+        if shard_name.endswith(".json") and shard_name not in current:
+            os.remove(os.path.join(data_dir, file_name))
+
+    with open(output_file, "w", encoding="utf-8") as out:
+        out.write(render_shell(entries, output_file=output_file))
+    if precompress:
+        static_server.precompress_file(output_file)
+        for file_name in current:
+            static_server.precompress_file(os.path.join(data_dir, file_name))
+    return len(entries), total_rows
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Write the virtualized, data-driven version of the final list.")
+    arg_parser.add_argument("--store", default=DEFAULT_STORE, help="SQLite store (default: %(default)s)")
+    arg_parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="list page to write (default: %(default)s)")
+    arg_parser.add_argument("--tile", type=int, default=1, help="repeat every area's rows this many times (load testing)")
+    arg_parser.add_argument("--no-precompress", action="store_true", help="do not write .gz/.br variants")
+    args = arg_parser.parse_args(argv)
+    try:
+        page_count, row_count = write_virtual_list(args.store, args.output, max(1, args.tile), not args.no_precompress)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    print(f"[INFO] Wrote {args.output} with {page_count} page(s), {row_count} row(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+import build
+import build_cache
+import output_optimizer
+import page_render
+import static_server
+from script_loader import FINAL_MERGER, LOCATION_MERGER, LOCATION_PARSER, SCRIPT_DIR, load_script
+
+# ============================================================
+# Watch mode for editing the source pages one at a time.
+#
+# Watches "shtml's of location"/ and swarms.shtml (inotify on Linux, polling
+# elsewhere or with --poll). When a page is saved, only that page is parsed
+# again (process_file for a location page, the swarm parser for swarms.shtml),
+# and only its <!-- START of ... -->/<!-- END of ... --> block is replaced in
+# merged.html, and merged.html's (or swarm_pokemon.html's) block in
+# all_pokemon.html. Both end up exactly as a full rebuild would write them.
+#     python watch.py                 # paths as in build.py, under --root
+#     python watch.py --poll --interval 0.5
+# ============================================================
+POLL_INTERVAL = 0.25  # Seconds between scans when polling.
+SETTLE_DELAY = 0.05  # Editors often save in several writes; wait this long after the first event.
+
+# From <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by len bytes of name
+
+class PollingWatcher:
+    """
+    Reports files in the watched directories whose modification time or size
+    changed since the previous scan.
+    """
+    kind = "polling"
+
+    def __init__(self, directories, interval=POLL_INTERVAL):
+        self.directories = directories
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def changes(self, timeout):
+        time.sleep(min(self.interval, timeout))
+        snapshot = self.scan()
+        changed = {path for path, key in snapshot.items() if self.snapshot.get(path) != key}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """
+    Reports files written (closed after writing) or moved into the watched
+    directories, using the Linux inotify API through libc.
+    """
+    kind = "inotify"
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # AttributeError here (no inotify in this libc) makes the caller poll instead.
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"cannot watch {directory}")
+            self.directories[wd] = directory
+
+    def changes(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        time.sleep(SETTLE_DELAY)
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                offset += INOTIFY_EVENT.size + length
+                if name and wd in self.directories:
+                    changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+def make_watcher(directories, poll=False, interval=POLL_INTERVAL):
+    if not poll:
+        try:
+            return InotifyWatcher(directories)
+        except (AttributeError, OSError) as e:
+            print(f"[INFO] inotify is not available ({e}); polling every {interval}s instead")
+    return PollingWatcher(directories, interval)
+
+def patch_or_merge(merged_path, file_path, merge):
+    """
+    Patches file_path's block in merged_path, or runs merge() (a full merge)
+    when the merged file or the block is not there yet, or the output is
+    optimized (optimized merges have no blocks to patch).
+    """
+    start = time.perf_counter()
+    if (not output_optimizer.enabled() and os.path.isfile(merged_path)
+            and page_render.patch_merged_file(merged_path, file_path)):
+        print(f"[INFO] Patched {os.path.basename(file_path)} in {merged_path} ({time.perf_counter() - start:.2f}s)")
+    else:
+        merge()
+
+def update_final(paths, changed_file):
+    """
+    Patches changed_file (merged.html or swarm_pokemon.html) in all_pokemon.html,
+    if the final merge has been built.
+    """
+    if not os.path.isfile(paths["final"]):
+        return
+    final_merger = load_script(FINAL_MERGER)
+    patch_or_merge(paths["final"], changed_file,
+                   lambda: final_merger.merge_html_files([paths["merged"], paths["swarm"]], paths["final"]))
+    static_server.precompress_file(paths["final"])
+
+def update_location(paths, input_file):
+    output_file = load_script(LOCATION_PARSER).process_file(input_file, paths["locations"],
+                                                            store_file=paths["store"])
+    if not output_file:
+        return False
+    merger = load_script(LOCATION_MERGER)
+    patch_or_merge(paths["merged"], output_file,
+                   lambda: merger.merge_html_files(paths["locations"], paths["merged"]))
+    update_final(paths, paths["merged"])
+    return True
+
+def update_swarm(paths):
+    if not build.run_swarm(paths, jobs=1, force=False):
+        return False
+    update_final(paths, paths["swarm"])
+    return True
+
+def watch(paths, poll=False, interval=POLL_INTERVAL):
+    location_pages = paths["location_pages"]
+    watcher = make_watcher([location_pages, os.path.dirname(paths["swarm_page"])], poll, interval)
+    watched = lambda path: (path == paths["swarm_page"] or (
+        os.path.dirname(path) == location_pages and path.lower().endswith((".shtml", ".html"))))
+    digests = {}
+    for directory in (location_pages, os.path.dirname(paths["swarm_page"])):
+        for file_name in os.listdir(directory):
+            path = os.path.join(directory, file_name)
+            if watched(path):
+                digests[path] = build_cache.file_digest(path)
+    print(f"[INFO] Watching {location_pages} and {paths['swarm_page']} ({watcher.kind}); Ctrl-C to stop")
+    try:
+        while True:
+            for path in sorted(watcher.changes(timeout=1.0)):
+                if not watched(path):
+                    continue
+                # Saving without changes (or touching the file) does nothing.
+                digest = build_cache.file_digest(path)
+                if digest is None or digest == digests.get(path):
+                    continue
+                digests[path] = digest
+                start = time.perf_counter()
+                try:
+                    if path == paths["swarm_page"]:
+                        ok = update_swarm(paths)
+                    else:
+                        ok = update_location(paths, path)
+                except Exception:
+                    traceback.print_exc()
+                    ok = False
+                status = "updated" if ok else "FAILED"
+                print(f"[INFO] {os.path.basename(path)}: {status} in {time.perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Re-parse changed source pages and patch the merged outputs.")
+    arg_parser.add_argument("--root", default=SCRIPT_DIR,
+                            help="directory laid out as for build.py (default: %(default)s)")
+    arg_parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    arg_parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                            help="seconds between scans when polling (default: %(default)s)")
+    arg_parser.add_argument("--optimize", action="store_true",
+                            help="write size-optimized pages and merges (see output_optimizer.py)")
+    args = arg_parser.parse_args(argv)
+    if args.optimize:
+        output_optimizer.enable()
+
+    paths = build.build_paths(args.root)
+    if not os.path.isdir(paths["location_pages"]):
+        print(f"Input directory not found: {paths['location_pages']}")
+        return 1
+    os.makedirs(paths["locations"], exist_ok=True)
+    watch(paths, args.poll, max(0.01, args.interval))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,103 @@
+import argparse
+import contextlib
+import io
 import os
-from bs4 import BeautifulSoup
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
-try:
-    import chardet
-except ImportError:
-    chardet = None
+import asset_store
+import build_cache
+import encoding_detect
+import html_backends
+import html_fixups
+import instrumentation
+import output_optimizer
+import page_render
+import pokemon_store
+import row_pipeline
+import script_loader
+import trainer_annotations
+from area_lookup import build_area_index, find_area_table
 
 # -----------------------------
 # Configuration: Set your directories here.
 # -----------------------------
 INPUT_DIR = "/Users/nicholaschang/Helpful Scripts/conquest parse/shtml's of location"
 OUTPUT_DIR = "/Users/nicholaschang/Helpful Scripts/conquest parse/conquest_locations"
+STORE_FILE = "/Users/nicholaschang/Helpful Scripts/conquest parse/conquest_pokemon.sqlite"
 BASE_URL = "https://www.serebii.net"
+JOBS = os.cpu_count() or 1  # Worker processes used by main(); override with --jobs.
+PARSER_VERSION = 1  # Bump when the generated HTML changes, to invalidate the build cache.
 
-def process_file(input_file, output_dir):
+# Columns of every generated location table.
+TABLE_HEADERS = [
+    "No.",
+    "Pic",
+    "Name",
+    "Type",
+    "HP",
+    "Attack",
+    "Defence",
+    "Speed",
+    "Movement Range",
+    "Area Level",
+    "Trainers"
+]
+
+def build_fingerprint():
+    """
+    Identifies this parser's code and configuration in the build manifest.
+    """
+    return build_cache.fingerprint(__file__, PARSER_VERSION,
+                                   {"BASE_URL": BASE_URL, "parser": html_backends.current_backend(),
+                                    "atlas": asset_store.fingerprint(), "optimize": output_optimizer.fingerprint()},
+                                   sys.modules[__name__])
+
+@instrumentation.instrumented("location", name_arg=0, none_fails=True)
+def process_file(input_file, output_dir, force=False, store_file=None):
+    """
+    Parses one location page into the SQLite store (store_file, default STORE_FILE)
+    and renders "<location>_pokemon.html" into output_dir from the stored rows.
+    Pages whose content, parser and config are unchanged since the last build
+    (per the manifest in output_dir) are skipped unless force is set.
+    Returns the path of the written file, or None if the page could not be processed.
+    """
+    store_file = store_file or STORE_FILE
     if not os.path.isfile(input_file):
         print(f"Could not find file: {input_file}")
-        return
+        return None
 
     # Read file in binary mode for encoding detection.
     with open(input_file, "rb") as f:
         raw_data = f.read()
+    instrumentation.lap("read")
 
-    if chardet:
-        detected = chardet.detect(raw_data)
-        encoding = detected.get("encoding", "utf-8")
-        print(f"Detected encoding for {os.path.basename(input_file)}: {encoding}")
-    else:
-        encoding = "utf-8"
-        print(f"Chardet not installed; using utf-8 with replacement for {os.path.basename(input_file)}.")
+    manifest_path = build_cache.manifest_path_for(output_dir)
+    input_digest = build_cache.bytes_digest(raw_data)
+    fingerprint = build_fingerprint()
+    if not force:
+        cached_output = build_cache.lookup(manifest_path, input_file, input_digest, fingerprint)
+        if cached_output and pokemon_store.has_input(store_file, input_digest):
+            instrumentation.lap("cache")
+            instrumentation.count("cache_hits")
+            print(f"Unchanged: {os.path.basename(input_file)}; reusing '{cached_output}'.")
+            return cached_output
+    instrumentation.lap("cache")
+
+    encoding, method = encoding_detect.detect_encoding(
+        raw_data, input_digest, os.path.join(output_dir, encoding_detect.CACHE_NAME)
+    )
+    print(f"Detected encoding for {os.path.basename(input_file)}: {encoding} ({encoding_detect.describe(method)})")
+    instrumentation.lap("encoding")
 
     # Decode using the detected encoding.
     text = raw_data.decode(encoding, errors="replace")
-    soup = BeautifulSoup(text, "html.parser")
+    soup = html_backends.make_soup(text)
+    instrumentation.lap("parse")
 
-    # Extract location name from the title.
-    title_text = soup.title.get_text() if soup.title else "Unknown Location"
-    location = title_text.split("-")[-1].strip().lower()
+    location = location_name(soup)
     print(f"Detected location: {location} in file {os.path.basename(input_file)}")
 
     # Set the output file name to "<location>_pokemon.html" and place it in the output directory.
@@ -50,47 +111,155 @@ def process_file(input_file, output_dir):
         area_names = get_area_names_from_anctab(soup)
     if not area_names:
         print(f"No area names found in file: {input_file}")
-        return
+        return None
+
+    # Index every area anchor once so each area lookup below is a dict hit.
+    area_index = build_area_index(soup)
+    instrumentation.lap("areas")
+    instrumentation.count("areas", len(area_names))
+    areas = [extract_area(soup, area, area_index) for area in area_names]
+    instrumentation.lap("extract")
+    instrumentation.count("rows", sum(len(rows) for _, _, rows in areas))
 
-    sections = []
-    for area in area_names:
-        section_html = parse_area_section(soup, area)
-        if section_html:
-            sections.append(section_html)
-
-    final_html = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <title>{location.title()} Areas</title>
-</head>
-<body>
-  <h1>{location.title()}</h1>
-  {''.join(sections)}
-  {localstorage_script(location)}
-</body>
-</html>
-"""
-    with open(output_file_path, "w", encoding="utf-8") as out:
-        out.write(final_html)
+    # Save the typed rows, then render the page from what is in the store.
+    conn = pokemon_store.connect(store_file)
+    try:
+        pokemon_store.save_page(conn, "location", location, TABLE_HEADERS, areas, input_digest)
+        headers, areas = pokemon_store.load_page(conn, "location", location)
+    finally:
+        conn.close()
+    instrumentation.lap("store")
+
+    # The page is written as it is rendered, one table row at a time.
+    sections = (chunk for area, status, rows in areas for chunk in iter_area_section(area, status, headers, rows))
+    output_digest = page_render.PAGE.write_file(
+        output_file_path,
+        title=f"{location.title()} Areas",
+        head=asset_store.stylesheet_link(output_file_path),
+        heading=location.title(),
+        body=sections,
+        script=localstorage_script(location),
+    )
+    instrumentation.lap("render")
+    build_cache.record(manifest_path, input_file, input_digest, PARSER_VERSION, fingerprint,
+                       output_file_path, output_digest)
+    instrumentation.lap("write")
     print(f"Done! Output saved to '{output_file_path}'.")
+    return output_file_path
+
+def process_file_job(input_file, output_dir, force=False, store_file=None):
+    """
+    Runs process_file in a worker and collects everything it would have printed,
+    so that main() can report each file in order once the whole batch is done.
+    Returns a dict with the input, output path (or None), captured log, error
+    traceback (or None) and the wall/CPU seconds spent on the file.
+    """
+    log = io.StringIO()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    output_file = None
+    error = None
+    with contextlib.redirect_stdout(log):
+        try:
+            output_file = process_file(input_file, output_dir, force, store_file)
+        except Exception:
+            error = traceback.format_exc()
+    return {
+        "input": input_file,
+        "output": output_file,
+        "log": log.getvalue(),
+        "error": error,
+        "wall": time.perf_counter() - wall_start,
+        "cpu": time.process_time() - cpu_start,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse every location page in INPUT_DIR.")
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS,
+                        help=f"number of worker processes (default: {JOBS})")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="rebuild every page even if the build manifest says it is unchanged")
+    parser.add_argument("--parser", choices=sorted(html_backends.BACKENDS), default=html_backends.current_backend(),
+                        help="HTML parser backend for whole pages (default: %(default)s)")
+    parser.add_argument("--instrument", metavar="FILE",
+                        help="append per-file stage timings, memory and counts to FILE as JSON lines")
+    parser.add_argument("--profile-dir", metavar="DIR",
+                        help="with --instrument, also write a cProfile dump per file into DIR")
+    parser.add_argument("--atlas", nargs="?", metavar="INDEX",
+                        const=os.path.join(asset_store.ASSET_DIR, asset_store.INDEX_NAME),
+                        help="draw icons from the sprite atlases of asset_store.py (default index: %(const)s)")
+    parser.add_argument("--optimize", action="store_true",
+                        help="write size-optimized pages with shared CSS/JS (see output_optimizer.py)")
+    args = parser.parse_args(argv)
+    html_backends.set_backend(args.parser)
+    if args.optimize:
+        output_optimizer.enable()
+    if args.atlas:
+        try:
+            asset_store.enable(args.atlas)
+        except FileNotFoundError as e:
+            print(f"[ERROR] {e}")
+            return 1
+    if args.instrument:
+        instrumentation.enable(args.instrument, args.profile_dir)
+    jobs = max(1, args.jobs)
+    force = args.force
 
-def main():
     # Check if the input directory exists.
     if not os.path.isdir(INPUT_DIR):
         print(f"Input directory not found: {INPUT_DIR}")
-        return
+        return 1
 
     # Create the output directory if it doesn't exist.
     if not os.path.isdir(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
         print(f"Created output directory: {OUTPUT_DIR}")
+    # Cached pages are not rewritten, but still need the shared files next to them.
+    if output_optimizer.enabled():
+        output_optimizer.write_shared_assets(OUTPUT_DIR)
 
     # Process each file in the input directory that ends with .shtml or .html.
-    for file_name in os.listdir(INPUT_DIR):
-        if file_name.lower().endswith((".shtml", ".html")):
-            input_file_path = os.path.join(INPUT_DIR, file_name)
-            process_file(input_file_path, OUTPUT_DIR)
+    # Files are sorted so the report below comes out in the same order every run.
+    input_files = [
+        os.path.join(INPUT_DIR, file_name)
+        for file_name in sorted(os.listdir(INPUT_DIR))
+        if file_name.lower().endswith((".shtml", ".html"))
+    ]
+    output_dirs = [OUTPUT_DIR] * len(input_files)
+    forces = [force] * len(input_files)
+    store_files = [STORE_FILE] * len(input_files)
+
+    wall_start = time.perf_counter()
+    if jobs == 1 or len(input_files) <= 1:
+        results = list(map(process_file_job, input_files, output_dirs, forces, store_files))
+    else:
+        # Loaded through script_loader, this module's name exists only in processes
+        # that loaded it; the initializer loads it in each worker too, so the jobs
+        # can be unpickled there with any start method (spawn is macOS's default).
+        initargs = (os.path.basename(__file__),) if __name__ != "__main__" else ()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=script_loader.load_script if initargs else None,
+                                 initargs=initargs) as executor:
+            results = list(executor.map(process_file_job, input_files, output_dirs, forces, store_files))
+    wall_time = time.perf_counter() - wall_start
+
+    # Report every file in input order, then the failures and the timing summary.
+    failures = []
+    for result in results:
+        print(f"--- {os.path.basename(result['input'])} ({result['wall']:.2f}s)")
+        print(result["log"], end="")
+        if result["error"] or not result["output"]:
+            failures.append(result)
+    for result in failures:
+        print(f"[ERROR] {result['input']}")
+        if result["error"]:
+            print(result["error"], end="")
+    cpu_time = sum(result["cpu"] for result in results)
+    print(
+        f"Processed {len(results) - len(failures)}/{len(results)} files with {jobs} job(s): "
+        f"{wall_time:.2f}s wall, {cpu_time:.2f}s CPU"
+        + (f" ({cpu_time / wall_time:.1f}x)" if wall_time > 0 else "")
+    )
+    return 1 if failures else 0
 
 def get_area_names_from_anchors(soup):
     """
@@ -123,149 +292,119 @@ def get_area_names_from_anctab(soup):
             area_names.append(text)
     return area_names
 
-def parse_area_section(soup, area_name):
+def extract_area(soup, area_name, area_index=None):
     """
     Search for a <p> tag that is likely the anchor for the given area.
     First, look for a <p> that has an <a> tag with a name attribute exactly matching area_name.
     If not found, fall back to any <p> whose text contains (or is contained by) area_name.
-    Then, take the next table with class "dextable" and process it.
-    Returns an HTML snippet with an H3 heading and the processed table.
+    Then, take the next table with class "dextable" and extract its rows.
+    Pass an index from build_area_index when looking up several areas in the same soup.
+    Returns (area_name, status, rows) with status one of the pokemon_store.AREA_* values.
     """
-    area_p = None
-    # Try to find a <p> with an <a name="..."> that equals area_name.
-    for p_tag in soup.find_all("p"):
-        a_tag = p_tag.find("a", attrs={"name": True})
-        if a_tag and a_tag.get("name", "").lower() == area_name:
-            area_p = p_tag
-            break
-    # If not found, try a fuzzy match.
+    if area_index is None:
+        area_index = build_area_index(soup)
+    area_p, area_table = find_area_table(area_index, area_name)
     if not area_p:
-        for p_tag in soup.find_all("p"):
-            p_text = p_tag.get_text(strip=True).lower()
-            if area_name in p_text or p_text in area_name:
-                area_p = p_tag
-                break
-    if not area_p:
-        return f"<p style='color:red;'>Could not find area: {area_name}</p>"
-    area_table = area_p.find_next("table", class_="dextable")
+        return area_name, pokemon_store.AREA_NOT_FOUND, []
     if not area_table:
-        return f"<p style='color:red;'>No dextable found for {area_name}</p>"
-    headers, rows = extract_table_data(area_table)
-    table_html = build_table_html(headers, rows)
-    section_html = (
-        f"<h3 style='margin-bottom: 5px;'>{area_name.title()}</h3>\n"
-        f"{table_html}\n"
-        f"<div style='margin-bottom: 20px;'></div>"
-    )
-    return section_html
+        return area_name, pokemon_store.AREA_NO_TABLE, []
+    _, rows = extract_table_data(area_table)
+    return area_name, pokemon_store.AREA_OK, rows
+
+def iter_area_section(area_name, status, headers, rows):
+    """
+    Yields the HTML for one area in chunks: an H3 heading and the processed
+    table (one chunk per row), or a red error paragraph if the area or its
+    table was not found.
+    """
+    if status == pokemon_store.AREA_NOT_FOUND:
+        yield f"<p style='color:red;'>Could not find area: {area_name}</p>"
+        return
+    if status == pokemon_store.AREA_NO_TABLE:
+        yield f"<p style='color:red;'>No dextable found for {area_name}</p>"
+        return
+    yield f"<h3 style='margin-bottom: 5px;'>{area_name.title()}</h3>\n"
+    yield from page_render.iter_table_html(headers, rows, pokemon_store.annotation_keys(area_name, headers, rows))
+    yield "\n<div style='margin-bottom: 20px;'></div>"
 
-def extract_table_data(table):
+def render_area_section(area_name, status, headers, rows):
+    """
+    Returns an HTML snippet with an H3 heading and the processed table for one
+    area, or a red error paragraph if the area or its table was not found.
+    """
+    return "".join(iter_area_section(area_name, status, headers, rows))
+
+def parse_area_section(soup, area_name, area_index=None):
+    """
+    Extracts one area and renders it straight to HTML, without the store.
+    Returns an HTML snippet with an H3 heading and the processed table.
+    """
+    area_name, status, rows = extract_area(soup, area_name, area_index)
+    return render_area_section(area_name, status, TABLE_HEADERS, rows)
+
+def location_name(soup):
+    """
+    Returns the location a page is about: the last "-" part of its title, lowercased.
+    """
+    title_text = soup.title.get_text() if soup.title else "Unknown Location"
+    return title_text.split("-")[-1].strip().lower()
+
+def extract_table_data(table, columns=None):
     """
     Extract rows from the given table (skipping its header row) and reorder the columns into:
       No. | Pic | Name | Type | HP | Attack | Defence | Speed | Movement Range | Area Level | Trainers
-    Pokémon names are delinked.
+    Pokémon names are delinked. With columns (names from TABLE_COLUMNS or
+    FIELD_COLUMNS), only those are extracted, in that order.
     """
-    headers = [
-        "No.",
-        "Pic",
-        "Name",
-        "Type",
-        "HP",
-        "Attack",
-        "Defence",
-        "Speed",
-        "Movement Range",
-        "Area Level",
-        "Trainers"
-    ]
-    data_rows = []
-    all_rows = table.find_all("tr", recursive=False)
-    data_trs = all_rows[1:]  # skip header row
-    for tr in data_trs:
-        cells = [child for child in tr.children if getattr(child, "name", None) == "td"]
-        if len(cells) < 10:
-            continue
-        no_          = cells[0].get_text(strip=True)
-        pic_html     = fix_images(cells[1])
-        name_text    = cells[2].get_text(strip=True)
-        type_html    = fix_images(cells[3])
-        orig_hp      = cells[4].get_text(strip=True)
-        orig_attack  = cells[5].get_text(strip=True)
-        orig_defence = cells[6].get_text(strip=True)
-        orig_speed   = cells[7].get_text(strip=True)
-        orig_move    = cells[8].get_text(strip=True)
-        orig_area    = cells[9].get_text(strip=True)
-        new_row = [
-            no_,
-            pic_html,
-            name_text,
-            type_html,
-            orig_hp,
-            orig_attack,
-            orig_defence,
-            orig_speed,
-            orig_move,
-            orig_area,
-            ""  # Trainers (editable)
-        ]
-        data_rows.append(new_row)
-    return headers, data_rows
+    headers = list(columns or TABLE_HEADERS)
+    return headers, list(iter_table_rows(table, headers))
+
+def iter_table_rows(table, columns=None, strict=True):
+    """
+    Lazily yields the rows of extract_table_data, computing only the named
+    columns (default: TABLE_HEADERS). See row_pipeline.select for strict.
+    """
+    selected = row_pipeline.select(TABLE_COLUMNS + FIELD_COLUMNS, columns or TABLE_HEADERS, strict)
+    return row_pipeline.iter_rows(table, selected, MIN_CELLS)
 
 def fix_images(cell_tag):
     """
-    Converts the inner HTML of the cell using BeautifulSoup and
-    prepends BASE_URL to any <img> tag's src that starts with "/".
+    Returns the inner HTML of the cell with BASE_URL prepended to any
+    <img> tag's src that starts with "/".
     """
-    temp_soup = BeautifulSoup(cell_tag.decode_contents(), "html.parser")
-    for img in temp_soup.find_all("img"):
-        src = img.get("src", "")
-        if src.startswith("/"):
-            img["src"] = BASE_URL + src
-    return temp_soup.decode()
-
-def build_table_html(headers, rows):
+    return html_fixups.rewrite_cell_html(cell_tag, BASE_URL, html_fixups.SRC_ROOTED)
+
+# Source cells of the TABLE_HEADERS columns (None for Trainers, which starts
+# out empty), and of the typed fields for data-only consumers.
+MIN_CELLS = 10
+TABLE_COLUMNS = [
+    row_pipeline.Column(header, cell, extract) for header, cell, extract in zip(
+        TABLE_HEADERS,
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, None],
+        [row_pipeline.text, fix_images, row_pipeline.text, fix_images] + [row_pipeline.text] * 6 + [row_pipeline.blank],
+    )
+]
+FIELD_COLUMNS = row_pipeline.field_columns({
+    "dex_no": 0, "name": 2, "types": 3, "hp": 4, "attack": 5, "defence": 6, "speed": 7, "movement": 8,
+    "area_level": 9, "area_level_text": 9,
+})
+
+def build_table_html(headers, rows, row_keys=None):
     """
     Builds an HTML table with the provided headers and rows.
     The final column (Trainers) is set to be contenteditable.
+    With row_keys (see pokemon_store.annotation_keys), each Trainers cell
+    carries its row's key so saved notes follow the row, not its position.
     """
-    html = []
-    html.append('<table border="1" cellpadding="5" cellspacing="0" style="border-collapse:collapse;">')
-    html.append("<thead><tr>")
-    for head in headers:
-        html.append(f"<th>{head}</th>")
-    html.append("</tr></thead>")
-    html.append("<tbody>")
-    for row in rows:
-        html.append("<tr>")
-        for col_index, cell_data in enumerate(row):
-            if col_index == len(row) - 1:
-                html.append(f'<td contenteditable="true" class="trainers-col">{cell_data}</td>')
-            else:
-                html.append(f"<td>{cell_data}</td>")
-        html.append("</tr>")
-    html.append("</tbody>")
-    html.append("</table>")
-    return "\n".join(html)
+    return page_render.table_html(headers, rows, row_keys)
 
 def localstorage_script(location):
     """
-    Returns a JavaScript snippet that makes the Trainers column editable and
-    persists changes using localStorage. The keys include the location name so that
-    different output files save data independently.
+    Returns the JavaScript snippet that makes the Trainers column editable and
+    keeps its notes in localStorage, all under one key per location, looked up
+    by each cell's row key (see trainer_annotations).
     """
-    return f"""<script>
-document.addEventListener('DOMContentLoaded', function() {{
-  const trainerCells = document.querySelectorAll('td.trainers-col');
-  trainerCells.forEach((cell, i) => {{
-    const key = 'trainers_cell_{location}_' + i;
-    const saved = localStorage.getItem(key);
-    if (saved) cell.textContent = saved;
-    cell.addEventListener('blur', () => {{
-      localStorage.setItem(key, cell.textContent);
-    }});
-  }});
-}});
-</script>"""
+    return trainer_annotations.localstorage_script(location)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,11 +1,17 @@
 import os
-from bs4 import BeautifulSoup
-try:
-    import chardet
-except ImportError:
-    chardet = None
+import sys
 
-import posixpath  # Used to correctly join URL paths
+import asset_store
+import build_cache
+import encoding_detect
+import html_backends
+import html_fixups
+import instrumentation
+import output_optimizer
+import page_render
+import pokemon_store
+import row_pipeline
+import trainer_annotations
 
 # ============================================================
 # EDITABLE VARIABLES:
@@ -13,10 +19,21 @@ import posixpath  # Used to correctly join URL paths
 # ============================================================
 HTML_INPUT_FILE = '/Users/nicholaschang/Helpful Scripts/conquest parse/swarms.shtml'
 OUTPUT_FILE = "/Users/nicholaschang/Helpful Scripts/conquest parse/swarm_pokemon.html"
+STORE_FILE = "/Users/nicholaschang/Helpful Scripts/conquest parse/conquest_pokemon.sqlite"
 BASE_URL = "https://www.serebii.net"
 HTML_BASE_PATH = "/conquest"  # This should match the directory path of the original HTML
+FORCE_REBUILD = False  # Set to True to ignore the build manifest and always re-parse.
+PARSER_VERSION = 1  # Bump when the generated HTML changes, to invalidate the build cache.
 
+TABLE_ATTRS = page_render.TABLE_ATTRS + ' align="center"'
+HEADER_ATTRS = {"Pic": " style='width:60px;'"}  # Fixed width for the "Pic" column.
+
+@instrumentation.instrumented("swarm", none_fails=True)
 def main():
+    """
+    Parses HTML_INPUT_FILE into the store and renders OUTPUT_FILE from it.
+    Returns OUTPUT_FILE (also when it was already up to date), or None on failure.
+    """
     if not os.path.isfile(HTML_INPUT_FILE):
         print(f"Could not find file: {HTML_INPUT_FILE}")
         return
@@ -24,45 +41,80 @@ def main():
     # Read file in binary mode for encoding detection.
     with open(HTML_INPUT_FILE, "rb") as f:
         raw_data = f.read()
+    instrumentation.lap("read")
 
-    if chardet:
-        detected = chardet.detect(raw_data)
-        encoding = detected.get("encoding", "utf-8")
-        print(f"Detected encoding: {encoding}")
-    else:
-        encoding = "utf-8"
-        print("Chardet not installed; using utf-8.")
+    # Skip the parse entirely if swarms.shtml, this script and its settings are
+    # unchanged since OUTPUT_FILE was last written.
+    manifest_path = build_cache.manifest_path_for(os.path.dirname(os.path.abspath(OUTPUT_FILE)))
+    input_digest = build_cache.bytes_digest(raw_data)
+    fingerprint = build_cache.fingerprint(
+        __file__, PARSER_VERSION,
+        {"BASE_URL": BASE_URL, "HTML_BASE_PATH": HTML_BASE_PATH, "OUTPUT_FILE": os.path.basename(OUTPUT_FILE),
+         "parser": html_backends.current_backend(), "atlas": asset_store.fingerprint(),
+         "optimize": output_optimizer.fingerprint()},
+        sys.modules[__name__],
+    )
+    if (not FORCE_REBUILD
+            and build_cache.lookup(manifest_path, HTML_INPUT_FILE, input_digest, fingerprint)
+            and pokemon_store.has_input(STORE_FILE, input_digest)):
+        instrumentation.lap("cache")
+        instrumentation.count("cache_hits")
+        if output_optimizer.enabled():
+            output_optimizer.write_shared_assets(os.path.dirname(os.path.abspath(OUTPUT_FILE)))
+        print(f"Unchanged: {os.path.basename(HTML_INPUT_FILE)}; keeping {OUTPUT_FILE}")
+        return OUTPUT_FILE
+    instrumentation.lap("cache")
+
+    encoding, method = encoding_detect.detect_encoding(
+        raw_data, input_digest, os.path.join(os.path.dirname(os.path.abspath(OUTPUT_FILE)), encoding_detect.CACHE_NAME)
+    )
+    print(f"Detected encoding: {encoding} ({encoding_detect.describe(method)})")
+    instrumentation.lap("encoding")
 
     text = raw_data.decode(encoding, errors="replace")
-    soup = BeautifulSoup(text, "html.parser")
+    soup = html_backends.make_soup(text)
+    instrumentation.lap("parse")
 
     # Look for the swarm table (assumed to be the first table with class "tab")
     table = soup.find("table", class_="tab")
     if not table:
         print("Could not find table with class 'tab'.")
         return
+    instrumentation.lap("areas")
 
     headers, rows = extract_swarm_table_data(table)
-    table_html = build_table_html(headers, rows)
-
-    final_html = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <title>Swarm Pokemon</title>
-</head>
-<body>
-  <h1>Swarm Pokemon</h1>
-  {table_html}
-  {localstorage_script("swarm")}
-</body>
-</html>
-"""
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as out:
-        out.write(final_html)
+    instrumentation.lap("extract")
+    instrumentation.count("rows", len(rows))
+
+    # Save the typed rows, then render the table from what is in the store.
+    conn = pokemon_store.connect(STORE_FILE)
+    try:
+        pokemon_store.save_page(conn, "swarm", "swarm", headers,
+                                [("swarm", pokemon_store.AREA_OK, rows)], input_digest)
+        headers, areas = pokemon_store.load_page(conn, "swarm", "swarm")
+    finally:
+        conn.close()
+    instrumentation.lap("store")
+    rows = areas[0][2]
+
+    # The page is written as it is rendered, one table row at a time.
+    output_digest = page_render.PAGE.write_file(
+        OUTPUT_FILE,
+        title="Swarm Pokemon",
+        head=asset_store.stylesheet_link(OUTPUT_FILE),
+        heading="Swarm Pokemon",
+        body=page_render.iter_table_html(headers, rows, pokemon_store.annotation_keys("swarm", headers, rows),
+                                         TABLE_ATTRS, HEADER_ATTRS),
+        script=localstorage_script("swarm"),
+    )
+    instrumentation.lap("render")
+    build_cache.record(manifest_path, HTML_INPUT_FILE, input_digest, PARSER_VERSION, fingerprint,
+                       OUTPUT_FILE, output_digest)
+    instrumentation.lap("write")
     print(f"Done! Output saved to {OUTPUT_FILE}")
+    return OUTPUT_FILE
 
-def extract_swarm_table_data(table):
+def extract_swarm_table_data(table, columns=None):
     """
     Extracts rows from the provided swarm table.
     The original table is expected to have 12 columns:
@@ -80,125 +132,76 @@ def extract_swarm_table_data(table):
       11: Nation (may include images and links)
     New column order becomes:
       No., Pic, Name, Type, Hp, Attack, Defence, Speed, Movement Range, Abilities, Nation, Trainers
+    With columns (names from SWARM_COLUMNS or FIELD_COLUMNS), only those are
+    extracted, in that order.
     """
-    new_headers = ["No.", "Pic", "Name", "Type", "Hp", "Attack", "Defence", "Speed", "Movement Range", "Abilities", "Nation", "Trainers"]
-    data_rows = []
-    all_rows = table.find_all("tr", recursive=False)
-    # Skip the header row (assumed first row)
-    for tr in all_rows[1:]:
-        cells = [child for child in tr.children if getattr(child, "name", None) == "td"]
-        if len(cells) < 12:
-            continue
-        # Use indices: 0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11 (skip column 9: "Moves")
-        indices_to_use = [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 11]
-        new_row = []
-        for idx in indices_to_use:
-            cell = cells[idx]
-            # For "Pic" (index 1) and "Type" (index 3), fix images.
-            if idx == 1:  # Pic column: also resize images
-                value = fix_images(cell, base_path=HTML_BASE_PATH, max_width=50)
-            elif idx == 3:  # Type column: no resizing applied here
-                value = fix_images(cell, base_path=HTML_BASE_PATH)
-            # For "Name" (index 2), extract plain text.
-            elif idx == 2:
-                value = cell.get_text(strip=True)
-            # For "Abilities" (index 10), get text with a <br> separator.
-            elif idx == 10:
-                value = cell.get_text(separator="<br>", strip=True)
-            # For "Nation" (index 11), fix images and remove any links.
-            elif idx == 11:
-                value = remove_links(fix_images(cell, base_path=HTML_BASE_PATH))
-            else:
-                value = cell.get_text(strip=True)
-            new_row.append(value)
-        # Append an empty cell for the Trainers column.
-        new_row.append("")
-        data_rows.append(new_row)
-    return new_headers, data_rows
-
-def fix_images(cell_tag, base_path="/conquest", max_width=None):
+    headers = list(columns or SWARM_HEADERS)
+    return headers, list(iter_swarm_table_rows(table, headers))
+
+def iter_swarm_table_rows(table, columns=None, strict=True):
+    """
+    Lazily yields the rows of extract_swarm_table_data, computing only the
+    named columns (default: SWARM_HEADERS). See row_pipeline.select for strict.
+    """
+    selected = row_pipeline.select(SWARM_COLUMNS + FIELD_COLUMNS, columns or SWARM_HEADERS, strict)
+    return row_pipeline.iter_rows(table, selected, MIN_CELLS)
+
+def fix_images(cell_tag, base_path="/conquest", max_width=None, strip_links=False):
     """
-    Converts the inner HTML of the cell using BeautifulSoup and
-    prepends BASE_URL and base_path to any <img> tag's src that is not absolute.
-    Also handles sources starting with a dot.
+    Returns the inner HTML of the cell with BASE_URL and base_path prepended to
+    any <img> tag's src that is not absolute (sources starting with a dot too).
     If max_width is provided, adds an inline style to limit the image's width.
+    If strip_links is set, all <a> tags are removed while keeping their content.
     """
-    temp_soup = BeautifulSoup(cell_tag.decode_contents(), "html.parser")
-    for img in temp_soup.find_all("img"):
-        src = img.get("src", "").strip()
-        # Remove leading dot if present.
-        if src.startswith("."):
-            src = src.lstrip(".")
-        # If src is not absolute...
-        if not src.startswith("http"):
-            if not src.startswith("/"):
-                src = posixpath.join(base_path, src)
-                if not src.startswith("/"):
-                    src = "/" + src
-            img["src"] = BASE_URL + src
-        # If max_width is provided, add an inline style.
-        if max_width:
-            current_style = img.get("style", "")
-            new_style = (current_style + " " if current_style else "") + f"max-width:{max_width}px; height:auto;"
-            img["style"] = new_style
-    return str(temp_soup)
-
-def remove_links(html):
+    return html_fixups.rewrite_cell_html(cell_tag, BASE_URL, html_fixups.SRC_PAGE_RELATIVE,
+                                         base_path=base_path, max_width=max_width, strip_links=strip_links)
+
+def abilities_html(cell_tag):
     """
-    Removes all <a> tags from the provided HTML while preserving their inner content.
+    Returns the cell's text (delinked), one ability per line, separated with <br>.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    for a in soup.find_all("a"):
-        a.unwrap()
-    return str(soup)
+    return cell_tag.get_text(separator="<br>", strip=True)
+
+# Source cells of the swarm table's columns (column 9, Moves, is dropped, and
+# Trainers starts out empty), and of the typed fields for data-only consumers.
+MIN_CELLS = 12
+SWARM_HEADERS = ["No.", "Pic", "Name", "Type", "Hp", "Attack", "Defence", "Speed", "Movement Range", "Abilities", "Nation", "Trainers"]
+SWARM_COLUMNS = [
+    row_pipeline.Column("No.", 0, row_pipeline.text),
+    row_pipeline.Column("Pic", 1, lambda cell: fix_images(cell, base_path=HTML_BASE_PATH, max_width=50)),
+    row_pipeline.Column("Name", 2, row_pipeline.text),
+    row_pipeline.Column("Type", 3, lambda cell: fix_images(cell, base_path=HTML_BASE_PATH)),
+    row_pipeline.Column("Hp", 4, row_pipeline.text),
+    row_pipeline.Column("Attack", 5, row_pipeline.text),
+    row_pipeline.Column("Defence", 6, row_pipeline.text),
+    row_pipeline.Column("Speed", 7, row_pipeline.text),
+    row_pipeline.Column("Movement Range", 8, row_pipeline.text),
+    row_pipeline.Column("Abilities", 10, abilities_html),
+    row_pipeline.Column("Nation", 11, lambda cell: fix_images(cell, base_path=HTML_BASE_PATH, strip_links=True)),
+    row_pipeline.Column("Trainers", None, row_pipeline.blank),
+]
+FIELD_COLUMNS = row_pipeline.field_columns({
+    "dex_no": 0, "name": 2, "types": 3, "hp": 4, "attack": 5, "defence": 6, "speed": 7, "movement": 8,
+    "abilities": 10, "nation": 11,
+})
 
-def build_table_html(headers, rows):
+def build_table_html(headers, rows, row_keys=None):
     """
     Constructs an HTML table from the given headers and rows.
     The final column ("Trainers") is set to be contenteditable.
     Also, sets a fixed width for the "Pic" column.
+    With row_keys (see pokemon_store.annotation_keys), each Trainers cell
+    carries its row's key so saved notes follow the row, not its position.
     """
-    html = []
-    html.append('<table border="1" cellpadding="5" cellspacing="0" style="border-collapse:collapse;" align="center">')
-    html.append("<thead><tr>")
-    for head in headers:
-        if head == "Pic":
-            html.append(f"<th style='width:60px;'>{head}</th>")
-        else:
-            html.append(f"<th>{head}</th>")
-    html.append("</tr></thead>")
-    html.append("<tbody>")
-    for row in rows:
-        html.append("<tr>")
-        for col_index, cell in enumerate(row):
-            if col_index == len(row) - 1:
-                html.append(f'<td contenteditable="true" class="trainers-col">{cell}</td>')
-            else:
-                html.append(f"<td>{cell}</td>")
-        html.append("</tr>")
-    html.append("</tbody>")
-    html.append("</table>")
-    return "\n".join(html)
+    return page_render.table_html(headers, rows, row_keys, TABLE_ATTRS, HEADER_ATTRS)
 
 def localstorage_script(identifier):
     """
-    Returns a JavaScript snippet that makes the Trainers column editable and
-    persists changes using localStorage. The keys include the given identifier so that
-    different output files save data independently.
+    Returns the JavaScript snippet that makes the Trainers column editable and
+    keeps its notes in localStorage, all under one key per identifier, looked up
+    by each cell's row key (see trainer_annotations).
     """
-    return f"""<script>
-document.addEventListener('DOMContentLoaded', function() {{
-  const trainerCells = document.querySelectorAll('td.trainers-col');
-  trainerCells.forEach((cell, i) => {{
-    const key = 'trainers_cell_{identifier}_' + i;
-    const saved = localStorage.getItem(key);
-    if (saved) cell.textContent = saved;
-    cell.addEventListener('blur', () => {{
-      localStorage.setItem(key, cell.textContent);
-    }});
-  }});
-}});
-</script>"""
+    return trainer_annotations.localstorage_script(identifier)
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,13 @@
 import os
-from bs4 import BeautifulSoup
 
-try:
-    import chardet
-except ImportError:
-    chardet = None
+import asset_store
+import encoding_detect
+import html_backends
+import html_fixups
+import page_render
+import pokemon_store
+import trainer_annotations
+from area_lookup import build_area_index, find_area_table
 
 # Set this to the file you want to process.
 HTML_INPUT_FILE = "/Users/nicholaschang/Helpful Scripts/conquest parse/shtml's of location/illusio.shtml"
@@ -19,17 +22,12 @@ def main():
     with open(HTML_INPUT_FILE, "rb") as f:
         raw_data = f.read()
 
-    if chardet:
-        detected = chardet.detect(raw_data)
-        encoding = detected.get("encoding", "utf-8")
-        print(f"Detected encoding: {encoding}")
-    else:
-        encoding = "utf-8"
-        print("Chardet not installed; using utf-8 with replacement.")
+    encoding, method = encoding_detect.detect_encoding(raw_data)
+    print(f"Detected encoding: {encoding} ({encoding_detect.describe(method)})")
 
     # Decode using the detected encoding.
     text = raw_data.decode(encoding, errors="replace")
-    soup = BeautifulSoup(text, "html.parser")
+    soup = html_backends.make_soup(text)
 
     # Extract location name from the title.
     title_text = soup.title.get_text() if soup.title else "Unknown Location"
@@ -48,27 +46,18 @@ def main():
         print("No area names found.")
         return
 
-    sections = []
-    for area in area_names:
-        section_html = parse_area_section(soup, area)
-        if section_html:
-            sections.append(section_html)
-
-    final_html = f"""<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <title>{location.title()} Areas</title>
-</head>
-<body>
-  <h1>{location.title()}</h1>
-  {''.join(sections)}
-  {localstorage_script(location)}
-</body>
-</html>
-"""
-    with open(output_file, "w", encoding="utf-8") as out:
-        out.write(final_html)
+    # Index every area anchor once so each area lookup below is a dict hit.
+    area_index = build_area_index(soup)
+    # The page is written as it is rendered, one area at a time.
+    sections = (parse_area_section(soup, area, area_index) for area in area_names)
+    page_render.PAGE.write_file(
+        output_file,
+        title=f"{location.title()} Areas",
+        head=asset_store.stylesheet_link(output_file),
+        heading=location.title(),
+        body=sections,
+        script=localstorage_script(location),
+    )
     print(f"Done! See '{output_file}' for the final output.")
 
 def get_area_names_from_anchors(soup):
@@ -102,35 +91,24 @@ def get_area_names_from_anctab(soup):
             area_names.append(text)
     return area_names
 
-def parse_area_section(soup, area_name):
+def parse_area_section(soup, area_name, area_index=None):
     """
     Search for a <p> tag that is likely the anchor for the given area.
     First, look for a <p> that has an <a> tag with a name attribute exactly matching area_name.
     If not found, fall back to any <p> whose text contains (or is contained by) area_name.
     Then, take the next table with class "dextable" and process it.
+    Pass an index from build_area_index when looking up several areas in the same soup.
     Returns an HTML snippet with an H3 heading and the processed table.
     """
-    area_p = None
-    # Try to find a <p> with an <a name="..."> that equals area_name.
-    for p_tag in soup.find_all("p"):
-        a_tag = p_tag.find("a", attrs={"name": True})
-        if a_tag and a_tag.get("name", "").lower() == area_name:
-            area_p = p_tag
-            break
-    # If not found, try a fuzzy match.
-    if not area_p:
-        for p_tag in soup.find_all("p"):
-            p_text = p_tag.get_text(strip=True).lower()
-            if area_name in p_text or p_text in area_name:
-                area_p = p_tag
-                break
+    if area_index is None:
+        area_index = build_area_index(soup)
+    area_p, area_table = find_area_table(area_index, area_name)
     if not area_p:
         return f"<p style='color:red;'>Could not find area: {area_name}</p>"
-    area_table = area_p.find_next("table", class_="dextable")
     if not area_table:
         return f"<p style='color:red;'>No dextable found for {area_name}</p>"
     headers, rows = extract_table_data(area_table)
-    table_html = build_table_html(headers, rows)
+    table_html = build_table_html(headers, rows, pokemon_store.annotation_keys(area_name, headers, rows))
     section_html = (
         f"<h3 style='margin-bottom: 5px;'>{area_name.title()}</h3>\n"
         f"{table_html}\n"
@@ -192,62 +170,28 @@ def extract_table_data(table):
 
 def fix_images(cell_tag):
     """
-    Converts the inner HTML of the cell using BeautifulSoup and
-    prepends BASE_URL to any <img> tag's src that is not already absolute.
+    Returns the inner HTML of the cell with BASE_URL prepended to any
+    <img> tag's src that is not already absolute.
     If the src does not start with "http", a leading "/" is added if missing.
     """
-    temp_soup = BeautifulSoup(cell_tag.decode_contents(), "html.parser")
-    for img in temp_soup.find_all("img"):
-        src = img.get("src", "")
-        if not src.startswith("http"):
-            if not src.startswith("/"):
-                src = "/" + src
-            img["src"] = BASE_URL + src
-    return temp_soup.decode()
-
-def build_table_html(headers, rows):
+    return html_fixups.rewrite_cell_html(cell_tag, BASE_URL, html_fixups.SRC_RELATIVE)
+
+def build_table_html(headers, rows, row_keys=None):
     """
     Builds an HTML table with the provided headers and rows.
     The final column (Trainers) is set to be contenteditable.
+    With row_keys (see pokemon_store.annotation_keys), each Trainers cell
+    carries its row's key so saved notes follow the row, not its position.
     """
-    html = []
-    html.append('<table border="1" cellpadding="5" cellspacing="0" style="border-collapse:collapse;">')
-    html.append("<thead><tr>")
-    for head in headers:
-        html.append(f"<th>{head}</th>")
-    html.append("</tr></thead>")
-    html.append("<tbody>")
-    for row in rows:
-        html.append("<tr>")
-        for col_index, cell_data in enumerate(row):
-            if col_index == len(row) - 1:
-                html.append(f'<td contenteditable="true" class="trainers-col">{cell_data}</td>')
-            else:
-                html.append(f"<td>{cell_data}</td>")
-        html.append("</tr>")
-    html.append("</tbody>")
-    html.append("</table>")
-    return "\n".join(html)
+    return page_render.table_html(headers, rows, row_keys)
 
 def localstorage_script(location):
     """
-    Returns a JavaScript snippet that makes the Trainers column editable and
-    persists changes using localStorage. The keys include the location name so that
-    different output files save data independently.
+    Returns the JavaScript snippet that makes the Trainers column editable and
+    keeps its notes in localStorage, all under one key per location, looked up
+    by each cell's row key (see trainer_annotations).
     """
-    return f"""<script>
-document.addEventListener('DOMContentLoaded', function() {{
-  const trainerCells = document.querySelectorAll('td.trainers-col');
-  trainerCells.forEach((cell, i) => {{
-    const key = 'trainers_cell_{location}_' + i;
-    const saved = localStorage.getItem(key);
-    if (saved) cell.textContent = saved;
-    cell.addEventListener('blur', () => {{
-      localStorage.setItem(key, cell.textContent);
-    }});
-  }});
-}});
-</script>"""
+    return trainer_annotations.localstorage_script(location)
 
 if __name__ == "__main__":
     main()